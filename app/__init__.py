@@ -5,7 +5,11 @@ from flask_toastr import Toastr
 
 from app.utils.database import db
 from app.utils.enums import LibraryItemTypes
+from app.utils.indexes import ensure_indexes
+from app.utils.pagination import page_url, url_with_args
+from app.utils.profiler import init_profiler
 from app.utils.init_roles import (
+    init_notification_sequence,
     init_sequence_collection,
     init_staff_sequence_collection,
     init_user_roles,
@@ -22,6 +26,12 @@ def create_app():
 
     # Initialize extensions
     db.init_app(app)  # Initialize the database connection
+    if app.config["DB_PROFILER_ENABLED"]:
+        init_profiler(app)
+    if app.config["METRICS_ENABLED"]:
+        from app.utils.metrics import init_metrics
+
+        init_metrics(app)
     login_manager.init_app(app)
     bcrypt.init_app(app)
     toastr.init_app(app)
@@ -40,9 +50,59 @@ def create_app():
     def inject_enums():
         return dict(LibraryItemTypes=LibraryItemTypes)
 
+    app.add_template_global(page_url)
+    app.add_template_global(url_with_args)
+
     with app.app_context():  # Ensure proper app context for database operations
         init_user_roles(db)
         init_sequence_collection(db)
         init_staff_sequence_collection(db)
+        init_notification_sequence(db)
+        if app.config["ENSURE_INDEXES_ON_STARTUP"]:
+            ensure_indexes(db)
+
+        from app.services.availability_services import init_item_branch_availability
+        from app.services.notification_services import init_unread_counts
+        from app.services.transfer_services import init_transfer_routes
+
+        init_item_branch_availability()
+        init_transfer_routes()
+        init_unread_counts()
+
+    from app.cli import register_commands
+
+    register_commands(app)
+
+    # Background jobs, run in-process here or by worker.py
+    from app.services.fee_services import run_fee_engine
+    from app.services.notification_services import deliver_notifications
+    from app.services.reconciliation_services import run_counter_reconciliation
+    from app.services.reservation_services import expire_reservation_holds
+    from app.services.transfer_services import complete_overdue_transfers
+    from app.utils.scheduler import register_job, start_scheduler
+
+    register_job("fee_engine", run_fee_engine, app.config["FEE_ENGINE_INTERVAL"])
+    register_job(
+        "counter_reconciliation",
+        run_counter_reconciliation,
+        app.config["RECONCILE_INTERVAL"],
+    )
+    register_job(
+        "transfer_completion",
+        complete_overdue_transfers,
+        app.config["TRANSFER_COMPLETION_INTERVAL"],
+    )
+    register_job(
+        "reservation_holds",
+        expire_reservation_holds,
+        app.config["RESERVATION_EXPIRY_INTERVAL"],
+    )
+    register_job(
+        "notification_delivery",
+        deliver_notifications,
+        app.config["NOTIFICATION_INTERVAL"],
+    )
+    if app.config["SCHEDULER_ENABLED"]:
+        start_scheduler(app)
 
     return app
@@ -0,0 +1,98 @@
+import click
+
+from app.services.availability_services import rebuild_item_branch_availability
+from app.services.item_projections import list_payload_report
+from app.services.notification_services import rebuild_unread_counts
+from app.services.reconciliation_services import reconcile_item_counters
+from app.services.transfer_services import rebuild_transfer_routes
+from app.utils.database import db
+from app.utils.indexes import check_indexes, ensure_indexes, missing_indexes
+
+
+def register_commands(app):
+    """Maintenance commands, run with `flask --app run <command>`."""
+
+    @app.cli.command("ensure-indexes")
+    def ensure_indexes_command():
+        """Create every index in the index registry."""
+        failed = False
+        for collection_name, result in ensure_indexes(db).items():
+            print(f"{collection_name}: {', '.join(result['created']) or '-'}")
+            for name, error in result["errors"].items():
+                print(f"  [MISSING] {name}: {error}")
+                failed = True
+        if failed:
+            raise SystemExit(1)
+
+    @app.cli.command("rebuild-availability")
+    def rebuild_availability_command():
+        """Recount the per-branch availability summary from the copies."""
+        rows = rebuild_item_branch_availability()
+        print(f"item_branch_availability: {rows} rows")
+
+    @app.cli.command("rebuild-transfer-routes")
+    def rebuild_transfer_routes_command():
+        """Recount the pending/in-transit backlog per transfer route."""
+        rows = rebuild_transfer_routes()
+        print(f"transfer_routes: {rows} rows")
+
+    @app.cli.command("rebuild-unread-counts")
+    def rebuild_unread_counts_command():
+        """Recount every member's unread notifications."""
+        members = rebuild_unread_counts()
+        print(f"members with unread notifications: {members}")
+
+    @app.cli.command("reconcile-counters")
+    @click.option("--fix", is_flag=True, help="Overwrite drifted counters.")
+    @click.option("--start-after", default=None, help="Only items with a larger _id.")
+    @click.option("--end-before", default=None, help="Only items with a smaller _id.")
+    @click.option("--batch-size", type=int, default=None)
+    def reconcile_counters_command(fix, start_after, end_before, batch_size):
+        """Recount total/available copies per item and report (or fix) drift."""
+        report = reconcile_item_counters(
+            fix=fix,
+            start_after=start_after,
+            end_before=end_before,
+            batch_size=batch_size,
+        )
+        for drift in report["drift"]:
+            print(
+                f"{drift['item_id']} {drift['id']}: stored {drift['stored']} "
+                f"actual {drift['actual']}"
+            )
+        print(
+            f"checked {report['checked']}, drifted {report['drifted']}, "
+            f"fixed {report['fixed']}, last _id {report['last_id']}"
+        )
+
+    @app.cli.command("payload-report")
+    @click.option("--sample-size", type=int, default=1000)
+    def payload_report_command(sample_size):
+        """Average item size per list view against the whole document."""
+        report = list_payload_report(sample_size)
+        page_size = app.config["PAGE_SIZE"]
+        print(
+            f"sampled {report['items']} items, full document {report.get('full', 0)} B"
+        )
+        for view, size in report["views"].items():
+            print(
+                f"{view:>9}: {size['bytes']} B per item, "
+                f"{size['bytes'] * page_size / 1024:.1f} KiB per page, "
+                f"{size['saved']:.0%} smaller"
+            )
+
+    @app.cli.command("check-indexes")
+    def check_indexes_command():
+        """List missing indexes, explain the query shapes, fail on either."""
+        missing = missing_indexes(db)
+        for collection_name, name in missing:
+            print(f"[MISSING] {collection_name}.{name}")
+        results = check_indexes(db)
+        for result in results:
+            flag = "COLLSCAN" if result["collscan"] else "ok"
+            print(
+                f"[{flag}] {result['collection']} {result['filter']} "
+                f"sort={result['sort']} -> {' > '.join(map(str, result['stages']))}"
+            )
+        if missing or any(result["collscan"] for result in results):
+            raise SystemExit(1)
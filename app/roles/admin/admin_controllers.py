@@ -19,7 +19,7 @@ from app.roles.member.member_services import (
     get_reserved_items,
     reserved_items,
 )
-from app.roles.staff.staff_services import transfer_items_list, update_transfer_status
+from app.roles.staff.staff_services import transfer_items_list
 from app.services.library_items_copy_services import (
     get_copy_item_by_rfid,
     library_item_copy_add,
@@ -27,8 +27,8 @@ from app.services.library_items_copy_services import (
     copies_getby_itemId,
     library_item_copy_update,
 )
+from app.services.fee_services import get_member_ledger, waive_fee
 from app.services.shared_services import (
-    calculate_fees_and_update,
     checkout,
     delete_copy,
     filter_checkout,
@@ -38,6 +38,7 @@ from app.services.shared_services import (
 )
 from app.utils.enums import LibraryItemAvailabilityType, MemberStatus, TransferStatus
 from app.utils.auth import User
+from app.utils.pagination import page_args
 from app.utils.database import db
 from .admin_services import (
     branch_add,
@@ -52,6 +53,7 @@ from .admin_services import (
     staff_add_service,
     staff_get,
     staff_get_all_service,
+    staff_get_page,
     staff_set_inactive,
     staff_update,
 )
@@ -76,8 +78,6 @@ def admin_home():
 
 @admin_bp.route("/login/", methods=["GET", "POST"])
 def login():
-
-    calculate_fees_and_update()
     # Handle POST
     if request.method == "POST":
         username = request.form["username"]
@@ -106,8 +106,6 @@ def dashboard():
     if current_user.role != "admin":
         return redirect(url_for("admin.login"))
 
-    calculate_fees_and_update()
-    update_transfer_status()
     return render_template("dashboard.html")
 
 
@@ -117,8 +115,16 @@ def staffs_view():
     if current_user.role != "admin":
         return redirect(url_for("admin.login"))
 
-    staffs = staff_get_all_service()
-    return render_template("staffs.html", staffs=staffs)
+    staffs = None
+    response = staff_get_page(**page_args())
+    if response["status"] == "fail":
+        flash(("error", response["message"]))
+    else:
+        staffs = response["data"]
+
+    return render_template(
+        "staffs.html", staffs=staffs, next_cursor=response.get("next_cursor")
+    )
 
 
 @admin_bp.route("/staffs/add/", methods=["GET", "POST"])
@@ -264,14 +270,16 @@ def library_items(type):
         return redirect(url_for("admin.login"))
 
     items = None
-    response = get_all_library_items(type)
+    response = get_all_library_items(type, **page_args())
     if response["status"] == "fail":
         flash(("error", response["message"]))
     else:
         items = response["data"]
 
     template = f"{type}s/{type}s.html"
-    return render_template(template, items=items, type=type)
+    return render_template(
+        template, items=items, type=type, next_cursor=response.get("next_cursor")
+    )
 
 
 # Delete Library items by item type
@@ -549,7 +557,7 @@ def member_getall_by_status(status):
         return redirect(url_for("admin.login"))
 
     members = None
-    response = members_get_all_by_status(status)
+    response = members_get_all_by_status(status, **page_args())
     if response["status"] == "fail":
         flash(("error", response["message"]))
     else:
@@ -561,7 +569,11 @@ def member_getall_by_status(status):
     else:
         title = f"{MemberStatus(status).name.capitalize()} Members"
     return render_template(
-        "members/members.html", members=members, title=title, status=status
+        "members/members.html",
+        members=members,
+        title=title,
+        status=status,
+        next_cursor=response.get("next_cursor"),
     )
 
 
@@ -593,7 +605,40 @@ def member_view_details(member_id, status):
         flash(("error", response["message"]))
         return redirect(url_for("admin.member_getall_by_status", status=status))
     member = response["data"]
-    return render_template("members/members_details.html", member=member)
+
+    ledger = None
+    ledger_resp = get_member_ledger(member["_id"])
+    if ledger_resp["status"] == "fail":
+        flash(("error", ledger_resp["message"]))
+    else:
+        ledger = ledger_resp["data"]
+
+    return render_template(
+        "members/members_details.html", member=member, ledger=ledger, status=status
+    )
+
+
+# waive part or all of a member's due amount
+@admin_bp.route("members/<member_id>/<status>/waive-fee/", methods=["POST"])
+@login_required
+def member_waive_fee(member_id, status):
+    if current_user.role != "admin":
+        return redirect(url_for("admin.login"))
+
+    data = request.form
+    response = waive_fee(
+        data.get("member_oid"),
+        data.get("amount") or 0,
+        note=data.get("note"),
+        waived_by=current_user.id,
+    )
+    if response["status"] == "success":
+        flash(("success", response["message"]))
+    else:
+        flash(("error", response["message"]))
+    return redirect(
+        url_for("admin.member_view_details", member_id=member_id, status=status)
+    )
 
 
 # select the branch to checkout items
@@ -603,8 +648,6 @@ def select_branch_checkout():
     if current_user.role != "admin":
         return redirect(url_for("admin.login"))
 
-    calculate_fees_and_update()
-
     session.pop("checkout_branch_id", None)
     session.pop("checkout_branch", None)
 
@@ -678,6 +721,11 @@ def checkout_items():
     else:
         flash(("success", response["message"]))
 
+    # show exactly which scans were rejected
+    for result in response.get("data", []):
+        if result["status"] == "fail":
+            flash(("error", f"{result['rfid']} : {result['message']}"))
+
     return redirect(url_for("admin.filter_checkout_items", m=member_id))
 
 
@@ -688,8 +736,6 @@ def filter_by_rfid():
     if current_user.role != "admin":
         return redirect(url_for("admin.login"))
 
-    calculate_fees_and_update()
-
     rfid = request.args.get("rfid", "")
     data = {}
     if rfid:
@@ -714,7 +760,6 @@ def return_items(copy_id, member_id):
     if response["status"] == "fail":
         flash(("error", response["message"]))
     else:
-        calculate_fees_and_update()
         flash(("success", response["message"]))
 
     return redirect(url_for("admin.filter_checkout_items", m=member_id))
@@ -745,8 +790,6 @@ def items_to_transfer():
     if current_user.role != "admin":
         return redirect(url_for("admin.login"))
 
-    update_transfer_status()
-
     items = None
     status = None
 
@@ -764,14 +807,19 @@ def items_to_transfer():
     else:
         status = TransferStatus.PENDING.value
 
-    response = transfer_items_list(status=status)
+    response = transfer_items_list(status=status, **page_args())
     if response["status"] == "fail":
         flash(("error", response["message"]))
     else:
         items = response["data"]
 
     template_name = "transfer_items.html"
-    return render_template(template_name, items=items, page=page)
+    return render_template(
+        template_name,
+        items=items,
+        page=page,
+        next_cursor=response.get("next_cursor"),
+    )
 
 
 # view items to transfer to other branch
@@ -781,6 +829,16 @@ def transactions():
     if current_user.role != "admin":
         return redirect(url_for("admin.login"))
 
-    transactions = get_all_transactions()
+    transactions = None
+    response = get_all_transactions(**page_args())
+    if response["status"] == "fail":
+        flash(("error", response["message"]))
+    else:
+        transactions = response["data"]
+
     template_name = "transactions.html"
-    return render_template(template_name, transactions=transactions)
+    return render_template(
+        template_name,
+        transactions=transactions,
+        next_cursor=response.get("next_cursor"),
+    )
@@ -3,6 +3,10 @@ from app.utils.database import db
 from pymongo import errors, ReturnDocument
 from werkzeug.security import generate_password_hash
 
+from app.services.availability_services import remove_availability
+from app.services.search_services import unindex_library_item
+from app.utils.branch_cache import branch_cache
+from app.utils.auth import invalidate_all_users, invalidate_user
 from app.utils.enums import ItemCopyStatus, MemberStatus
 from app.utils.collections import (
     branches_collection,
@@ -12,6 +16,7 @@ from app.utils.collections import (
     copies_collection,
 )
 from app.utils.init_roles import generate_staff_id
+from app.utils.pagination import find_page
 
 
 # add new staff
@@ -68,6 +73,18 @@ def staff_get_all_service():
         }
 
 
+# get one page of active staffs
+def staff_get_page(after=None, page_size=None):
+    try:
+        staffs, next_cursor = find_page(
+            staffs_collection, {"is_active": True}, after, page_size
+        )
+        return {"status": "success", "data": staffs, "next_cursor": next_cursor}
+    except Exception as e:
+        print(e)
+        return {"status": "fail", "message": "Error fetching staffs"}
+
+
 def staff_get(staff_id):
     try:
         staff = staffs_collection.find_one({"staff_id": staff_id, "is_active": True})
@@ -95,9 +112,11 @@ def staff_update(data, staff_id):
         # if data.get("password") != "":
         #     updated_staff["password"] = generate_password_hash(data.get("password"))
 
-        staffs_collection.find_one_and_update(
+        staff = staffs_collection.find_one_and_update(
             {"staff_id": staff_id}, {"$set": updated_staff}
         )
+        if staff:
+            invalidate_user(staff["_id"], "staff")
         return {"status": "success", "message": "Staff updated successfully"}
     except Exception as e:
         print(e)
@@ -106,9 +125,11 @@ def staff_update(data, staff_id):
 
 def staff_set_inactive(staff_id):
     try:
-        staffs_collection.find_one_and_update(
+        staff = staffs_collection.find_one_and_update(
             {"staff_id": staff_id}, {"$set": {"is_active": False}}
         )
+        if staff:
+            invalidate_user(staff["_id"], "staff")
         return {"status": "success", "message": "Staff deleted successfully"}
     except Exception as e:
         print(e)
@@ -141,6 +162,9 @@ def branch_add(data):
         staffs_collection.update_one(
             {"_id": staff_id}, {"$set": {"branch_id": ObjectId(branch_id)}}
         )
+        # staff branch assignments changed
+        invalidate_all_users()
+        branch_cache.invalidate()
 
         return {"status": "success", "message": "Branch added successfully!"}
     except errors.DuplicateKeyError:
@@ -191,6 +215,9 @@ def branch_update(data, branch_id):
         staffs_collection.update_one(
             {"_id": staff_id}, {"$set": {"branch_id": ObjectId(branch["_id"])}}
         )
+        # staff branch assignments and branch names changed
+        invalidate_all_users()
+        branch_cache.invalidate()
         return {"status": "success", "message": "Branch updated successfully"}
     except Exception as e:
         print(e)
@@ -200,22 +227,27 @@ def branch_update(data, branch_id):
 # get all branches
 def branch_get_all():
     try:
-        branches = branches_collection.aggregate(
-            [
-                {"$match": {"is_active": True}},
-                {
-                    "$lookup": {
-                        "from": staffs_collection.name,
-                        "localField": "staff_id",
-                        "foreignField": "_id",
-                        "as": "staff",
-                    }
-                },
-                # {"$unwind": "$staff"},
-                {"$sort": {"_id": -1}},
-            ]
+        branches = sorted(
+            branch_cache.active(), key=lambda branch: branch["_id"], reverse=True
         )
-        return list(branches)
+        staff = {
+            staff_member["_id"]: staff_member
+            for staff_member in staffs_collection.find(
+                {"_id": {"$in": [branch.get("staff_id") for branch in branches]}}
+            )
+        }
+        # copies, the cached documents are shared
+        return [
+            {
+                **branch,
+                "staff": (
+                    [staff[branch["staff_id"]]]
+                    if branch.get("staff_id") in staff
+                    else []
+                ),
+            }
+            for branch in branches
+        ]
     except Exception as e:
         print(e)
         return {"status": "fail", "message": f"Error fetching branches"}
@@ -241,6 +273,8 @@ def branch_set_inactive(branch_id):
         branches_collection.find_one_and_update(
             {"branch_id": branch_id}, {"$set": {"is_active": False}}
         )
+        invalidate_all_users()
+        branch_cache.invalidate()
         return {"status": "success", "message": "Staff deleted successfully"}
     except Exception as e:
         print(e)
@@ -248,10 +282,16 @@ def branch_set_inactive(branch_id):
 
 
 # get member pending for approval
-def members_get_all_by_status(status):
+def members_get_all_by_status(status, after=None, page_size=None):
     try:
-        members = members_collection.find({"status": status}).sort("created_at", -1)
-        return {"status": "success", "data": members}
+        members, next_cursor = find_page(
+            members_collection,
+            {"status": status},
+            after,
+            page_size,
+            sort_field="created_at",
+        )
+        return {"status": "success", "data": members, "next_cursor": next_cursor}
     except Exception as e:
         print(e)
         return {"status": "fail", "message": f"Error fetching members: {str(e)}"}
@@ -264,6 +304,7 @@ def members_update_by_status(data):
         members_collection.find_one_and_update(
             {"_id": member_id}, {"$set": {"status": status}}
         )
+        invalidate_user(member_id, "member")
         return {"status": "success", "message": f"Member {status} successfully"}
     except Exception as e:
         print(e)
@@ -305,6 +346,8 @@ def delete_library_item(item_id):
         {"_id": item_id},
         {"$set": {"is_active": False, "total_copies": 0, "available_copies": 0}},
     )
+    remove_availability(item_id=item_id)
+    unindex_library_item(item_id)
     return {
         "status": "success",
         "message": "This item deleted successfully",
@@ -379,6 +422,7 @@ def delete_branch_service(branch_id):
             {"original_branch_id": branch_id},
             {"$set": {"status": ItemCopyStatus.DELETED.value}},
         )
+        remove_availability(branch_id=branch_id)
 
         # delete branch
         branches_collection.update_one(
@@ -388,6 +432,8 @@ def delete_branch_service(branch_id):
                 "$unset": {"staff_id": None},
             },
         )
+        invalidate_all_users()
+        branch_cache.invalidate()
 
         return {
             "status": "success",
@@ -1,7 +1,7 @@
 from datetime import datetime
 from email.utils import format_datetime
 import os
-from flask import Blueprint, flash, render_template, redirect, request, url_for
+from flask import Blueprint, flash, jsonify, render_template, redirect, request, url_for
 from flask_login import login_required, current_user
 
 from app.roles.member.member_services import (
@@ -20,13 +20,15 @@ from app.roles.member.member_services import (
     reserve_library_item,
     reserved_items,
 )
-from app.roles.staff.staff_services import update_transfer_status
 from app.services.library_items_services import (
     get_all_library_items,
     library_item_details_with_copies_count_branchwise,
 )
-from app.services.shared_services import calculate_fees_and_update, get_all_transactions
+from app.services.fee_services import recalculate_member_fees
+from app.services.search_services import search_library_items, suggest_library_items
+from app.services.shared_services import get_all_transactions
 from app.utils.format_datetime import format_notification_datetime
+from app.utils.pagination import page_args
 
 member_bp = Blueprint("member", __name__, template_folder="templates")
 
@@ -130,8 +132,6 @@ def dashboard():
     if current_user.role != "member":
         return redirect(url_for("login"))
 
-    calculate_fees_and_update()
-    update_transfer_status()
     return render_template(template("dashboard"))
 
 
@@ -144,6 +144,52 @@ def library_items():
     return render_template(template("library_items"))
 
 
+# search the catalog with facets
+@member_bp.route("/library-items/search/")
+@login_required
+def library_item_search():
+    if current_user.role != "member":
+        return redirect(url_for("login"))
+
+    items, total, total_capped, facets = None, 0, False, None
+    response = search_library_items(
+        query=request.args.get("q"),
+        item_type=request.args.get("item_type"),
+        category=request.args.get("category"),
+        branch_id=request.args.get("branch_id"),
+        available=request.args.get("available") == "1",
+        page_size=request.args.get("page_size", type=int),
+    )
+    if response["status"] == "fail":
+        flash(("error", response["message"]))
+    else:
+        items = response["data"]
+        total = response["total"]
+        total_capped = response["total_capped"]
+        facets = response["facets"]
+
+    return render_template(
+        template("search"),
+        items=items,
+        total=total,
+        total_capped=total_capped,
+        facets=facets,
+    )
+
+
+# search-as-you-type suggestions
+@member_bp.route("/library-items/suggest/")
+@login_required
+def library_item_suggest():
+    if current_user.role != "member":
+        return jsonify([]), 403
+
+    response = suggest_library_items(
+        request.args.get("q", ""), request.args.get("item_type")
+    )
+    return jsonify(response.get("data", []))
+
+
 # filter and view items eg: list of books or dvds
 @member_bp.route("/library-items/<type>/")
 @login_required
@@ -152,14 +198,16 @@ def library_item_list(type):
         return redirect(url_for("login"))
 
     items = None
-    response = get_all_library_items(type)
+    response = get_all_library_items(type, view="member", **page_args())
     if response["status"] == "fail":
         flash(("error", response["message"]))
     else:
         items = response["data"]
 
     template_name = template(f"{type}/{type}_list")
-    return render_template(template_name, items=items)
+    return render_template(
+        template_name, items=items, next_cursor=response.get("next_cursor")
+    )
 
 
 # filter and view items eg: list of books or dvds
@@ -273,7 +321,7 @@ def member_renew_borrowed_item(item_id):
     if response["status"] == "fail":
         flash(("error", response["message"]))
     else:
-        calculate_fees_and_update()
+        recalculate_member_fees(member_id)
         flash(("success", response["message"]))
     return redirect(url_for("member.member_borrowed_items"))
 
@@ -286,9 +334,19 @@ def view_transactions():
         return redirect(url_for("member.login"))
 
     member_id = current_user.id
-    transactions = get_all_transactions(member_id=member_id)
+    transactions = None
+    response = get_all_transactions(member_id=member_id, **page_args())
+    if response["status"] == "fail":
+        flash(("error", response["message"]))
+    else:
+        transactions = response["data"]
+
     template_name = template("transactions")
-    return render_template(template_name, transactions=transactions)
+    return render_template(
+        template_name,
+        transactions=transactions,
+        next_cursor=response.get("next_cursor"),
+    )
 
 
 # view notification
@@ -300,7 +358,7 @@ def view_notifications():
 
     member_id = current_user.id
     notifications = None
-    response = get_notifications(member_id=member_id)
+    response = get_notifications(member_id=member_id, **page_args())
     if response["status"] == "fail":
         flash(("error", response["message"]))
     else:
@@ -308,7 +366,12 @@ def view_notifications():
 
     time = format_notification_datetime
     template_name = template("notifications")
-    return render_template(template_name, notifications=notifications, time=time)
+    return render_template(
+        template_name,
+        notifications=notifications,
+        time=time,
+        next_cursor=response.get("next_cursor"),
+    )
 
 
 # delete notification
@@ -318,7 +381,7 @@ def delete_notifications(id):
     if current_user.role != "member":
         return redirect(url_for("member.login"))
 
-    response = delete_notification(id)
+    response = delete_notification(current_user.id, id)
     if response["status"] == "fail":
         flash(("error", response["message"]))
     else:
@@ -2,18 +2,37 @@ from datetime import datetime, timedelta
 from bson import ObjectId
 from flask import redirect
 from flask_login import login_user
-from app.utils.auth import User
+from app.utils.auth import User, invalidate_user
 from app.utils.database import db
 from pymongo import errors, ReturnDocument
 from werkzeug.security import generate_password_hash, check_password_hash
 
-from app.utils.enums import BorrowedItemStatus, ItemCopyStatus, MemberStatus
+from app.services.item_projections import item_lookup
+from app.services.notification_services import (
+    delete_member_notification,
+    enqueue_notification,
+    mark_notifications_read,
+)
+from app.services.reservation_services import (
+    OPEN_STATUSES,
+    has_open_reservation,
+    queue_position,
+)
+from app.utils.branch_cache import branch_cache
+from app.utils.enums import (
+    BorrowedItemStatus,
+    ItemCopyStatus,
+    MemberStatus,
+    ReservationStatus,
+)
 from app.utils.init_roles import generate_member_id
+from app.utils.metrics import track_outcome
+from app.utils.pagination import find_page
+from app.utils.sequences import reservation_ids
 
 member_collection = db.get_collection("member")
 borrowed_collection = db.get_collection("borrowed_items")
 items_collection = db.get_collection("library_items")
-branches_collection = db.get_collection("branches")
 copies_collection = db.get_collection("copies")
 reservations_collection = db.get_collection("reservations")
 notifications_collection = db.get_collection("notifications")
@@ -130,6 +149,7 @@ def member_update(member_id, data):
         )
         fullname = f"{result['firstname']} {result['lastname']}"
         user = User(str(result["_id"]), fullname, result["role"])
+        invalidate_user(result["_id"], "member")
         login_user(user)  # Sets `current_user`
         return {
             "status": "success",
@@ -163,24 +183,8 @@ def get_member_with_borrowed_items(member_id, status=None):
                         "foreignField": "member_id",
                         "pipeline": [
                             {"$match": {"returned": False}},
-                            {
-                                "$lookup": {
-                                    "from": items_collection.name,
-                                    "localField": "item_id",
-                                    "foreignField": "_id",
-                                    "as": "item",
-                                }
-                            },
+                            item_lookup("item"),
                             {"$unwind": "$item"},
-                            {
-                                "$lookup": {
-                                    "from": branches_collection.name,
-                                    "localField": "branch_id",
-                                    "foreignField": "_id",
-                                    "as": "branch",
-                                }
-                            },
-                            {"$unwind": "$branch"},
                         ],
                         "as": "borrowed_items",
                     }
@@ -192,6 +196,7 @@ def get_member_with_borrowed_items(member_id, status=None):
         if not member:
             return {"status": "fail", "message": "Member not found"}
         member = member[0]
+        branch_cache.attach(member["borrowed_items"], "branch_id", "branch")
         return {"status": "success", "data": member}
     except Exception as e:
         print(e)
@@ -220,24 +225,8 @@ def get_member_with_borrowed_history(member_id, status=None):
                         "localField": "_id",
                         "foreignField": "member_id",
                         "pipeline": [
-                            {
-                                "$lookup": {
-                                    "from": items_collection.name,
-                                    "localField": "item_id",
-                                    "foreignField": "_id",
-                                    "as": "item",
-                                }
-                            },
+                            item_lookup("item"),
                             {"$unwind": "$item"},
-                            {
-                                "$lookup": {
-                                    "from": branches_collection.name,
-                                    "localField": "branch_id",
-                                    "foreignField": "_id",
-                                    "as": "branch",
-                                }
-                            },
-                            {"$unwind": "$branch"},
                         ],
                         "as": "borrowed_items",
                     }
@@ -250,6 +239,7 @@ def get_member_with_borrowed_history(member_id, status=None):
         if not member:
             return {"status": "fail", "message": "Member not found"}
         member = member[0]
+        branch_cache.attach(member["borrowed_items"], "branch_id", "branch")
         return {"status": "success", "data": member}
     except Exception as e:
         print(e)
@@ -279,14 +269,7 @@ def member_get_borrowed_items(member_id, returned=False):
         items = borrowed_collection.aggregate(
             [
                 {"$match": filter},
-                {
-                    "$lookup": {
-                        "from": items_collection.name,
-                        "localField": "item_id",
-                        "foreignField": "_id",
-                        "as": "item",
-                    }
-                },
+                item_lookup("item"),
                 {"$unwind": "$item"},
                 {
                     "$lookup": {
@@ -297,24 +280,17 @@ def member_get_borrowed_items(member_id, returned=False):
                     }
                 },
                 {"$unwind": "$copy"},
-                {
-                    "$lookup": {
-                        "from": branches_collection.name,
-                        "localField": "branch_id",
-                        "foreignField": "_id",
-                        "as": "branch",
-                    }
-                },
-                {"$unwind": "$branch"},
             ]
         )
-        return {"status": "success", "data": list(items)}
+        items = branch_cache.attach(list(items), "branch_id", "branch")
+        return {"status": "success", "data": items}
     except Exception as e:
         print(e)
         return {"status": "fail", "message": f"Error: {str(e)}"}
 
 
 # Renew borrowed item
+@track_outcome("renew")
 def renew_borrowed_item(member_id, borrowed_item_id):
     try:
         member_id = ObjectId(member_id)
@@ -335,14 +311,12 @@ def renew_borrowed_item(member_id, borrowed_item_id):
                 "message": "Renewal limit reached. You cannot renew this item further.",
             }
 
-        # check if other member reserved this item in this branch
-        reservation = reservations_collection.find_one(
-            {
-                "item_id": ObjectId(borrowed_item["item_id"]),
-                "branch_id": ObjectId(borrowed_item["branch_id"]),
-            }
-        )
-        if reservation:
+        # check if other member is waiting for this item in this branch
+        if has_open_reservation(
+            borrowed_item["item_id"],
+            borrowed_item["branch_id"],
+            exclude_member_id=member_id,
+        ):
             return {
                 "status": "fail",
                 "message": "Renewal Denied. This item has been reserved by other member.",
@@ -371,6 +345,7 @@ def renew_borrowed_item(member_id, borrowed_item_id):
         return {"status": "fail", "message": f"Error: {str(e)}"}
 
 
+@track_outcome("reserve")
 def reserve_library_item(member_id, item_id, branch_id):
     try:
         member_id = ObjectId(member_id)
@@ -418,6 +393,7 @@ def reserve_library_item(member_id, item_id, branch_id):
                 "member_id": member_id,
                 "item_id": item_id,
                 "branch_id": branch_id,
+                "status": {"$in": OPEN_STATUSES},
             }
         )
 
@@ -429,24 +405,20 @@ def reserve_library_item(member_id, item_id, branch_id):
 
         # Create a reservation
         reservation = {
+            "reservation_id": f"RSV{reservation_ids.next():04d}",
             "member_id": member_id,
             "item_id": item_id,
             "branch_id": branch_id,
             "reserved_date": datetime.now(),
-            "status": "active",
+            "status": ReservationStatus.ACTIVE.value,
         }
 
         reservations_collection.insert_one(reservation)
 
-        # Create a notification for the member
-        notification = {
-            "notification_id": f"NTF{notifications_collection.count_documents({}) + 1:04d}",
-            "member_id": reservation["member_id"],
-            "message": f"You have reserved the {library_item['item_type']} <em>'{library_item['title']}'</em>.",
-            "date": datetime.now(),
-            "status": "unread",
-        }
-        notifications_collection.insert_one(notification)
+        enqueue_notification(
+            member_id,
+            f"You have reserved the {library_item['item_type']} <em>'{library_item['title']}'</em>.",
+        )
 
         return {
             "status": "success",
@@ -481,27 +453,12 @@ def reserved_items(member_id=None, branch_id=None, item_id=None):
                     }
                 },
                 {"$unwind": "$member"},
-                {
-                    "$lookup": {
-                        "from": items_collection.name,
-                        "localField": "item_id",
-                        "foreignField": "_id",
-                        "as": "library_item",
-                    }
-                },
+                item_lookup("library_item"),
                 {"$unwind": "$library_item"},
-                {
-                    "$lookup": {
-                        "from": branches_collection.name,
-                        "localField": "branch_id",
-                        "foreignField": "_id",
-                        "as": "branch",
-                    }
-                },
-                {"$unwind": "$branch"},
             ]
         )
-        return {"status": "success", "data": list(items)}
+        items = branch_cache.attach(list(items), "branch_id", "branch")
+        return {"status": "success", "data": items}
     except Exception as e:
         print(e)
         return {"status": "fail", "message": f"Error: {str(e)}"}
@@ -509,7 +466,7 @@ def reserved_items(member_id=None, branch_id=None, item_id=None):
 
 def get_reserved_items(member_id=None, branch_id=None, item_id=None):
     try:
-        filter = {}
+        filter = {"status": {"$in": OPEN_STATUSES}}
         if member_id:
             filter["member_id"] = ObjectId(member_id)
         if branch_id:
@@ -523,14 +480,7 @@ def get_reserved_items(member_id=None, branch_id=None, item_id=None):
                 # Match reservations for the specific branch
                 {"$match": filter},
                 # Lookup library item details
-                {
-                    "$lookup": {
-                        "from": items_collection.name,
-                        "localField": "item_id",
-                        "foreignField": "_id",
-                        "as": "library_item",
-                    }
-                },
+                item_lookup("library_item"),
                 # Lookup member details
                 {
                     "$lookup": {
@@ -540,19 +490,9 @@ def get_reserved_items(member_id=None, branch_id=None, item_id=None):
                         "as": "member",
                     }
                 },
-                # Lookup branch details
-                {
-                    "$lookup": {
-                        "from": branches_collection.name,
-                        "localField": "branch_id",
-                        "foreignField": "_id",
-                        "as": "branch",
-                    }
-                },
                 # Unwind arrays to simplify data
                 {"$unwind": "$library_item"},
                 {"$unwind": "$member"},
-                {"$unwind": "$branch"},
                 # Check if the item is currently available in the branch
                 {
                     "$lookup": {
@@ -605,12 +545,14 @@ def get_reserved_items(member_id=None, branch_id=None, item_id=None):
                         "item_id": "$library_item.item_id",
                         "item_title": "$library_item.title",
                         "item_type": "$library_item.item_type",
-                        "branch_id": "$branch.branch_id",
-                        "branch_name": "$branch.name",
                         "rfid": "$available_copies.rfid",
                         "item_available": 1,
                         "reservation_id": 1,
                         "reserved_date": 1,
+                        "status": 1,
+                        "hold_expires": 1,
+                        "queue_item_id": "$item_id",
+                        "queue_branch_id": "$branch_id",
                     }
                 },
             ]
@@ -618,6 +560,20 @@ def get_reserved_items(member_id=None, branch_id=None, item_id=None):
 
         # Convert the aggregation result to a list
         results = list(reservations)
+        for reservation in results:
+            branch = branch_cache.get(reservation["queue_branch_id"]) or {}
+            reservation["branch_id"] = branch.get("branch_id")
+            reservation["branch_name"] = branch.get("name", "")
+        if member_id:
+            # a member sees where they are in each queue
+            for reservation in results:
+                reservation["queue_position"] = queue_position(
+                    {
+                        **reservation,
+                        "item_id": reservation["queue_item_id"],
+                        "branch_id": reservation["queue_branch_id"],
+                    }
+                )
         return {"status": "success", "data": results}
     except Exception as e:
         print(e)
@@ -625,23 +581,35 @@ def get_reserved_items(member_id=None, branch_id=None, item_id=None):
 
 
 # get notifications
-def get_notifications(member_id):
+def get_notifications(member_id, after=None, page_size=None):
     member_id = ObjectId(member_id)
     try:
-        result = notifications_collection.find({"member_id": member_id}).sort(
-            "date", -1
+        notifications, next_cursor = find_page(
+            notifications_collection,
+            {"member_id": member_id},
+            after,
+            page_size,
+            sort_field="date",
+        )
+        # the notifications on this page have been seen now
+        mark_notifications_read(
+            member_id,
+            [
+                notification["_id"]
+                for notification in notifications
+                if notification.get("status") == "unread"
+            ],
         )
-        return {"status": "success", "data": list(result)}
+        return {"status": "success", "data": notifications, "next_cursor": next_cursor}
     except Exception as e:
         print(e)
         return {"status": "fail", "message": f"Error: {str(e)}"}
 
 
 # delete notifications
-def delete_notification(id):
-    id = ObjectId(id)
+def delete_notification(member_id, id):
     try:
-        notifications_collection.delete_one({"_id": id})
+        delete_member_notification(member_id, id)
         return {"status": "success", "message": "Deleted Successfully"}
     except Exception as e:
         print(e)
@@ -1,6 +1,5 @@
 import json
 import uuid
-from bson import ObjectId
 from flask import Blueprint, flash, jsonify, render_template, redirect, request, url_for
 from flask_login import login_required, current_user, login_user
 from werkzeug.security import check_password_hash
@@ -12,11 +11,7 @@ from app.roles.member.member_services import (
     get_reserved_items,
     reserved_items,
 )
-from app.roles.staff.staff_services import (
-    initiate_transfer,
-    transfer_items_list,
-    update_transfer_status,
-)
+from app.roles.staff.staff_services import transfer_items_list
 from app.services.library_items_copy_services import (
     copies_getby_itemId,
     library_item_copy_add,
@@ -27,8 +22,15 @@ from app.services.library_items_services import (
     get_library_items_by_type,
     library_item_get,
 )
+from app.services.search_services import search_library_items, suggest_library_items
+from app.services.transfer_services import (
+    get_transfer_routes,
+    initiate_transfer,
+    receive_manifest,
+    receive_transfer,
+    ship_route,
+)
 from app.services.shared_services import (
-    calculate_fees_and_update,
     checkout,
     delete_copy,
     filter_checkout,
@@ -37,6 +39,8 @@ from app.services.shared_services import (
     return_borrowed_item,
 )
 from app.utils.auth import User
+from app.utils.branch_cache import branch_cache
+from app.utils.pagination import page_args
 from app.utils.database import db
 from app.utils.enums import MemberStatus, TransferStatus
 
@@ -49,7 +53,6 @@ def template(filename):
 
 # Load collections
 staff_collection = db.get_collection("staff")
-branch_collection = db.get_collection("branches")
 
 
 @staff_bp.route("/")
@@ -62,8 +65,6 @@ def staff_home():
 
 @staff_bp.route("/login", methods=["GET", "POST"])
 def login():
-
-    calculate_fees_and_update()
     # Handle POST
     if request.method == "POST":
         staff_id = request.form["staff_id"]
@@ -96,9 +97,7 @@ def login():
             fullname = f"{staff_data['firstname']} {staff_data['lastname']}"
             user = User(str(staff_data["_id"]), fullname, staff_data["role"])
 
-            branch = branch_collection.find_one(
-                {"_id": ObjectId(staff_data["branch_id"])}
-            )
+            branch = branch_cache.get(staff_data["branch_id"])
 
             if branch:
                 user.add_attribute("branch_name", branch["name"])
@@ -120,8 +119,6 @@ def dashboard():
     if current_user.role != "staff":
         return redirect(url_for("login"))
 
-    calculate_fees_and_update()
-    update_transfer_status()
     return render_template(template("dashboard"))
 
 
@@ -144,6 +141,52 @@ def library_items(type):
     return render_template(template_name, items=items, type=type)
 
 
+# Search the catalog
+@staff_bp.route("/library-items/search/")
+@login_required
+def library_item_search():
+    if current_user.role != "staff":
+        return redirect(url_for("staff.login"))
+
+    items, total, total_capped, facets = None, 0, False, None
+    response = search_library_items(
+        query=request.args.get("q"),
+        item_type=request.args.get("item_type"),
+        category=request.args.get("category"),
+        branch_id=request.args.get("branch_id"),
+        available=request.args.get("available") == "1",
+        page_size=request.args.get("page_size", type=int),
+    )
+    if response["status"] == "fail":
+        flash(("error", response["message"]))
+    else:
+        items = response["data"]
+        total = response["total"]
+        total_capped = response["total_capped"]
+        facets = response["facets"]
+
+    return render_template(
+        template("search"),
+        items=items,
+        total=total,
+        total_capped=total_capped,
+        facets=facets,
+    )
+
+
+# search-as-you-type suggestions
+@staff_bp.route("/library-items/suggest/")
+@login_required
+def library_item_suggest():
+    if current_user.role != "staff":
+        return jsonify([]), 403
+
+    response = suggest_library_items(
+        request.args.get("q", ""), request.args.get("item_type")
+    )
+    return jsonify(response.get("data", []))
+
+
 # View Library Items
 @staff_bp.route("/library-items/<type>/<item_id>/view/")
 @login_required
@@ -356,7 +399,6 @@ def filter_checkout_items():
     if current_user.role != "staff":
         return redirect(url_for("staff.login"))
 
-    calculate_fees_and_update()
     member = None
     copies = None
 
@@ -405,6 +447,11 @@ def checkout_items():
     else:
         flash(("success", response["message"]))
 
+    # show exactly which scans were rejected
+    for result in response.get("data", []):
+        if result["status"] == "fail":
+            flash(("error", f"{result['rfid']} : {result['message']}"))
+
     return redirect(url_for("staff.filter_checkout_items", m=member_id))
 
 
@@ -438,8 +485,6 @@ def filter_by_rfid():
     if current_user.role != "staff":
         return redirect(url_for("staff.login"))
 
-    calculate_fees_and_update()
-
     rfid = request.args.get("rfid", "")
     data = {}
     if rfid:
@@ -464,7 +509,6 @@ def return_items_from_member(copy_id, member_id):
     if response["status"] == "fail":
         flash(("error", response["message"]))
     else:
-        calculate_fees_and_update()
         flash(("success", response["message"]))
 
     return redirect(url_for("staff.filter_checkout_items", m=member_id))
@@ -498,8 +542,6 @@ def items_to_transfer():
     if current_user.role != "staff":
         return redirect(url_for("staff.login"))
 
-    update_transfer_status()
-
     branch_id = current_user.branch_id
     items = None
 
@@ -507,8 +549,12 @@ def items_to_transfer():
     page = "Pending"
     in_transit = bool(request.args.get("in_transit"))
     completed = bool(request.args.get("completed"))
+    incoming = bool(request.args.get("incoming"))
 
-    if in_transit:
+    if incoming:
+        status = TransferStatus.IN_TRANSIT.value
+        page = "Incoming"
+    elif in_transit:
         status = TransferStatus.IN_TRANSIT.value
         page = "In Transit"
     elif completed:
@@ -517,25 +563,37 @@ def items_to_transfer():
     else:
         status = TransferStatus.PENDING.value
 
-    response = transfer_items_list(branch_id, status)
+    response = transfer_items_list(branch_id, status, incoming=incoming, **page_args())
     if response["status"] == "fail":
         flash(("error", response["message"]))
     else:
         items = response["data"]
 
+    # per-route backlog and incoming crates, from the precomputed counters
+    routes = get_transfer_routes(branch_id)
+    if routes["status"] == "fail":
+        flash(("error", routes["message"]))
+
     template_name = template("transfer_items")
-    return render_template(template_name, items=items, page=page)
+    return render_template(
+        template_name,
+        items=items,
+        page=page,
+        next_cursor=response.get("next_cursor"),
+        outgoing_routes=routes.get("outgoing"),
+        incoming_manifests=routes.get("incoming"),
+    )
 
 
 # initiate transfer from current branch to original branch
-@staff_bp.route("transfer")
+@staff_bp.route("transfer", methods=["GET", "POST"])
 @login_required
 def initiate_item_transfer():
     if current_user.role != "staff":
         return redirect(url_for("staff.login"))
 
-    transfer_id = request.args.get("transfer_id")
-    copy_id = request.args.get("_copy_id")
+    transfer_id = request.values.get("transfer_id")
+    copy_id = request.values.get("_copy_id")
 
     response = initiate_transfer(transfer_id, copy_id)
     if response["status"] == "fail":
@@ -546,6 +604,55 @@ def initiate_item_transfer():
     return redirect(url_for("staff.items_to_transfer"))
 
 
+# ship every pending transfer on a route as one manifest
+@staff_bp.route("transfer/routes/<to_branch>/ship", methods=["POST"])
+@login_required
+def ship_transfer_route(to_branch):
+    if current_user.role != "staff":
+        return redirect(url_for("staff.login"))
+
+    response = ship_route(current_user.branch_id, to_branch, current_user.id)
+    if response["status"] == "fail":
+        flash(("error", response["message"]))
+    else:
+        flash(("success", response["message"]))
+
+    return redirect(url_for("staff.items_to_transfer"))
+
+
+# receive a whole manifest at the destination branch
+@staff_bp.route("transfer/manifests/<manifest_id>/receive", methods=["POST"])
+@login_required
+def receive_transfer_manifest(manifest_id):
+    if current_user.role != "staff":
+        return redirect(url_for("staff.login"))
+
+    response = receive_manifest(manifest_id, current_user.branch_id, current_user.id)
+    if response["status"] == "fail":
+        flash(("error", response["message"]))
+    else:
+        flash(("success", response["message"]))
+
+    return redirect(url_for("staff.items_to_transfer", incoming=True))
+
+
+# scan a copy arriving back at its branch, it is available right away
+@staff_bp.route("transfer/receive", methods=["POST"])
+@login_required
+def receive_item_transfer():
+    if current_user.role != "staff":
+        return redirect(url_for("staff.login"))
+
+    rfid = request.form.get("rfid", "").strip()
+    response = receive_transfer(rfid, current_user.branch_id)
+    if response["status"] == "fail":
+        flash(("error", response["message"]))
+    else:
+        flash(("success", response["message"]))
+
+    return redirect(url_for("staff.items_to_transfer", incoming=True))
+
+
 # view members by status
 @staff_bp.route("members/")
 @login_required
@@ -555,7 +662,7 @@ def member_getall_by_status():
 
     members = None
     status = MemberStatus.APPROVED.value
-    response = members_get_all_by_status(status)
+    response = members_get_all_by_status(status, **page_args())
     if response["status"] == "fail":
         flash(("error", response["message"]))
     else:
@@ -568,7 +675,12 @@ def member_getall_by_status():
         title = f"{MemberStatus(status).name.capitalize()} Members"
 
     template_name = template("members")
-    return render_template(template_name, members=members, status=status)
+    return render_template(
+        template_name,
+        members=members,
+        status=status,
+        next_cursor=response.get("next_cursor"),
+    )
 
 
 # view member details with borrowed items
@@ -596,6 +708,16 @@ def view_transactions():
         return redirect(url_for("staff.login"))
 
     branch_id = current_user.branch_id
-    transactions = get_all_transactions(branch_id=branch_id)
+    transactions = None
+    response = get_all_transactions(branch_id=branch_id, **page_args())
+    if response["status"] == "fail":
+        flash(("error", response["message"]))
+    else:
+        transactions = response["data"]
+
     template_name = template("transactions")
-    return render_template(template_name, transactions=transactions)
+    return render_template(
+        template_name,
+        transactions=transactions,
+        next_cursor=response.get("next_cursor"),
+    )
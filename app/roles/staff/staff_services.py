@@ -1,34 +1,33 @@
-from datetime import datetime, timedelta
 from bson import ObjectId
-from app.utils.enums import ItemCopyStatus, TransferStatus
+from app.utils.enums import TransferStatus
+from app.utils.pagination import get_page_size, keyset_filter, keyset_sort, paginate
+from app.services.item_projections import item_lookup
 from app.utils.collections import (
     transfers_collection,
-    items_collection,
     copies_collection,
-    branches_collection,
 )
+from app.utils.branch_cache import branch_cache
 
 
-def transfer_items_list(branch_id=None, status=None):
+def transfer_items_list(
+    branch_id=None, status=None, after=None, page_size=None, incoming=False
+):
     try:
         match_filter = {"status": TransferStatus.PENDING.value}
         if branch_id:
             branch_id = ObjectId(branch_id)
-            match_filter["from_branch"] = branch_id
+            # incoming: copies on their way back to this branch
+            match_filter["to_branch" if incoming else "from_branch"] = branch_id
         if status:
             match_filter["status"] = status
 
+        page_size = get_page_size(page_size)
         items = transfers_collection.aggregate(
             [
-                {"$match": match_filter},
-                {
-                    "$lookup": {
-                        "from": items_collection.name,
-                        "localField": "item_id",
-                        "foreignField": "_id",
-                        "as": "library_item",
-                    }
-                },
+                {"$match": keyset_filter(match_filter, after)},
+                {"$sort": dict(keyset_sort())},
+                {"$limit": page_size + 1},
+                item_lookup("library_item"),
                 {"$unwind": "$library_item"},
                 {
                     "$lookup": {
@@ -39,108 +38,12 @@ def transfer_items_list(branch_id=None, status=None):
                     }
                 },
                 {"$unwind": "$copy"},
-                {
-                    "$lookup": {
-                        "from": branches_collection.name,
-                        "localField": "from_branch",
-                        "foreignField": "_id",
-                        "as": "from_branch",
-                    }
-                },
-                {"$unwind": "$from_branch"},
-                {
-                    "$lookup": {
-                        "from": branches_collection.name,
-                        "localField": "to_branch",
-                        "foreignField": "_id",
-                        "as": "to_branch",
-                    }
-                },
-                {"$unwind": "$to_branch"},
             ]
         )
-        return {"status": "success", "data": list(items)}
+        items, next_cursor = paginate(items, page_size)
+        branch_cache.attach(items, "from_branch", "from_branch")
+        branch_cache.attach(items, "to_branch", "to_branch")
+        return {"status": "success", "data": items, "next_cursor": next_cursor}
     except Exception as e:
         print(e)
         return {"status": "fail", "message": f"Error fetching transfer list : {str(e)}"}
-
-
-def initiate_transfer(transfer_id, copy_id):
-    try:
-        transfer_id = ObjectId(transfer_id)
-        transfer = transfers_collection.find_one(
-            {"_id": transfer_id, "status": TransferStatus.PENDING.value}
-        )
-        if not transfer:
-            return {"status": "fail", "message": "No transfer found"}
-
-        copy_id = ObjectId(copy_id)
-        copy = copies_collection.find_one(
-            {"_id": copy_id, "status": ItemCopyStatus.AT_OTHER_BRANCH.value}
-        )
-        if not copy:
-            return {"status": "fail", "message": "Copy not found"}
-        # update status in transfer collection
-        result = transfers_collection.update_one(
-            {"_id": transfer_id},
-            {
-                "$set": {
-                    "status": TransferStatus.IN_TRANSIT.value,
-                    "initiated_on": datetime.now(),
-                }
-            },
-        )
-        if result.modified_count > 0:
-            # update status in copies collection
-            copies_collection.update_one(
-                {"_id": copy_id}, {"$set": {"status": ItemCopyStatus.IN_TRANSIT.value}}
-            )
-            return {
-                "status": "success",
-                "message": "Item transfer initiated successfully",
-            }
-        else:
-            return {"status": "fail", "message": "Item transfer initiated successfully"}
-    except Exception as e:
-        print(e)
-        return {"status": "fail", "message": f"Error transfering item : {str(e)}"}
-
-
-def update_transfer_status():
-    # Get the current time
-    current_time = datetime.now()
-    # Find transfers that are older than 24 hours and still active
-    expired_transfers = transfers_collection.find(
-        {
-            "status": TransferStatus.IN_TRANSIT.value,
-            "initiated_on": {"$lt": (current_time - timedelta(hours=24))},
-        }
-    )
-
-    for transfer in expired_transfers:
-
-        transfer_id = ObjectId(transfer["_id"])
-        copy_id = ObjectId(transfer["copy_id"])
-        original_branch_id = ObjectId(transfer["to_branch"])
-
-        # Update transfer status to "completed" in the transfer collection
-        transfers_collection.update_one(
-            {"_id": transfer_id},
-            {
-                "$set": {
-                    "status": TransferStatus.COMPLETED.value,
-                    "completed_on": current_time,
-                }
-            },
-        )
-
-        # Update copy status to "available" in the copies collection and reset its current branch
-        copies_collection.update_one(
-            {"_id": copy_id},
-            {
-                "$set": {
-                    "status": ItemCopyStatus.AVAILABLE.value,
-                    "current_branch_id": original_branch_id,
-                }
-            },
-        )
@@ -0,0 +1,121 @@
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.utils.collections import (
+    availability_collection,
+    copies_collection,
+    items_collection,
+)
+from app.utils.enums import ItemCopyStatus
+
+# item_branch_availability holds one row per (item_id, branch_id) with the number
+# of copies the branch owns (total_copies) and how many are on its shelf right
+# now (available_copies). Every copy status change that moves those numbers goes
+# through availability_change so the staff catalog never has to count copies.
+
+
+def availability_change(item_id, branch_id, total=0, available=0, item_type=None):
+    """Upsert op adding `total`/`available` to an (item, branch) row."""
+    update = {
+        "$inc": {"total_copies": total, "available_copies": available},
+        "$set": {"updated_at": datetime.now()},
+    }
+    if item_type:
+        update["$setOnInsert"] = {"item_type": item_type}
+    return UpdateOne(
+        {"item_id": ObjectId(item_id), "branch_id": ObjectId(branch_id)},
+        update,
+        upsert=True,
+    )
+
+
+def apply_availability_changes(changes, session=None):
+    changes = [change for change in changes if change]
+    if changes:
+        availability_collection.bulk_write(changes, ordered=False, session=session)
+
+
+def remove_availability(item_id=None, branch_id=None):
+    """Drop the rows of a deleted item or branch."""
+    filter = {}
+    if item_id:
+        filter["item_id"] = ObjectId(item_id)
+    if branch_id:
+        filter["branch_id"] = ObjectId(branch_id)
+    if filter:
+        availability_collection.delete_many(filter)
+
+
+def availability_pipeline(match=None):
+    """Count copies per (item, branch) straight from the copies collection."""
+    return [
+        {
+            "$match": {
+                **(match or {}),
+                "status": {"$ne": ItemCopyStatus.DELETED.value},
+            }
+        },
+        {
+            "$group": {
+                "_id": {"item_id": "$item_id", "branch_id": "$original_branch_id"},
+                "total_copies": {"$sum": 1},
+                "available_copies": {
+                    "$sum": {
+                        "$cond": [
+                            {"$eq": ["$status", ItemCopyStatus.AVAILABLE.value]},
+                            1,
+                            0,
+                        ]
+                    }
+                },
+            }
+        },
+        {
+            "$lookup": {
+                "from": items_collection.name,
+                "localField": "_id.item_id",
+                "foreignField": "_id",
+                "as": "item",
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "item_id": "$_id.item_id",
+                "branch_id": "$_id.branch_id",
+                "item_type": {"$arrayElemAt": ["$item.item_type", 0]},
+                "total_copies": 1,
+                "available_copies": 1,
+                "updated_at": "$$NOW",
+            }
+        },
+    ]
+
+
+def rebuild_item_branch_availability(item_id=None):
+    """Recount the summary from copies, for backfills and repairs."""
+    match = {"item_id": ObjectId(item_id)} if item_id else {}
+    availability_collection.delete_many(match)
+    copies_collection.aggregate(
+        availability_pipeline(match)
+        + [
+            {
+                "$merge": {
+                    "into": availability_collection.name,
+                    "on": ["item_id", "branch_id"],
+                    "whenMatched": "replace",
+                    "whenNotMatched": "insert",
+                }
+            }
+        ]
+    )
+    return availability_collection.count_documents(match)
+
+
+def init_item_branch_availability():
+    """Backfill the summary the first time the app starts against existing data."""
+    if availability_collection.find_one({}, {"_id": 1}):
+        return
+    if copies_collection.find_one({}, {"_id": 1}):
+        rebuild_item_branch_availability()
@@ -0,0 +1,433 @@
+import time
+from itertools import islice
+from datetime import datetime
+from bson import ObjectId
+from flask import current_app
+from pymongo import UpdateOne
+
+from app.utils.bulk import bulk_write_in_batches
+from app.utils.collections import (
+    borrowed_collection,
+    fee_ledger_collection,
+    members_collection,
+)
+from app.utils.enums import FeeLedgerEntryType
+
+LATE_FEE_PER_DAY = 0.50  # Late fee per day in dollars
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+
+def calculate_fees_and_update(member_id=None, batch_size=None):
+    started = time.perf_counter()
+    batch_size = batch_size or current_app.config["FEE_BULK_BATCH_SIZE"]
+
+    # all borrowed items that are not returned
+    filter = {"returned": False}
+    if member_id:
+        filter["member_id"] = ObjectId(member_id)
+
+    # Calculate delayed days and late fee server side in a single pipeline update,
+    # unchanged documents are not rewritten by the server
+    today = datetime.now()
+    loans = borrowed_collection.update_many(
+        filter,
+        [
+            {
+                "$set": {
+                    "delayed_days": {
+                        "$max": [
+                            0,
+                            {
+                                "$floor": {
+                                    "$divide": [
+                                        {"$subtract": [today, "$due_date"]},
+                                        MS_PER_DAY,
+                                    ]
+                                }
+                            },
+                        ]
+                    }
+                }
+            },
+            {"$set": {"late_fee": {"$multiply": ["$delayed_days", LATE_FEE_PER_DAY]}}},
+        ],
+    )
+
+    # post accruals for any difference between a loan's fee and what the ledger holds
+    differences = borrowed_collection.aggregate(
+        [
+            {"$match": filter},
+            {
+                "$lookup": {
+                    "from": fee_ledger_collection.name,
+                    "localField": "_id",
+                    "foreignField": "borrowed_id",
+                    "pipeline": [
+                        {"$match": {"entry_type": FeeLedgerEntryType.ACCRUAL.value}},
+                        {"$group": {"_id": None, "accrued": {"$sum": "$amount"}}},
+                    ],
+                    "as": "ledger",
+                }
+            },
+            {
+                "$project": {
+                    "member_id": 1,
+                    "amount": {
+                        "$subtract": [
+                            "$late_fee",
+                            {"$ifNull": [{"$arrayElemAt": ["$ledger.accrued", 0]}, 0]},
+                        ]
+                    },
+                }
+            },
+            {"$match": {"amount": {"$ne": 0}}},
+        ]
+    )
+    accruals = post_ledger_entries(
+        (
+            ledger_entry(
+                loan["member_id"],
+                FeeLedgerEntryType.ACCRUAL,
+                loan["amount"],
+                borrowed_id=loan["_id"],
+            )
+            for loan in differences
+        ),
+        batch_size,
+    )
+
+    # rebuild running balances from the ledger, this also resets members
+    # whose fees have all been paid or waived
+    rebuild_member_balances(member_id)
+
+    return {
+        "status": "success",
+        "message": "Late fees and total dues updated successfully",
+        "data": {
+            "loans_matched": loans.matched_count,
+            "loans_modified": loans.modified_count,
+            "ledger_entries": accruals["entries"],
+            "members_modified": accruals["members_modified"],
+            "batch_size": batch_size,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        },
+    }
+
+
+def _add_to_due_amount(delta):
+    # pipeline update so members registered with due_amount None start from 0
+    return [
+        {"$set": {"due_amount": {"$add": [{"$ifNull": ["$due_amount", 0]}, delta]}}}
+    ]
+
+
+def ledger_entry(member_id, entry_type, amount, borrowed_id=None, **extra):
+    entry = {
+        "member_id": ObjectId(member_id),
+        "borrowed_id": ObjectId(borrowed_id) if borrowed_id else None,
+        "entry_type": entry_type.value,
+        "amount": round(amount, 2),
+        "created_at": datetime.now(),
+    }
+    entry.update(extra)
+    return entry
+
+
+def post_ledger_entries(entries, batch_size=None):
+    """Append entries to the fee ledger and move the members' running balance.
+
+    The ledger is append-only, members.due_amount is the maintained balance
+    so it can be read without aggregating anything.
+    """
+    batch_size = batch_size or current_app.config["FEE_BULK_BATCH_SIZE"]
+    report = {"entries": 0, "members_modified": 0}
+    entries = (entry for entry in entries if entry["amount"])
+    while True:
+        batch = list(islice(entries, batch_size))
+        if not batch:
+            break
+        fee_ledger_collection.insert_many(batch, ordered=False)
+
+        balance_per_member = {}
+        for entry in batch:
+            member_id = entry["member_id"]
+            balance_per_member[member_id] = (
+                balance_per_member.get(member_id, 0) + entry["amount"]
+            )
+        members = bulk_write_in_batches(
+            members_collection,
+            (
+                UpdateOne({"_id": member_id}, _add_to_due_amount(amount))
+                for member_id, amount in balance_per_member.items()
+            ),
+            batch_size,
+        )
+        report["entries"] += len(batch)
+        report["members_modified"] += members["modified"]
+    return report
+
+
+def rebuild_member_balances(member_id=None):
+    # recompute due_amount from the ledger server side, only drifted members are written
+    match_filter = {"_id": ObjectId(member_id)} if member_id else {}
+    members_collection.aggregate(
+        [
+            {"$match": match_filter},
+            {"$project": {"due_amount": 1}},
+            {
+                "$lookup": {
+                    "from": fee_ledger_collection.name,
+                    "localField": "_id",
+                    "foreignField": "member_id",
+                    "pipeline": [
+                        {"$group": {"_id": None, "balance": {"$sum": "$amount"}}}
+                    ],
+                    "as": "ledger",
+                }
+            },
+            {
+                "$project": {
+                    "due_amount": {
+                        "$round": [
+                            {
+                                "$ifNull": [
+                                    {"$arrayElemAt": ["$ledger.balance", 0]},
+                                    0,
+                                ]
+                            },
+                            2,
+                        ]
+                    },
+                    "previous": "$due_amount",
+                }
+            },
+            {"$match": {"$expr": {"$ne": ["$due_amount", "$previous"]}}},
+            {"$project": {"due_amount": 1}},
+            {
+                "$merge": {
+                    "into": members_collection.name,
+                    "on": "_id",
+                    "whenMatched": "merge",
+                    "whenNotMatched": "discard",
+                }
+            },
+        ]
+    )
+
+
+def calculate_fees_incremental(member_id=None, batch_size=None):
+    """Only rewrite loans whose delayed_days changed since they were last computed.
+
+    Loans that are not overdue (and were never charged) are not selected at
+    all, and each fee change is posted to the ledger as an accrual delta.
+    """
+    started = time.perf_counter()
+    batch_size = batch_size or current_app.config["FEE_BULK_BATCH_SIZE"]
+    today = datetime.now()
+
+    delayed_days_now = {
+        "$max": [
+            0,
+            {"$floor": {"$divide": [{"$subtract": [today, "$due_date"]}, MS_PER_DAY]}},
+        ]
+    }
+    # overdue loans, plus previously charged loans that may have been renewed
+    filter = {
+        "returned": False,
+        "$or": [{"due_date": {"$lt": today}}, {"delayed_days": {"$gt": 0}}],
+        "$expr": {"$ne": [delayed_days_now, {"$ifNull": ["$delayed_days", 0]}]},
+    }
+    if member_id:
+        filter["member_id"] = ObjectId(member_id)
+
+    changed_loans = borrowed_collection.find(
+        filter, {"member_id": 1, "due_date": 1, "delayed_days": 1, "late_fee": 1}
+    )
+
+    # the updates are guarded on the values read and stamped with this run's
+    # id, only the loans read back with the stamp post an accrual, so a
+    # concurrent run or a return in the meantime never charges a loan twice
+    fee_run_id = ObjectId()
+    loans = {"matched": 0, "modified": 0}
+    entries = []
+    while True:
+        batch = list(islice(changed_loans, batch_size))
+        if not batch:
+            break
+        accruals = {}
+        updates = []
+        for loan in batch:
+            delayed_days = max(0, (today - loan["due_date"]).days)
+            late_fee = delayed_days * LATE_FEE_PER_DAY
+            accruals[loan["_id"]] = ledger_entry(
+                loan["member_id"],
+                FeeLedgerEntryType.ACCRUAL,
+                late_fee - (loan.get("late_fee") or 0),
+                borrowed_id=loan["_id"],
+            )
+            updates.append(
+                UpdateOne(
+                    {
+                        "_id": loan["_id"],
+                        "returned": False,
+                        "delayed_days": loan.get("delayed_days"),
+                    },
+                    {
+                        "$set": {
+                            "delayed_days": delayed_days,
+                            "late_fee": late_fee,
+                            "fee_run_id": fee_run_id,
+                        }
+                    },
+                )
+            )
+        result = bulk_write_in_batches(borrowed_collection, updates, batch_size)
+        loans["matched"] += result["matched"]
+        loans["modified"] += result["modified"]
+        applied = borrowed_collection.find(
+            {"_id": {"$in": list(accruals)}, "fee_run_id": fee_run_id}, {"_id": 1}
+        )
+        entries += [accruals[loan["_id"]] for loan in applied]
+
+    accruals = post_ledger_entries(entries, batch_size)
+
+    return {
+        "status": "success",
+        "message": "Late fees and total dues updated successfully",
+        "data": {
+            "loans_matched": loans["matched"],
+            "loans_modified": loans["modified"],
+            "ledger_entries": accruals["entries"],
+            "members_modified": accruals["members_modified"],
+            "batch_size": batch_size,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        },
+    }
+
+
+def _loan_balances(member_id):
+    """Outstanding fee per open loan, from the ledger, oldest due date first."""
+    loans = list(
+        borrowed_collection.find(
+            {"member_id": ObjectId(member_id), "returned": False},
+            {"_id": 1},
+            sort=[("due_date", 1)],
+        )
+    )
+    balances = {
+        entry["_id"]: entry["balance"]
+        for entry in fee_ledger_collection.aggregate(
+            [
+                {"$match": {"borrowed_id": {"$in": [loan["_id"] for loan in loans]}}},
+                {"$group": {"_id": "$borrowed_id", "balance": {"$sum": "$amount"}}},
+            ]
+        )
+    }
+    return [
+        (loan["_id"], round(balances[loan["_id"]], 2))
+        for loan in loans
+        if round(balances.get(loan["_id"], 0), 2) > 0
+    ]
+
+
+# the late fee is paid on return, less whatever was waived on the loan
+def settle_returned_loan(borrowed_item):
+    waived = next(
+        fee_ledger_collection.aggregate(
+            [
+                {
+                    "$match": {
+                        "borrowed_id": borrowed_item["_id"],
+                        "entry_type": FeeLedgerEntryType.WAIVER.value,
+                    }
+                },
+                {"$group": {"_id": None, "amount": {"$sum": "$amount"}}},
+            ]
+        ),
+        {"amount": 0},
+    )["amount"]
+    paid = max(0, round(borrowed_item.get("late_fee", 0) + waived, 2))
+    post_ledger_entries(
+        [
+            ledger_entry(
+                borrowed_item["member_id"],
+                FeeLedgerEntryType.PAYMENT,
+                -paid,
+                borrowed_id=borrowed_item["_id"],
+            )
+        ]
+    )
+    return paid
+
+
+def waive_fee(member_id, amount, note=None, waived_by=None):
+    """Waive part of a member's fees, spread over their loans oldest first.
+
+    Each waiver entry carries its loan so the payment on return only settles
+    what is still outstanding on that loan.
+    """
+    try:
+        member = members_collection.find_one({"_id": ObjectId(member_id)}, {"_id": 1})
+        if not member:
+            return {"status": "fail", "message": "Member not found"}
+
+        amount = round(float(amount), 2)
+        loans = _loan_balances(member_id)
+        balance = round(sum(outstanding for _, outstanding in loans), 2)
+        if amount <= 0 or amount > balance:
+            return {
+                "status": "fail",
+                "message": f"Waiver must be between $0.01 and the due amount ${balance:.2f}",
+            }
+
+        entries = []
+        remaining = amount
+        for borrowed_id, outstanding in loans:
+            if remaining <= 0:
+                break
+            waived = min(outstanding, remaining)
+            remaining = round(remaining - waived, 2)
+            entries.append(
+                ledger_entry(
+                    member_id,
+                    FeeLedgerEntryType.WAIVER,
+                    -waived,
+                    borrowed_id=borrowed_id,
+                    note=note,
+                    created_by=waived_by,
+                )
+            )
+        post_ledger_entries(entries)
+        return {"status": "success", "message": f"${amount:.2f} waived successfully"}
+    except Exception as e:
+        print(e)
+        return {"status": "fail", "message": f"Error waiving fee : {str(e)}"}
+
+
+def get_member_ledger(member_id, limit=50):
+    try:
+        entries = (
+            fee_ledger_collection.find({"member_id": ObjectId(member_id)})
+            .sort("created_at", -1)
+            .limit(limit)
+        )
+        return {"status": "success", "data": list(entries)}
+    except Exception as e:
+        print(e)
+        return {"status": "fail", "message": f"Error fetching ledger : {str(e)}"}
+
+
+# scheduled fee engine entry point, FEE_ENGINE_MODE picks full or incremental
+def run_fee_engine():
+    if current_app.config["FEE_ENGINE_MODE"] == "full":
+        return calculate_fees_and_update()
+    return calculate_fees_incremental()
+
+
+# on-demand recompute for a single member, used by the checkout and return screens
+def recalculate_member_fees(member_id):
+    try:
+        return calculate_fees_incremental(member_id=member_id)
+    except Exception as e:
+        print(e)
+        return {"status": "fail", "message": f"Error calculating fees : {str(e)}"}
@@ -0,0 +1,90 @@
+from app.utils.collections import items_collection
+
+# Fields of a library item each list view renders, shared by every endpoint that
+# lists items so list pages only load the columns they show.
+LIST_COLUMNS = {"id": 1, "title": 1, "image_filename": 1, "categories": 1}
+
+ITEM_PROJECTIONS = {
+    "admin": LIST_COLUMNS,
+    "member": LIST_COLUMNS,
+    # copy counts are merged in from item_branch_availability
+    "staff": {**LIST_COLUMNS, "item_type": 1, "availability_type": 1},
+    "search": {
+        **LIST_COLUMNS,
+        "item_type": 1,
+        "author": 1,
+        "director": 1,
+    },
+}
+
+# item joined into loan, reservation, copy and transfer rows
+ITEM_PROJECTIONS["embedded"] = {
+    "id": 1,
+    "title": 1,
+    "item_type": 1,
+    "image_filename": 1,
+}
+
+
+def item_lookup(as_field, view="embedded"):
+    """$lookup of the row's item_id carrying only the columns of `view`."""
+    return {
+        "$lookup": {
+            "from": items_collection.name,
+            "localField": "item_id",
+            "foreignField": "_id",
+            "pipeline": [{"$project": ITEM_PROJECTIONS[view]}],
+            "as": as_field,
+        }
+    }
+
+
+# form fields library_item_add/update store, anything else posted is dropped
+ITEM_FIELDS = (
+    "id",
+    "title",
+    "item_type",
+    "availability_type",
+    "categories",
+    "author",
+    "isbn",
+    "publisher",
+    "director",
+    "production_year",
+)
+
+
+def list_payload_report(sample_size=1000):
+    """Average BSON size of an item, whole and as each view projects it."""
+    sizes = {
+        view: {"$bsonSize": {field: f"${field}" for field in projection}}
+        for view, projection in ITEM_PROJECTIONS.items()
+    }
+    pipeline = [
+        {"$match": {"is_active": True}},
+        {"$sample": {"size": sample_size}},
+        {"$project": {"full": {"$bsonSize": "$$ROOT"}, **sizes}},
+        {
+            "$group": {
+                "_id": None,
+                "items": {"$sum": 1},
+                **{view: {"$avg": f"${view}"} for view in ["full", *sizes]},
+            }
+        },
+    ]
+    result = next(items_collection.aggregate(pipeline), None)
+    if not result:
+        return {"items": 0, "views": {}}
+
+    full = result["full"]
+    return {
+        "items": result["items"],
+        "full": round(full),
+        "views": {
+            view: {
+                "bytes": round(result[view]),
+                "saved": round(1 - result[view] / full, 3) if full else 0,
+            }
+            for view in sizes
+        },
+    }
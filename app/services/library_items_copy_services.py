@@ -3,6 +3,12 @@ import uuid
 from bson import ObjectId
 from flask_login import current_user
 
+from app.services.availability_services import (
+    apply_availability_changes,
+    availability_change,
+)
+from app.services.item_projections import item_lookup
+from app.utils.branch_cache import branch_cache
 from app.utils.enums import ItemCopyStatus
 from app.utils.remove_file_util import remove_file_util
 from app.utils.upload_file import upload_file_util
@@ -12,7 +18,6 @@ from pymongo import errors
 
 copies_collection = db.get_collection("copies")
 items_collection = db.get_collection("library_items")
-branches_collection = db.get_collection("branches")
 members_collection = db.get_collection("member")
 
 
@@ -30,24 +35,6 @@ def copies_getby_itemId(item_id):
         copies = copies_collection.aggregate(
             [
                 {"$match": filter},
-                {
-                    "$lookup": {
-                        "from": branches_collection.name,
-                        "localField": "original_branch_id",
-                        "foreignField": "_id",
-                        "as": "original_branch",
-                    }
-                },
-                {"$unwind": "$original_branch"},
-                {
-                    "$lookup": {
-                        "from": branches_collection.name,
-                        "localField": "current_branch_id",
-                        "foreignField": "_id",
-                        "as": "current_branch",
-                    }
-                },
-                {"$unwind": "$current_branch"},
                 {
                     "$lookup": {
                         "from": members_collection.name,
@@ -60,7 +47,10 @@ def copies_getby_itemId(item_id):
                 {"$sort": {"original_branch_id": 1}},
             ]
         )
-        return {"status": "success", "data": list(copies)}
+        copies = list(copies)
+        branch_cache.attach(copies, "original_branch_id", "original_branch")
+        branch_cache.attach(copies, "current_branch_id", "current_branch")
+        return {"status": "success", "data": copies}
     except Exception as e:
         print(e)
         return {"status": "fail", "message": f"Error fetching copies : {str(e)}"}
@@ -80,24 +70,6 @@ def library_item_copy_get(copy_id):
                         "status": {"$ne": ItemCopyStatus.DELETED.value},
                     }
                 },
-                {
-                    "$lookup": {
-                        "from": branches_collection.name,
-                        "localField": "original_branch_id",
-                        "foreignField": "_id",
-                        "as": "original_branch",
-                    }
-                },
-                {"$unwind": "$original_branch"},
-                {
-                    "$lookup": {
-                        "from": branches_collection.name,
-                        "localField": "current_branch_id",
-                        "foreignField": "_id",
-                        "as": "current_branch",
-                    }
-                },
-                {"$unwind": "$current_branch"},
                 {
                     "$lookup": {
                         "from": members_collection.name,
@@ -115,6 +87,8 @@ def library_item_copy_get(copy_id):
 
         if not copy:
             return {"status": "fail", "message": "Copy not found"}
+        branch_cache.attach([copy], "original_branch_id", "original_branch")
+        branch_cache.attach([copy], "current_branch_id", "current_branch")
 
         return {"status": "success", "data": copy}
     except Exception as e:
@@ -131,14 +105,7 @@ def get_available_copies_by_branch(branch_id):
                     "status": ItemCopyStatus.AVAILABLE.value,
                 }
             },
-            {
-                "$lookup": {
-                    "from": items_collection.name,
-                    "localField": "item_id",
-                    "foreignField": "_id",
-                    "as": "library_item",
-                }
-            },
+            item_lookup("library_item"),
             {"$unwind": "$library_item"},
             {"$sort": {"item_id": 1}},
         ]
@@ -158,24 +125,6 @@ def get_copy_item_by_rfid(rfid, branch_id):
                         "status": {"$ne": ItemCopyStatus.DELETED.value},
                     }
                 },
-                {
-                    "$lookup": {
-                        "from": branches_collection.name,
-                        "localField": "original_branch_id",
-                        "foreignField": "_id",
-                        "as": "original_branch",
-                    }
-                },
-                {"$unwind": "$original_branch"},
-                {
-                    "$lookup": {
-                        "from": branches_collection.name,
-                        "localField": "current_branch_id",
-                        "foreignField": "_id",
-                        "as": "current_branch",
-                    }
-                },
-                {"$unwind": "$current_branch"},
                 {
                     "$lookup": {
                         "from": items_collection.name,
@@ -192,6 +141,8 @@ def get_copy_item_by_rfid(rfid, branch_id):
         if not copies:
             return {"status": "fail", "message": "Item could not be found"}
         copy = copies[0]
+        branch_cache.attach([copy], "original_branch_id", "original_branch")
+        branch_cache.attach([copy], "current_branch_id", "current_branch")
 
         if copy["status"] == ItemCopyStatus.AVAILABLE.value:
             return {"status": "success", "data": copy}
@@ -232,8 +183,21 @@ def library_item_copy_add(data):
         }
         copies_collection.insert_one(copy)
         # increase total copies & available copies value to 1
-        items_collection.update_one(
-            {"_id": item_id}, {"$inc": {"total_copies": 1, "available_copies": 1}}
+        item = items_collection.find_one_and_update(
+            {"_id": item_id},
+            {"$inc": {"total_copies": 1, "available_copies": 1}},
+            {"item_type": 1},
+        )
+        apply_availability_changes(
+            [
+                availability_change(
+                    item_id,
+                    copy["original_branch_id"],
+                    total=1,
+                    available=1,
+                    item_type=item["item_type"] if item else None,
+                )
+            ]
         )
         return {"status": "success", "message": "Copy created successfully"}
     except Exception as e:
@@ -263,6 +227,31 @@ def library_item_copy_update(data, id):
         copies_collection.find_one_and_update(
             {"_id": ObjectId(id)}, {"$set": copy_data}
         )
+        if (copy["item_id"], copy["original_branch_id"]) != (
+            copy_data["item_id"],
+            copy_data["original_branch_id"],
+        ):
+            # the copy moved to another branch's stock
+            item = items_collection.find_one(
+                {"_id": copy_data["item_id"]}, {"item_type": 1}
+            )
+            apply_availability_changes(
+                [
+                    availability_change(
+                        copy["item_id"],
+                        copy["original_branch_id"],
+                        total=-1,
+                        available=-1,
+                    ),
+                    availability_change(
+                        copy_data["item_id"],
+                        copy_data["original_branch_id"],
+                        total=1,
+                        available=1,
+                        item_type=item["item_type"] if item else None,
+                    ),
+                ]
+            )
         return {"status": "success", "message": "Copy updated successfully"}
     except Exception as e:
         print(e)
@@ -1,21 +1,34 @@
 from datetime import datetime
 from bson import ObjectId
 
+from app.services.item_projections import ITEM_FIELDS, ITEM_PROJECTIONS
+from app.services.search_services import index_library_item
+from app.utils.branch_cache import branch_cache
 from app.utils.enums import ItemCopyStatus
 from app.utils.remove_file_util import remove_file_util
 from app.utils.upload_file import upload_file_util
 from app.utils.convert_string_toArray import convert_string_to_array
 from app.utils.database import db
-from pymongo import errors
-from app.utils.collections import items_collection, copies_collection, types_collection
+from app.utils.pagination import find_page
+from pymongo import ReturnDocument, errors
+from app.utils.collections import (
+    availability_collection,
+    copies_collection,
+    items_collection,
+    types_collection,
+)
 
 
-def get_all_library_items(type):
+def get_all_library_items(type, view="admin", after=None, page_size=None):
     try:
-        items = items_collection.find({"item_type": type, "is_active": True}).sort(
-            "_id", -1
+        items, next_cursor = find_page(
+            items_collection,
+            {"item_type": type, "is_active": True},
+            after,
+            page_size,
+            projection=ITEM_PROJECTIONS[view],
         )
-        return {"status": "success", "data": list(items)}
+        return {"status": "success", "data": items, "next_cursor": next_cursor}
     except Exception as e:
         print(e)
         return {
@@ -27,62 +40,26 @@ def get_all_library_items(type):
 def get_library_items_by_type(item_type, branch_id):
     try:
         branch_id = ObjectId(branch_id)
-        # Fetch library items by item_type
-        items_aggregation = items_collection.aggregate(
-            [
-                {"$match": {"item_type": item_type}},  # Filter by item_type
-                {
-                    "$lookup": {
-                        "from": copies_collection.name,
-                        "let": {"item_id": "$_id"},
-                        "pipeline": [
-                            {
-                                "$match": {"$expr": {"$eq": ["$item_id", "$$item_id"]}}
-                            },  # Match copies for this item
-                            {
-                                "$match": {"original_branch_id": branch_id}
-                            },  # Filter by branch_id
-                        ],
-                        "as": "branch_copies",
-                    }
-                },
-                {
-                    "$addFields": {
-                        "total_copies": {"$size": "$branch_copies"},
-                        "available_copies": {
-                            "$size": {
-                                "$filter": {
-                                    "input": "$branch_copies",
-                                    "as": "copy",
-                                    "cond": {"$eq": ["$$copy.status", "available"]},
-                                }
-                            }
-                        },
-                    }
-                },
+        # copy counts come from the maintained per-branch summary
+        counts = {
+            row["item_id"]: row
+            for row in availability_collection.find(
                 {
-                    "$match": {
-                        "total_copies": {"$gt": 0}
-                    }  # Ensure branch has at least one copy
+                    "branch_id": branch_id,
+                    "item_type": item_type,
+                    "total_copies": {"$gt": 0},
                 },
-                {
-                    "$project": {
-                        "_id": 1,  # Exclude the internal MongoDB ID
-                        "image_filename": 1,
-                        "id": 1,
-                        "title": 1,
-                        "availability_type": 1,
-                        "categories": 1,
-                        "item_type": 1,
-                        "total_copies": 1,
-                        "available_copies": 1,
-                    }
-                },
-            ]
+                {"item_id": 1, "total_copies": 1, "available_copies": 1},
+            )
+        }
+        items = list(
+            items_collection.find(
+                {"_id": {"$in": list(counts)}}, ITEM_PROJECTIONS["staff"]
+            ).sort("_id", 1)
         )
-
-        # Convert the aggregation result to a list
-        items = list(items_aggregation)
+        for item in items:
+            item["total_copies"] = counts[item["_id"]]["total_copies"]
+            item["available_copies"] = counts[item["_id"]]["available_copies"]
 
         return {
             "status": "success",
@@ -128,34 +105,22 @@ def library_item_details_with_copies_count_branchwise(item_id):
                         },
                     }
                 },
-                {
-                    "$lookup": {
-                        "from": "branches",
-                        "localField": "_id",
-                        "foreignField": "_id",
-                        "as": "branch_details",
-                    }
-                },
-                {
-                    "$unwind": {
-                        "path": "$branch_details",
-                        "preserveNullAndEmptyArrays": True,
-                    }
-                },
                 {
                     "$project": {
                         "_id": 0,
                         "branch_id": "$_id",
                         "total_copies": 1,
                         "available_copies": 1,
-                        "branch_name": "$branch_details.name",
-                        # "branch_name": {"$arrayElemAt": ["$branch_details.name", 0]},
                     }
                 },
             ]
         )
 
         copies_details = list(copies_aggregation)
+        for branch_copies in copies_details:
+            branch_copies["branch_name"] = branch_cache.name(
+                branch_copies["branch_id"], None
+            )
         return {
             "status": "success",
             "item": item,
@@ -205,7 +170,7 @@ def library_item_add(data, files, type):
             if error:
                 return {"status": "fail", "message": f"Error : {error}"}
 
-        item = {key: value for key, value in data.items()}
+        item = {key: data[key] for key in ITEM_FIELDS if key in data}
 
         item["id"] = item["id"].upper()
         item["categories"] = convert_string_to_array(item["categories"])
@@ -218,6 +183,7 @@ def library_item_add(data, files, type):
         item["is_active"] = True
 
         items_collection.insert_one(item)
+        index_library_item(item)
         return {
             "status": "success",
             "message": "Library item added successfully",
@@ -234,11 +200,11 @@ def library_item_update(item_id, data, files, type):
         if "digital_file" in files:
             digital_file = files["digital_file"]
 
-        item = {key: value for key, value in data.items()}
+        item = {key: data[key] for key in ITEM_FIELDS if key in data}
 
-        filename = old_filename = item["image_filename"]
-        if "digital_filename" in item:
-            digital_filename = old_digital_filename = item["digital_filename"]
+        filename = old_filename = data["image_filename"]
+        if "digital_filename" in data:
+            digital_filename = old_digital_filename = data["digital_filename"]
 
         if image_file:
             # upload and move image to folder
@@ -271,7 +237,13 @@ def library_item_update(item_id, data, files, type):
         if "digital_file" in files:
             item["digital_filename"] = digital_filename
 
-        items_collection.find_one_and_update({"_id": ObjectId(item_id)}, {"$set": item})
+        updated = items_collection.find_one_and_update(
+            {"_id": ObjectId(item_id)},
+            {"$set": item},
+            return_document=ReturnDocument.AFTER,
+        )
+        if updated:
+            index_library_item(updated)
         return {
             "status": "success",
             "message": "Library item updated successfully",
@@ -0,0 +1,330 @@
+import re
+import smtplib
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from bson import ObjectId
+from flask import current_app
+from pymongo import UpdateOne
+
+from app.utils.auth import invalidate_unread_counts
+from app.utils.collections import (
+    members_collection,
+    notification_outbox_collection,
+    notifications_collection,
+)
+from app.utils.enums import NotificationOutboxStatus
+from app.utils.sequences import notification_ids
+
+# Producers only insert into notification_outbox (inside their own transaction
+# when they have one). The notification_delivery job claims pending entries in
+# batches and fans them out to the channels below, recording per-channel state
+# so a retry only repeats the channels that failed.
+
+# name -> deliver(entries), returns the _ids it delivered
+_channels = {}
+
+# a claimed batch that hasn't been settled after this long is picked up again
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def register_channel(name, deliver):
+    _channels[name] = deliver
+
+
+def enabled_channels():
+    names = current_app.config["NOTIFICATION_CHANNELS"].split(",")
+    return [name.strip() for name in names if name.strip() in _channels]
+
+
+def notification_entry(member_id, message, subject=None):
+    now = datetime.now()
+    return {
+        "member_id": ObjectId(member_id),
+        "message": message,
+        "subject": subject or "Library notification",
+        "channels": enabled_channels(),
+        "deliveries": {},
+        "status": NotificationOutboxStatus.PENDING.value,
+        "attempts": 0,
+        "created_at": now,
+        "next_attempt": now,
+    }
+
+
+def enqueue_notifications(notifications, session=None):
+    """Queue (member_id, message) pairs for delivery, one insert for all."""
+    entries = [
+        notification_entry(member_id, message) for member_id, message in notifications
+    ]
+    if entries:
+        notification_outbox_collection.insert_many(entries, session=session)
+    return len(entries)
+
+
+def enqueue_notification(member_id, message, subject=None, session=None):
+    entry = notification_entry(member_id, message, subject)
+    notification_outbox_collection.insert_one(entry, session=session)
+    return entry["_id"]
+
+
+# Channels
+
+
+def deliver_in_app(entries):
+    """Write the member-facing notifications, keyed on the outbox _id.
+
+    The upsert makes a retried batch a no-op for entries already written, and
+    only freshly inserted notifications bump the member's unread counter.
+    """
+    operations = [
+        UpdateOne(
+            {"_id": entry["_id"]},
+            {
+                "$setOnInsert": {
+                    "notification_id": f"NTF{notification_ids.next():04d}",
+                    "member_id": entry["member_id"],
+                    "message": entry["message"],
+                    "date": entry["created_at"],
+                    "status": "unread",
+                }
+            },
+            upsert=True,
+        )
+        for entry in entries
+    ]
+    result = notifications_collection.bulk_write(operations, ordered=False)
+
+    unread = {}
+    for index in result.upserted_ids:
+        member_id = entries[index]["member_id"]
+        unread[member_id] = unread.get(member_id, 0) + 1
+    if unread:
+        members_collection.bulk_write(
+            [
+                UpdateOne({"_id": member_id}, {"$inc": {"unread_notifications": count}})
+                for member_id, count in unread.items()
+            ],
+            ordered=False,
+        )
+        invalidate_unread_counts()
+    return {entry["_id"] for entry in entries}
+
+
+def deliver_email(entries):
+    """Send one mail per entry over a single SMTP connection."""
+    emails = {
+        member["_id"]: member.get("email")
+        for member in members_collection.find(
+            {"_id": {"$in": list({entry["member_id"] for entry in entries})}},
+            {"email": 1},
+        )
+    }
+    config = current_app.config
+    delivered = set()
+    with smtplib.SMTP(config["MAIL_SERVER"], config["MAIL_PORT"], timeout=10) as smtp:
+        for entry in entries:
+            address = emails.get(entry["member_id"])
+            if not address:
+                # nothing to send to, don't keep retrying
+                delivered.add(entry["_id"])
+                continue
+            mail = EmailMessage()
+            mail["From"] = config["MAIL_SENDER"]
+            mail["To"] = address
+            mail["Subject"] = entry["subject"]
+            mail.set_content(re.sub(r"<[^>]+>", "", entry["message"]))
+            try:
+                smtp.send_message(mail)
+                delivered.add(entry["_id"])
+            except smtplib.SMTPException as e:
+                print(f"Mail to {address} failed: {e}")
+    return delivered
+
+
+register_channel("in_app", deliver_in_app)
+register_channel("email", deliver_email)
+
+
+# Worker
+
+
+def _claim_batch(batch_size):
+    now = datetime.now()
+    claimable = {
+        "status": {
+            "$in": [
+                NotificationOutboxStatus.PENDING.value,
+                NotificationOutboxStatus.PROCESSING.value,
+            ]
+        },
+        "next_attempt": {"$lte": now},
+    }
+    ids = [
+        entry["_id"]
+        for entry in notification_outbox_collection.find(claimable, {"_id": 1})
+        .sort("next_attempt", 1)
+        .limit(batch_size)
+    ]
+    if not ids:
+        return []
+
+    # the claim id keeps an overlapping run from delivering the same entries
+    claim_id = ObjectId()
+    notification_outbox_collection.update_many(
+        {**claimable, "_id": {"$in": ids}},
+        {
+            "$set": {
+                "status": NotificationOutboxStatus.PROCESSING.value,
+                "claim_id": claim_id,
+                "next_attempt": now + CLAIM_LEASE,
+            },
+            "$inc": {"attempts": 1},
+        },
+    )
+    return list(
+        notification_outbox_collection.find({"_id": {"$in": ids}, "claim_id": claim_id})
+    )
+
+
+def _deliver_batch(entries):
+    config = current_app.config
+    now = datetime.now()
+    report = {"delivered": 0, "retried": 0, "failed": 0}
+
+    results = {}
+    for name in {name for entry in entries for name in entry["channels"]}:
+        todo = [
+            entry
+            for entry in entries
+            if name in entry["channels"]
+            and entry["deliveries"].get(name, {}).get("status") != "delivered"
+        ]
+        if not todo:
+            continue
+        deliver = _channels.get(name)
+        try:
+            delivered, error = deliver(todo) if deliver else set(), None
+        except Exception as e:
+            print(f"Notification channel {name} failed: {e}")
+            delivered, error = set(), str(e)
+        for entry in todo:
+            ok = entry["_id"] in delivered
+            results.setdefault(entry["_id"], {})[name] = {
+                "status": "delivered" if ok else "failed",
+                "at": now,
+                "error": None if ok else error or f"not delivered by {name}",
+            }
+
+    operations = []
+    for entry in entries:
+        deliveries = {**entry["deliveries"], **results.get(entry["_id"], {})}
+        update = {f"deliveries.{name}": state for name, state in deliveries.items()}
+        if all(
+            deliveries.get(name, {}).get("status") == "delivered"
+            for name in entry["channels"]
+        ):
+            update.update(
+                status=NotificationOutboxStatus.DELIVERED.value, delivered_at=now
+            )
+            report["delivered"] += 1
+        elif entry["attempts"] >= config["NOTIFICATION_MAX_ATTEMPTS"]:
+            update["status"] = NotificationOutboxStatus.FAILED.value
+            report["failed"] += 1
+        else:
+            delay = config["NOTIFICATION_RETRY_DELAY"] * 2 ** (entry["attempts"] - 1)
+            update.update(
+                status=NotificationOutboxStatus.PENDING.value,
+                next_attempt=now + timedelta(seconds=delay),
+            )
+            report["retried"] += 1
+        operations.append(
+            UpdateOne(
+                {"_id": entry["_id"], "claim_id": entry["claim_id"]},
+                {"$set": update, "$unset": {"claim_id": ""}},
+            )
+        )
+    if operations:
+        notification_outbox_collection.bulk_write(operations, ordered=False)
+    return report
+
+
+def deliver_notifications(batch_size=None):
+    """Drain the outbox, the notification_delivery job."""
+    batch_size = batch_size or current_app.config["NOTIFICATION_BATCH_SIZE"]
+    report = {"claimed": 0, "delivered": 0, "retried": 0, "failed": 0}
+    while True:
+        entries = _claim_batch(batch_size)
+        if not entries:
+            break
+        report["claimed"] += len(entries)
+        for key, count in _deliver_batch(entries).items():
+            report[key] += count
+        if len(entries) < batch_size:
+            break
+    return report
+
+
+# Unread counter, kept on the member document as unread_notifications
+
+
+def mark_notifications_read(member_id, notification_ids):
+    """Mark the notifications the member was shown as read."""
+    member_id = ObjectId(member_id)
+    result = notifications_collection.update_many(
+        {
+            "_id": {"$in": [ObjectId(id) for id in notification_ids]},
+            "member_id": member_id,
+            "status": "unread",
+        },
+        {"$set": {"status": "read"}},
+    )
+    if result.modified_count:
+        members_collection.update_one(
+            {"_id": member_id},
+            {"$inc": {"unread_notifications": -result.modified_count}},
+        )
+        invalidate_unread_counts()
+    return result.modified_count
+
+
+def delete_member_notification(member_id, notification_id):
+    notification = notifications_collection.find_one_and_delete(
+        {"_id": ObjectId(notification_id), "member_id": ObjectId(member_id)},
+        {"status": 1},
+    )
+    if notification and notification.get("status") == "unread":
+        members_collection.update_one(
+            {"_id": ObjectId(member_id)}, {"$inc": {"unread_notifications": -1}}
+        )
+        invalidate_unread_counts()
+    return notification is not None
+
+
+def rebuild_unread_counts():
+    """Recount unread_notifications for every member from the notifications."""
+    members_collection.update_many({}, {"$set": {"unread_notifications": 0}})
+    notifications_collection.aggregate(
+        [
+            {"$match": {"status": "unread"}},
+            {"$group": {"_id": "$member_id", "unread_notifications": {"$sum": 1}}},
+            {
+                "$merge": {
+                    "into": members_collection.name,
+                    "on": "_id",
+                    "whenMatched": "merge",
+                    "whenNotMatched": "discard",
+                }
+            },
+        ]
+    )
+    return members_collection.count_documents({"unread_notifications": {"$gt": 0}})
+
+
+def init_unread_counts():
+    """Backfill the counters the first time this runs against existing data."""
+    if members_collection.find_one(
+        {"unread_notifications": {"$exists": True}}, {"_id": 1}
+    ):
+        return
+    if members_collection.find_one({}, {"_id": 1}):
+        rebuild_unread_counts()
@@ -0,0 +1,170 @@
+import time
+from bson import ObjectId
+from flask import current_app
+from pymongo import UpdateOne
+
+from app.utils.collections import copies_collection, items_collection
+from app.utils.enums import ItemCopyStatus
+
+# drift entries kept in the report, the counts cover everything
+DRIFT_REPORT_LIMIT = 100
+
+
+def count_copies(item_ids):
+    """True total/available copy counts per item, from one $group over copies."""
+    counts = copies_collection.aggregate(
+        [
+            {
+                "$match": {
+                    "item_id": {"$in": item_ids},
+                    "status": {"$ne": ItemCopyStatus.DELETED.value},
+                }
+            },
+            {
+                "$group": {
+                    "_id": "$item_id",
+                    "total_copies": {"$sum": 1},
+                    "available_copies": {
+                        "$sum": {
+                            "$cond": [
+                                {"$eq": ["$status", ItemCopyStatus.AVAILABLE.value]},
+                                1,
+                                0,
+                            ]
+                        }
+                    },
+                }
+            },
+        ]
+    )
+    return {row["_id"]: row for row in counts}
+
+
+def _drift(items):
+    """(item, stored, actual) for the items whose counters differ from a recount."""
+    actual = count_copies([item["_id"] for item in items])
+    drift = []
+    for item in items:
+        counts = actual.get(item["_id"], {"total_copies": 0, "available_copies": 0})
+        stored = (item.get("total_copies"), item.get("available_copies"))
+        expected = (counts["total_copies"], counts["available_copies"])
+        if stored != expected:
+            drift.append((item, stored, expected))
+    return drift
+
+
+def _confirmed_drift(drift, delay):
+    """Keep the drift that reads the same on a second pass `delay` seconds later.
+
+    Checkout and return change a copy's status and the item counters in
+    separate writes, an item caught between the two looks drifted for a moment
+    and must not be "fixed" into real drift.
+    """
+    time.sleep(delay)
+    items = list(
+        items_collection.find(
+            {"_id": {"$in": [item["_id"] for item, _, _ in drift]}},
+            {"id": 1, "total_copies": 1, "available_copies": 1},
+        )
+    )
+    again = {item["_id"]: (stored, actual) for item, stored, actual in _drift(items)}
+    return [
+        (item, stored, actual)
+        for item, stored, actual in drift
+        if again.get(item["_id"]) == (stored, actual)
+    ]
+
+
+def _reconcile_batch(items, fix):
+    drift = _drift(items)
+    confirmed = []
+    if fix and drift:
+        confirmed = _confirmed_drift(
+            drift, current_app.config["RECONCILE_CONFIRM_DELAY"]
+        )
+
+    fixes = [
+        # only overwrite if nothing moved the counters since we read them,
+        # a concurrent checkout/return is picked up by the next run
+        UpdateOne(
+            {
+                "_id": item["_id"],
+                "total_copies": stored[0],
+                "available_copies": stored[1],
+            },
+            {"$set": {"total_copies": actual[0], "available_copies": actual[1]}},
+        )
+        for item, stored, actual in confirmed
+    ]
+    fixed = 0
+    if fixes:
+        fixed = items_collection.bulk_write(fixes, ordered=False).modified_count
+
+    report = [
+        {
+            "item_id": str(item["_id"]),
+            "id": item.get("id"),
+            "stored": {"total_copies": stored[0], "available_copies": stored[1]},
+            "actual": {"total_copies": actual[0], "available_copies": actual[1]},
+        }
+        for item, stored, actual in drift
+    ]
+    return report, fixed
+
+
+def reconcile_item_counters(
+    fix=False, start_after=None, end_before=None, batch_size=None, pause=None
+):
+    """Compare library_items.total_copies/available_copies with the copies.
+
+    Walks the items in _id order, `batch_size` at a time, optionally limited to
+    the (start_after, end_before) _id range, and sleeps `pause` seconds between
+    batches to keep the load on the cluster low. With `fix` the drifted
+    counters are overwritten with the recounted values, once a second pass
+    RECONCILE_CONFIRM_DELAY seconds later has read the same drift.
+    """
+    batch_size = batch_size or current_app.config["RECONCILE_BATCH_SIZE"]
+    pause = current_app.config["RECONCILE_PAUSE"] if pause is None else pause
+    report = {"checked": 0, "drifted": 0, "fixed": 0, "last_id": None, "drift": []}
+
+    range_filter = {}
+    if start_after:
+        range_filter["$gt"] = ObjectId(start_after)
+    if end_before:
+        range_filter["$lt"] = ObjectId(end_before)
+
+    last_id = None
+    while True:
+        filter = {"_id": dict(range_filter)} if range_filter else {}
+        if last_id:
+            filter.setdefault("_id", {})["$gt"] = last_id
+        items = list(
+            items_collection.find(
+                filter, {"id": 1, "total_copies": 1, "available_copies": 1}
+            )
+            .sort("_id", 1)
+            .limit(batch_size)
+        )
+        if not items:
+            break
+
+        drift, fixed = _reconcile_batch(items, fix)
+        last_id = items[-1]["_id"]
+        report["checked"] += len(items)
+        report["drifted"] += len(drift)
+        report["fixed"] += fixed
+        report["last_id"] = str(last_id)
+        room = DRIFT_REPORT_LIMIT - len(report["drift"])
+        report["drift"] += drift[:room]
+
+        if len(items) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    return report
+
+
+def run_counter_reconciliation():
+    """Scheduled full pass, fixes drift only when RECONCILE_AUTO_FIX is on."""
+    return reconcile_item_counters(fix=current_app.config["RECONCILE_AUTO_FIX"])
@@ -0,0 +1,271 @@
+from datetime import datetime, timedelta
+from bson import ObjectId
+from flask import current_app
+from pymongo import ReturnDocument, UpdateOne
+
+from app.services.availability_services import (
+    apply_availability_changes,
+    availability_change,
+)
+from app.utils.collections import (
+    copies_collection,
+    items_collection,
+    reservations_collection,
+)
+from app.services.notification_services import enqueue_notifications
+from app.utils.enums import ItemCopyStatus, ReservationStatus
+
+# Each (item_id, branch_id) has a FIFO queue of active reservations ordered by
+# (reserved_date, _id). The queue index makes the head an index seek, and
+# popping it with find_one_and_update is atomic, so two desks returning copies
+# of the same item at once notify two different members.
+#
+# A hold sets one of the branch's available copies aside: the copy moves to
+# reserved with reserved_for set to the member, leaves the available counters,
+# and checkout only lends it to that member.
+QUEUE_ORDER = [("reserved_date", 1), ("_id", 1)]
+
+# reservations that still hold a place (waiting or ready for pickup)
+OPEN_STATUSES = [ReservationStatus.ACTIVE.value, ReservationStatus.NOTIFIED.value]
+
+
+def pop_next_reservation(item_id, branch_id, session=None):
+    """Move the head of the queue to notified and start its hold."""
+    now = datetime.now()
+    hold_days = current_app.config["RESERVATION_HOLD_DAYS"]
+    return reservations_collection.find_one_and_update(
+        {
+            "item_id": ObjectId(item_id),
+            "branch_id": ObjectId(branch_id),
+            "status": ReservationStatus.ACTIVE.value,
+        },
+        {
+            "$set": {
+                "status": ReservationStatus.NOTIFIED.value,
+                "notified_on": now,
+                "hold_expires": now + timedelta(days=hold_days),
+            }
+        },
+        sort=QUEUE_ORDER,
+        return_document=ReturnDocument.AFTER,
+        session=session,
+    )
+
+
+def hold_next_copy(item_id, branch_id, session=None):
+    """Set an available copy aside for the head of the queue.
+
+    Returns the reservation now holding it, or None when nobody is waiting or
+    the branch has no available copy left.
+    """
+    reservation = pop_next_reservation(item_id, branch_id, session=session)
+    if not reservation:
+        return None
+
+    copy = copies_collection.find_one_and_update(
+        {
+            "item_id": ObjectId(item_id),
+            "original_branch_id": ObjectId(branch_id),
+            "status": ItemCopyStatus.AVAILABLE.value,
+        },
+        {
+            "$set": {
+                "status": ItemCopyStatus.RESERVED.value,
+                "reserved_for": reservation["member_id"],
+            }
+        },
+        projection={"_id": 1},
+        session=session,
+    )
+    if not copy:
+        # someone took the copy first, the member keeps their place in line
+        reservations_collection.update_one(
+            {"_id": reservation["_id"], "status": ReservationStatus.NOTIFIED.value},
+            {
+                "$set": {"status": ReservationStatus.ACTIVE.value},
+                "$unset": {"notified_on": "", "hold_expires": ""},
+            },
+            session=session,
+        )
+        return None
+
+    reservations_collection.update_one(
+        {"_id": reservation["_id"]}, {"$set": {"copy_id": copy["_id"]}}, session=session
+    )
+    reservation["copy_id"] = copy["_id"]
+    return reservation
+
+
+def hold_counter_changes(held, delta, session=None):
+    """Add `delta` per copy to the item and branch available counters.
+
+    `held` maps (item_id, branch_id) to a number of copies, -1 sets them aside
+    for holds and +1 puts released ones back.
+    """
+    if not held:
+        return
+    per_item = {}
+    for (item_id, _), count in held.items():
+        per_item[item_id] = per_item.get(item_id, 0) + count
+    items_collection.bulk_write(
+        [
+            UpdateOne({"_id": item_id}, {"$inc": {"available_copies": delta * count}})
+            for item_id, count in per_item.items()
+        ],
+        ordered=False,
+        session=session,
+    )
+    apply_availability_changes(
+        [
+            availability_change(item_id, branch_id, available=delta * count)
+            for (item_id, branch_id), count in held.items()
+        ],
+        session=session,
+    )
+
+
+def pop_and_notify(arrivals, session=None):
+    """Hold a copy for the next member in line once per copy that came back.
+
+    `arrivals` maps (item_id, branch_id) to the number of copies that became
+    available. Returns the reservations that were popped.
+    """
+    popped = []
+    held = {}
+    for (item_id, branch_id), count in arrivals.items():
+        for _ in range(count):
+            reservation = hold_next_copy(item_id, branch_id, session=session)
+            if not reservation:
+                break
+            popped.append(reservation)
+            key = (reservation["item_id"], reservation["branch_id"])
+            held[key] = held.get(key, 0) + 1
+    if not popped:
+        return popped
+    hold_counter_changes(held, -1, session=session)
+
+    titles = {
+        item["_id"]: item["title"]
+        for item in items_collection.find(
+            {"_id": {"$in": list({reservation["item_id"] for reservation in popped})}},
+            {"title": 1},
+            session=session,
+        )
+    }
+    enqueue_notifications(
+        [
+            (
+                reservation["member_id"],
+                f"The item '{titles.get(reservation['item_id'], '')}' you reserved is now available at branch. It is held for you until {reservation['hold_expires'].strftime('%Y-%m-%d')}.",
+            )
+            for reservation in popped
+        ],
+        session=session,
+    )
+    return popped
+
+
+def release_held_copies(filter, session=None):
+    """Put reserved copies matching `filter` back on the shelf.
+
+    Returns the released copies per (item_id, branch_id), the caller decides
+    whether they go to the next member in line.
+    """
+    filter = {**filter, "status": ItemCopyStatus.RESERVED.value}
+    copies = list(
+        copies_collection.find(
+            filter, {"item_id": 1, "original_branch_id": 1}, session=session
+        )
+    )
+    released = {}
+    for copy in copies:
+        # the status condition skips a copy someone else moved in the meantime
+        result = copies_collection.update_one(
+            {"_id": copy["_id"], **filter},
+            {
+                "$set": {"status": ItemCopyStatus.AVAILABLE.value},
+                "$unset": {"reserved_for": ""},
+            },
+            session=session,
+        )
+        if result.modified_count:
+            key = (copy["item_id"], copy["original_branch_id"])
+            released[key] = released.get(key, 0) + 1
+    hold_counter_changes(released, 1, session=session)
+    return released
+
+
+def has_open_reservation(item_id, branch_id, exclude_member_id=None):
+    filter = {
+        "item_id": ObjectId(item_id),
+        "branch_id": ObjectId(branch_id),
+        "status": {"$in": OPEN_STATUSES},
+    }
+    if exclude_member_id:
+        filter["member_id"] = {"$ne": ObjectId(exclude_member_id)}
+    return reservations_collection.find_one(filter, {"_id": 1}) is not None
+
+
+def queue_position(reservation):
+    """1-based place of an active reservation in its queue."""
+    if reservation.get("status") != ReservationStatus.ACTIVE.value:
+        return None
+    ahead = reservations_collection.count_documents(
+        {
+            "item_id": reservation["item_id"],
+            "branch_id": reservation["branch_id"],
+            "status": ReservationStatus.ACTIVE.value,
+            "$or": [
+                {"reserved_date": {"$lt": reservation["reserved_date"]}},
+                {
+                    "reserved_date": reservation["reserved_date"],
+                    "_id": {"$lt": reservation["_id"]},
+                },
+            ],
+        }
+    )
+    return ahead + 1
+
+
+def expire_reservation_holds(batch_size=500):
+    """Expire holds nobody picked up and pass their copy to the next in line."""
+    expired = notified = 0
+    while True:
+        holds = list(
+            reservations_collection.find(
+                {
+                    "status": ReservationStatus.NOTIFIED.value,
+                    "hold_expires": {"$lt": datetime.now()},
+                },
+                {"item_id": 1, "branch_id": 1, "member_id": 1, "copy_id": 1},
+            ).limit(batch_size)
+        )
+        if not holds:
+            break
+
+        arrivals = {}
+        for hold in holds:
+            # the status condition keeps a concurrent checkout or run from
+            # expiring the same hold twice
+            result = reservations_collection.update_one(
+                {"_id": hold["_id"], "status": ReservationStatus.NOTIFIED.value},
+                {"$set": {"status": ReservationStatus.EXPIRED.value}},
+            )
+            if not result.modified_count:
+                continue
+            expired += 1
+            # the hold is only handed on if its copy is still set aside for
+            # the member, a hold from before copies were reserved is handed on
+            # only when hold_next_copy finds an available copy
+            if hold.get("copy_id"):
+                released = release_held_copies(
+                    {"_id": hold["copy_id"], "reserved_for": hold["member_id"]}
+                )
+            else:
+                released = {(hold["item_id"], hold["branch_id"]): 1}
+            for key, count in released.items():
+                arrivals[key] = arrivals.get(key, 0) + count
+        notified += len(pop_and_notify(arrivals))
+        if len(holds) < batch_size:
+            break
+    return {"expired": expired, "notified": notified}
@@ -0,0 +1,249 @@
+import threading
+import time
+from bson import ObjectId
+from flask import current_app
+
+from app.services.item_projections import ITEM_PROJECTIONS
+from app.utils.collections import (
+    availability_collection,
+    items_collection,
+)
+from app.utils.branch_cache import branch_cache
+from app.utils.cache import VersionStamp
+from app.utils.pagination import get_page_size
+from app.utils.prefix_index import PrefixIndex
+
+SUGGEST_LIMIT = 10
+
+# Per-process autocomplete index over titles, authors/directors and item ids.
+# Catalog writes bump the "catalog" stamp so the other workers rebuild theirs.
+_suggest_index = PrefixIndex()
+_suggest_state = {"built_at": None, "version": None, "building": False}
+catalog_stamp = VersionStamp("catalog", "SEARCH_INDEX_CHECK")
+_suggest_lock = threading.Lock()
+
+
+def _suggestion(item):
+    return {
+        "_id": str(item["_id"]),
+        "id": item.get("id"),
+        "title": item.get("title"),
+        "item_type": item.get("item_type"),
+    }
+
+
+def _suggest_entries(item):
+    value = _suggestion(item)
+    for field in ("title", "author", "director", "id"):
+        if item.get(field):
+            yield item[field], value
+
+
+def build_suggest_index():
+    """Load every active item into the autocomplete index, swapping it in whole."""
+    # read the stamp first, a write racing the load triggers another rebuild
+    version = catalog_stamp.current()
+    items = items_collection.find(
+        {"is_active": True},
+        {"id": 1, "title": 1, "author": 1, "director": 1, "item_type": 1},
+    )
+    _suggest_index.build(entry for item in items for entry in _suggest_entries(item))
+    _suggest_state["built_at"] = time.monotonic()
+    _suggest_state["version"] = version
+    return len(_suggest_index)
+
+
+def _rebuild_in_background():
+    try:
+        build_suggest_index()
+    except Exception as e:
+        print(f"Suggest index rebuild failed: {e}")
+    finally:
+        _suggest_state["building"] = False
+
+
+def _ensure_suggest_index():
+    # first request builds it inline, after that a stale index keeps answering
+    # while a background thread reloads it
+    if _suggest_state["built_at"] is None:
+        with _suggest_lock:
+            if _suggest_state["built_at"] is None:
+                build_suggest_index()
+        return
+
+    age = time.monotonic() - _suggest_state["built_at"]
+    if (
+        age < current_app.config["SEARCH_INDEX_REFRESH"]
+        and _suggest_state["version"] == catalog_stamp.current()
+    ):
+        return
+    with _suggest_lock:
+        if _suggest_state["building"]:
+            return
+        _suggest_state["building"] = True
+    threading.Thread(target=_rebuild_in_background, daemon=True).start()
+
+
+def _catalog_changed():
+    # this process already applied the change, only the others have to rebuild
+    version = catalog_stamp.bump()
+    if _suggest_state["version"] == version - 1:
+        _suggest_state["version"] = version
+
+
+def index_library_item(item):
+    """Refresh one item in the autocomplete index after add/update."""
+    if _suggest_state["built_at"] is not None:
+        item_id = str(item["_id"])
+        _suggest_index.remove(lambda value: value["_id"] == item_id)
+        if item.get("is_active", True):
+            for key, value in _suggest_entries(item):
+                _suggest_index.add(key, value)
+    _catalog_changed()
+
+
+def unindex_library_item(item_id):
+    """Drop a deleted or deactivated item from the autocomplete index."""
+    if _suggest_state["built_at"] is not None:
+        item_id = str(item_id)
+        _suggest_index.remove(lambda value: value["_id"] == item_id)
+    _catalog_changed()
+
+
+def suggest_library_items(prefix, item_type=None, limit=SUGGEST_LIMIT):
+    try:
+        _ensure_suggest_index()
+        # over-fetch so the item_type filter still fills the list
+        matches = _suggest_index.search(
+            prefix, limit * 5 if item_type else limit, key=lambda value: value["_id"]
+        )
+        if item_type:
+            matches = [value for value in matches if value["item_type"] == item_type]
+        return {"status": "success", "data": matches[:limit]}
+    except Exception as e:
+        print(e)
+        return {"status": "fail", "message": f"Error fetching suggestions : {str(e)}"}
+
+
+def search_library_items(
+    query=None,
+    item_type=None,
+    category=None,
+    branch_id=None,
+    available=False,
+    page_size=None,
+):
+    """Catalog search with facet counts.
+
+    Free text goes through the catalog text index, an exact item id jumps straight
+    to that item. `branch_id` keeps items with a copy available at that branch,
+    `available` items with one available anywhere. Facets and these filters are
+    computed over the best SEARCH_FACET_LIMIT matches so broad queries stay cheap,
+    `total` counts every match unless a branch or availability filter is set,
+    then it is a lower bound and `total_capped` says so.
+    """
+    try:
+        page_size = get_page_size(page_size)
+        query = (query or "").strip()
+        filter = {"is_active": True}
+        if item_type:
+            filter["item_type"] = item_type
+        if category:
+            filter["categories"] = category
+
+        if query and items_collection.find_one(
+            {**filter, "id": query.upper()}, {"_id": 1}
+        ):
+            filter["id"] = query.upper()
+        elif query:
+            filter["$text"] = {"$search": query}
+
+        pipeline = [{"$match": filter}]
+        if "$text" in filter:
+            pipeline += [
+                {"$addFields": {"score": {"$meta": "textScore"}}},
+                {"$sort": {"score": -1, "_id": -1}},
+            ]
+        else:
+            pipeline.append({"$sort": {"_id": -1}})
+        pipeline += [
+            {"$limit": current_app.config["SEARCH_FACET_LIMIT"]},
+            {"$project": {**ITEM_PROJECTIONS["search"], "score": 1}},
+            {
+                # available copies per branch from the maintained summary rows,
+                # one seek on the item_branch index per item
+                "$lookup": {
+                    "from": availability_collection.name,
+                    "localField": "_id",
+                    "foreignField": "item_id",
+                    "pipeline": [
+                        {"$match": {"available_copies": {"$gt": 0}}},
+                        {
+                            "$project": {
+                                "_id": "$branch_id",
+                                "count": "$available_copies",
+                            }
+                        },
+                    ],
+                    "as": "availability",
+                }
+            },
+        ]
+        if branch_id:
+            pipeline.append({"$match": {"availability._id": ObjectId(branch_id)}})
+        elif available:
+            pipeline.append({"$match": {"availability.0": {"$exists": True}}})
+
+        pipeline.append(
+            {
+                "$facet": {
+                    "items": [{"$limit": page_size}],
+                    "total": [{"$count": "count"}],
+                    "item_type": [{"$sortByCount": "$item_type"}],
+                    "categories": [
+                        {"$unwind": "$categories"},
+                        {"$sortByCount": "$categories"},
+                        {"$limit": 20},
+                    ],
+                    "branches": [
+                        {"$unwind": "$availability"},
+                        {"$sortByCount": "$availability._id"},
+                    ],
+                }
+            }
+        )
+        result = next(items_collection.aggregate(pipeline))
+        total = result["total"][0]["count"] if result["total"] else 0
+        total_capped = False
+        facet_limit = current_app.config["SEARCH_FACET_LIMIT"]
+        if not (branch_id or available):
+            # the facets stopped at the limit, count the rest straight off the index
+            if total >= facet_limit:
+                total = items_collection.count_documents(filter)
+        elif (
+            items_collection.count_documents(filter, limit=facet_limit + 1)
+            > facet_limit
+        ):
+            # availability is only known for the items the facets looked at
+            total_capped = True
+
+        for facet in result["branches"]:
+            facet["name"] = branch_cache.name(facet["_id"])
+
+        return {
+            "status": "success",
+            "data": result["items"],
+            "total": total,
+            "total_capped": total_capped,
+            "facets": {
+                "item_type": result["item_type"],
+                "categories": result["categories"],
+                "branches": result["branches"],
+            },
+        }
+    except Exception as e:
+        print(e)
+        return {
+            "status": "fail",
+            "message": f"Error searching library items : {str(e)}",
+        }
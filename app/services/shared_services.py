@@ -1,7 +1,19 @@
 from datetime import datetime, timedelta
 from bson import ObjectId
+from flask import current_app
 
 from app.roles.member.member_services import get_member_with_borrowed_items
+from app.services.availability_services import (
+    apply_availability_changes,
+    availability_change,
+)
+from app.services.fee_services import recalculate_member_fees, settle_returned_loan
+from app.services.reservation_services import (
+    OPEN_STATUSES,
+    pop_and_notify,
+    release_held_copies,
+)
+from app.services.transfer_services import apply_route_changes, route_change
 from app.services.library_items_copy_services import (
     get_available_copies_by_branch,
     get_copy_item_by_rfid,
@@ -9,6 +21,7 @@ from app.services.library_items_copy_services import (
 from app.utils.enums import (
     ItemCopyStatus,
     MemberStatus,
+    ReservationStatus,
     TransactionType,
     TransferStatus,
 )
@@ -16,70 +29,36 @@ from app.utils.remove_file_util import remove_file_util
 from app.utils.upload_file import upload_file_util
 from app.utils.convert_string_toArray import convert_string_to_array
 from app.utils.database import db
+from app.utils.pagination import get_page_size, keyset_filter, keyset_sort, paginate
+from app.utils.metrics import track_outcome
+from app.utils.branch_cache import branch_cache
+from app.utils.sequences import transaction_ids
 from app.utils.collections import (
-    branches_collection,
     borrowed_collection,
     copies_collection,
     items_collection,
     members_collection,
-    notifications_collection,
     reservations_collection,
     transactions_collection,
     transfers_collection,
 )
-from pymongo import errors
+from pymongo import DeleteOne, ReturnDocument, UpdateOne, errors
 
 
-def create_transaction(values):
+def build_transaction(values):
+    seq = transaction_ids.next()
     insert_data = {
-        "transaction_id": f"TXN{datetime.now().strftime('%Y%m%d%H%M%S')}",
+        "transaction_id": f"TXN{seq:010d}",
+        "seq": seq,  # unique, legacy ids without it may repeat
         "transaction_date": datetime.now(),
         "status": "active",
     }
     insert_data.update(values)
-    transactions_collection.insert_one(insert_data)
-
-
-def calculate_fees_and_update():
-    late_fee_per_day = 0.50  # Late fee per day in dollars
-
-    # Fetch all borrowed items that are not returned
-    borrowed_items = borrowed_collection.find({"returned": False})
-    # print(list(borrowed_items))
-    total_due_per_member = {}
-
-    for item in borrowed_items:
-        borrow_id = ObjectId(item["_id"])
-        member_id = ObjectId(item["member_id"])
-        due_date = item["due_date"]
-        borrowed_on = item["borrowed_on"]
-
-        # Calculate delayed days
-        today = datetime.now()
-        delayed_days = (today - due_date).days if today > due_date else 0
-        late_fee = delayed_days * late_fee_per_day
-
-        # Update the borrowed item with delayed_days and late_fee
-        borrowed_collection.update_one(
-            {"_id": borrow_id},
-            {"$set": {"delayed_days": delayed_days, "late_fee": late_fee}},
-        )
-
-        # Accumulate the total late fee per member
-        if member_id not in total_due_per_member:
-            total_due_per_member[member_id] = 0
-        total_due_per_member[member_id] += late_fee
+    return insert_data
 
-    # Update the members collection with total due amount
-    for member_id, total_due in total_due_per_member.items():
-        members_collection.update_one(
-            {"_id": member_id}, {"$set": {"due_amount": total_due}}
-        )
 
-    return {
-        "status": "success",
-        "message": "Late fees and total dues updated successfully",
-    }
+def create_transaction(values, session=None):
+    transactions_collection.insert_one(build_transaction(values), session=session)
 
 
 # def filter_checkout(member_id, rfid, branch_id):
@@ -105,6 +84,13 @@ def calculate_fees_and_update():
 def filter_checkout(member_id, branch_id):
     member = None
     if member_id:
+        # refresh the member's late fees before showing the checkout screen
+        member_doc = members_collection.find_one(
+            {"member_id": str(member_id).upper()}, {"_id": 1}
+        )
+        if member_doc:
+            recalculate_member_fees(member_doc["_id"])
+
         member_resp = get_member_with_borrowed_items(member_id)
         if member_resp["status"] == "fail":
             return member_resp
@@ -122,6 +108,17 @@ def filter_checkout(member_id, branch_id):
     return {"status": "success", "data": data}
 
 
+# reasons shown to the desk when a scanned copy could not be claimed
+CLAIM_REJECTED_MESSAGES = {
+    ItemCopyStatus.BORROWED.value: "The item is already borrowed and not available",
+    ItemCopyStatus.RESERVED.value: "This copy is held for another member's reservation.",
+    ItemCopyStatus.AT_OTHER_BRANCH.value: "This item is available at another branch.",
+    ItemCopyStatus.IN_TRANSIT.value: "This item is in transit to its branch.",
+    ItemCopyStatus.DELETED.value: "This copy has been removed.",
+}
+
+
+@track_outcome("checkout")
 def checkout(member_id, rfid_list):
     try:
         member = members_collection.find_one(
@@ -131,68 +128,210 @@ def checkout(member_id, rfid_list):
         if not member:
             return {"status": "fail", "message": "Member not found"}
 
+        # running balance is maintained by the fee ledger, no need to aggregate loans
+        due_amount = member.get("due_amount") or 0
+        if due_amount > current_app.config["MAX_DUE_AMOUNT"]:
+            return {
+                "status": "fail",
+                "message": f"Checkout blocked, the member has ${due_amount:.2f} in unpaid fees",
+            }
+
         due_date = datetime.now() + timedelta(days=21)  # 3 weeks borrowing period
         member_id = ObjectId(member["_id"])
-
-        for rfid in rfid_list:
-            copy = copies_collection.find_one({"rfid": rfid})
-            item_id = ObjectId(copy["item_id"])
-
-            item = items_collection.find_one({"_id": item_id})
-
-            # add the member borrowed items
-            borrowed_collection.insert_one(
-                {
-                    "member_id": member_id,
-                    "item_id": item_id,
-                    "item_type": item["item_type"],
-                    "copy_id": ObjectId(copy["_id"]),
-                    "branch_id": ObjectId(copy["original_branch_id"]),
-                    "rfid": copy["rfid"],
-                    "borrowed_on": datetime.now(),
-                    "due_date": due_date,
-                    "delayed_days": 0,
-                    "late_fee": 0,
-                    "renewals_left": 2,
-                    "returned": False,
-                    "return_date": None,
-                }
-            )
-
-            # add tranctions
-            transaction_data = {
-                "member_id": member_id,
-                "item_id": item_id,
-                "copy_id": ObjectId(copy["_id"]),
-                "transaction_type": TransactionType.BORROW.value,
-                "borrow_branch_id": ObjectId(copy["original_branch_id"]),
-                "due_date": due_date,
+        rfid_list = list(dict.fromkeys(rfid_list))  # drop duplicate scans
+
+        # claim the copies and write the loans in one transaction, a copy another
+        # desk already lent is rejected and an abort puts every claim back
+        def write_checkout(session):
+            # a copy held for a reservation is only lent to the member it's held
+            # for, it already left the available counters when the hold started
+            copies = []
+            for rfid in rfid_list:
+                copy = copies_collection.find_one_and_update(
+                    {
+                        "rfid": rfid,
+                        "$or": [
+                            {"status": ItemCopyStatus.AVAILABLE.value},
+                            {
+                                "status": ItemCopyStatus.RESERVED.value,
+                                "reserved_for": member_id,
+                            },
+                        ],
+                    },
+                    {
+                        "$set": {
+                            "borrower_id": member_id,
+                            "status": ItemCopyStatus.BORROWED.value,
+                        },
+                        "$unset": {"reserved_for": ""},
+                    },
+                    return_document=ReturnDocument.BEFORE,
+                    session=session,
+                )
+                if copy:
+                    copies.append(copy)
+            if not copies:
+                return copies
+
+            item_ids = list({ObjectId(copy["item_id"]) for copy in copies})
+            items = {
+                item["_id"]: item
+                for item in items_collection.find(
+                    {"_id": {"$in": item_ids}}, {"item_type": 1}, session=session
+                )
             }
-            create_transaction(transaction_data)
 
-            # Mark the copy as borrowed, update borrower_id
-            copies_collection.update_one(
-                {"_id": ObjectId(copy["_id"])},
-                {
-                    "$set": {
-                        "borrower_id": member_id,
-                        "status": ItemCopyStatus.BORROWED.value,
+            borrowed_items = []
+            transactions = []
+            borrowed_per_item = {}
+            borrowed_per_branch = {}
+            reservation_deletes = []
+            for copy in copies:
+                item_id = ObjectId(copy["item_id"])
+                copy_id = ObjectId(copy["_id"])
+                branch_id = ObjectId(copy["original_branch_id"])
+
+                # add the member borrowed items
+                borrowed_items.append(
+                    {
+                        "member_id": member_id,
+                        "item_id": item_id,
+                        "item_type": items[item_id]["item_type"],
+                        "copy_id": copy_id,
+                        "branch_id": branch_id,
+                        "rfid": copy["rfid"],
+                        "borrowed_on": datetime.now(),
+                        "due_date": due_date,
+                        "delayed_days": 0,
+                        "late_fee": 0,
+                        "renewals_left": 2,
+                        "returned": False,
+                        "return_date": None,
                     }
-                },
-            )
+                )
+
+                # add tranctions
+                transactions.append(
+                    build_transaction(
+                        {
+                            "member_id": member_id,
+                            "item_id": item_id,
+                            "copy_id": copy_id,
+                            "transaction_type": TransactionType.BORROW.value,
+                            "borrow_branch_id": branch_id,
+                            "due_date": due_date,
+                        }
+                    )
+                )
+
+                if copy["status"] == ItemCopyStatus.AVAILABLE.value:
+                    borrowed_per_item[item_id] = borrowed_per_item.get(item_id, 0) + 1
+                    key = (item_id, branch_id)
+                    borrowed_per_branch[key] = borrowed_per_branch.get(key, 0) + 1
+                    # a copy off the shelf fulfils the member's open
+                    # reservation for the item, a held copy is matched to its
+                    # hold below
+                    reservation_deletes.append(
+                        DeleteOne(
+                            {
+                                "item_id": item_id,
+                                "member_id": member_id,
+                                "status": {"$in": OPEN_STATUSES},
+                            }
+                        )
+                    )
+
+            # the holds this checkout picked up, by the reserved copies claimed
+            held_copy_ids = [
+                copy["_id"]
+                for copy in copies
+                if copy["status"] == ItemCopyStatus.RESERVED.value
+            ]
+            if held_copy_ids:
+                reservation_deletes += [
+                    DeleteOne({"_id": reservation["_id"]})
+                    for reservation in reservations_collection.find(
+                        {
+                            "member_id": member_id,
+                            "copy_id": {"$in": held_copy_ids},
+                            "status": ReservationStatus.NOTIFIED.value,
+                        },
+                        {"_id": 1},
+                        session=session,
+                    )
+                ]
 
             # decrease total available copies
-            items_collection.update_one(
-                {"_id": item_id},
-                {"$inc": {"available_copies": -1}},
-            )
+            item_updates = [
+                UpdateOne({"_id": item_id}, {"$inc": {"available_copies": -count}})
+                for item_id, count in borrowed_per_item.items()
+            ]
+            availability_updates = [
+                availability_change(item_id, branch_id, available=-count)
+                for (item_id, branch_id), count in borrowed_per_branch.items()
+            ]
 
-            # check reservation by item and member if available delete reservation
-            reservations_collection.delete_one(
-                {"item_id": item_id, "member_id": member_id}
+            borrowed_collection.insert_many(borrowed_items, session=session)
+            transactions_collection.insert_many(transactions, session=session)
+            if item_updates:
+                items_collection.bulk_write(
+                    item_updates, ordered=False, session=session
+                )
+            apply_availability_changes(availability_updates, session=session)
+            if reservation_deletes:
+                reservations_collection.bulk_write(
+                    reservation_deletes, ordered=False, session=session
+                )
+            # the member took another copy than the one held for them, the held
+            # one goes to the next member in line
+            released = release_held_copies(
+                {"item_id": {"$in": item_ids}, "reserved_for": member_id},
+                session=session,
             )
+            pop_and_notify(released, session=session)
+            return copies
+
+        with db.start_session() as session:
+            copies = session.with_transaction(write_checkout)
+
+        results = {
+            copy["rfid"]: {
+                "rfid": copy["rfid"],
+                "status": "success",
+                "message": "Borrowed",
+            }
+            for copy in copies
+        }
+        rejected = [rfid for rfid in rfid_list if rfid not in results]
+        if rejected:
+            statuses = {
+                copy["rfid"]: copy["status"]
+                for copy in copies_collection.find(
+                    {"rfid": {"$in": rejected}}, {"rfid": 1, "status": 1}
+                )
+            }
+            for rfid in rejected:
+                results[rfid] = {
+                    "rfid": rfid,
+                    "status": "fail",
+                    "message": CLAIM_REJECTED_MESSAGES.get(
+                        statuses.get(rfid), "Copy not found"
+                    ),
+                }
+
+        results = [results[rfid] for rfid in rfid_list]
+        if not copies:
+            return {
+                "status": "fail",
+                "message": "None of the scanned items could be borrowed",
+                "data": results,
+            }
 
-        return {"status": "success", "message": "Item borrowed successfully"}
+        return {
+            "status": "success",
+            "message": f"{len(copies)} of {len(rfid_list)} item(s) borrowed successfully",
+            "data": results,
+        }
     except Exception as e:
         print(e)
         return {"status": "fail", "message": f"Error fetching copy : {str(e)}"}
@@ -290,6 +429,7 @@ def checkout(member_id, rfid_list):
 #         return {"status": "fail", "message": f"Error fetching copy : {str(e)}"}
 
 
+@track_outcome("return")
 def return_borrowed_item(copy_id, return_branch_id=None):
     # Find the borrowed item based on the copy_id
     copy_id = ObjectId(copy_id)
@@ -304,8 +444,12 @@ def return_borrowed_item(copy_id, return_branch_id=None):
         }
 
     member_id = ObjectId(borrowed_item["member_id"])
+
+    # bring the late fee up to date before it is paid
+    recalculate_member_fees(member_id)
+    borrowed_item = borrowed_collection.find_one({"_id": borrowed_item["_id"]})
+
     item_id = ObjectId(borrowed_item["item_id"])
-    late_fee = borrowed_item.get("late_fee", 0.0)
     original_branch_id = ObjectId(borrowed_item["branch_id"])
 
     if return_branch_id:
@@ -313,11 +457,20 @@ def return_borrowed_item(copy_id, return_branch_id=None):
     else:
         return_branch_id = ObjectId(borrowed_item["branch_id"])
 
-    # Update the borrowed item to mark it as returned
-    borrowed_collection.update_one(
-        {"_id": borrowed_item["_id"]},
+    # Update the borrowed item to mark it as returned, the fee engine stops
+    # charging it from here so the late fee read back is the one to settle
+    borrowed_item = borrowed_collection.find_one_and_update(
+        {"_id": borrowed_item["_id"], "returned": False},
         {"$set": {"returned": True, "return_date": datetime.now()}},
+        return_document=ReturnDocument.AFTER,
     )
+    if not borrowed_item:
+        return {
+            "status": "error",
+            "message": "Borrowed item not found or already returned.",
+        }
+    # the late fee is paid on return, record the payment in the fee ledger
+    paid_amount = settle_returned_loan(borrowed_item)
 
     # Update the copy status in the copies collection
     copy_update = {
@@ -336,52 +489,36 @@ def return_borrowed_item(copy_id, return_branch_id=None):
             "to_branch": original_branch_id,
             "transfer_date": datetime.now(),
             "status": TransferStatus.PENDING.value,
+            # the item's available_copies goes up when the transfer completes
+            "counted_on_arrival": True,
         }
         transfers_collection.insert_one(transfer)
-    else:
-        # Check for reservations for this item in the branch
-        reservation = reservations_collection.find_one(
-            {
-                "item_id": item_id,
-                "branch_id": original_branch_id,
-            }
+        apply_route_changes(
+            [route_change(return_branch_id, original_branch_id, pending=1)]
         )
 
-        item = items_collection.find_one({"_id": ObjectId(item_id)})
-        if reservation:
-
-            # Create a notification for the member
-            notification = {
-                "notification_id": f"NTF{notifications_collection.count_documents({}) + 1:04d}",
-                "member_id": reservation["member_id"],
-                "message": f"The item '{item['title']}' you reserved is now available at branch.",
-                "date": datetime.now(),
-                "status": "unread",
-            }
-            notifications_collection.insert_one(notification)
-
-            # Update reservation status
-            reservations_collection.update_one(
-                {"_id": ObjectId(reservation["_id"])},
-                {"$set": {"status": "notified"}},
-            )
-
     copies_collection.update_one({"_id": copy_id}, {"$set": copy_update})
+    if copy_update["status"] == ItemCopyStatus.AVAILABLE.value:
+        # back on its own branch's shelf, a copy returned elsewhere only counts
+        # as available again once its transfer completes
+        items_collection.update_one({"_id": item_id}, {"$inc": {"available_copies": 1}})
+        apply_availability_changes(
+            [availability_change(item_id, original_branch_id, available=1)]
+        )
+        # hold it for the member at the head of the reservation queue
+        pop_and_notify({(item_id, original_branch_id): 1})
 
     # Create a transaction record for the return
     transaction_date = {
         "member_id": member_id,
         "item_id": item_id,
         "copy_id": copy_id,
-        "transaction_type": "returned",
-        "paid_amount": late_fee,  # Add the late fee as paid amount
+        "transaction_type": TransactionType.RETURN.value,
+        "paid_amount": paid_amount,  # late fee less any waiver on the loan
         "return_branch_id": return_branch_id,
     }
     create_transaction(transaction_date)
 
-    # Increment available copies in the library_items collection
-    items_collection.update_one({"_id": item_id}, {"$inc": {"available_copies": 1}})
-
     return {
         "status": "success",
         "message": f"Item returned successfully.",
@@ -390,6 +527,11 @@ def return_borrowed_item(copy_id, return_branch_id=None):
 
 def filter_copies_by_rfid(rfid):
     try:
+        # refresh the borrower's late fees before showing the return screen
+        borrowed_copy = copies_collection.find_one({"rfid": rfid}, {"borrower_id": 1})
+        if borrowed_copy and borrowed_copy.get("borrower_id"):
+            recalculate_member_fees(borrowed_copy["borrower_id"])
+
         copies = copies_collection.aggregate(
             [
                 {"$match": {"rfid": rfid}},
@@ -401,25 +543,12 @@ def filter_copies_by_rfid(rfid):
                         "as": "library_item",
                     }
                 },
-                {"$unwind": "$library_item"},
-                {
-                    "$lookup": {
-                        "from": branches_collection.name,
-                        "localField": "original_branch_id",
-                        "foreignField": "_id",
-                        "as": "original_branch",
-                    }
-                },
-                {"$unwind": "$original_branch"},
                 {
-                    "$lookup": {
-                        "from": branches_collection.name,
-                        "localField": "current_branch_id",
-                        "foreignField": "_id",
-                        "as": "current_branch",
+                    "$unwind": {
+                        "path": "$library_item",
+                        "preserveNullAndEmptyArrays": True,
                     }
                 },
-                {"$unwind": "$current_branch"},
                 {
                     "$lookup": {
                         "from": members_collection.name,
@@ -446,15 +575,32 @@ def filter_copies_by_rfid(rfid):
         )
         copies = list(copies)
         copy = copies[0]
+        branch_cache.attach([copy], "original_branch_id", "original_branch")
+        branch_cache.attach([copy], "current_branch_id", "current_branch")
         return {"status": "success", "data": copy}
     except Exception as e:
         print(e)
         return {"status": "fail", "message": f"Error fetching copy : {str(e)}"}
 
 
-def get_all_transactions(branch_id=None, member_id=None):
+# columns rendered by the transactions templates
+TRANSACTION_LIST_PROJECTION = {
+    "transaction_id": 1,
+    "transaction_date": 1,
+    "transaction_type": 1,
+    "paid_amount": 1,
+    "member.member_id": 1,
+    "member.firstname": 1,
+    "member.lastname": 1,
+    "library_item.item_type": 1,
+    "library_item.title": 1,
+    "borrow_branch_id": 1,
+    "return_branch_id": 1,
+}
+
+
+def get_all_transactions(branch_id=None, member_id=None, after=None, page_size=None):
     filter = {}
-    sort = {"transaction_date": -1}
     if branch_id:
         branch_id = ObjectId(branch_id)
         filter = {
@@ -464,63 +610,61 @@ def get_all_transactions(branch_id=None, member_id=None):
         member_id = ObjectId(member_id)
         filter["member_id"] = member_id
 
-    result = transactions_collection.aggregate(
-        [
-            {"$match": filter},
-            {
-                "$lookup": {
-                    "from": members_collection.name,
-                    "localField": "member_id",
-                    "foreignField": "_id",
-                    "as": "member",
-                }
-            },
-            {"$unwind": "$member"},
-            {
-                "$lookup": {
-                    "from": items_collection.name,
-                    "localField": "item_id",
-                    "foreignField": "_id",
-                    "as": "library_item",
-                }
-            },
-            {"$unwind": "$library_item"},
-            {
-                "$lookup": {
-                    "from": copies_collection.name,
-                    "localField": "copy_id",
-                    "foreignField": "_id",
-                    "as": "copy",
-                }
-            },
-            {"$unwind": "$copy"},
-            {
-                "$lookup": {
-                    "from": "branches",
-                    "let": {
-                        "borrow_branch_id": "$borrow_branch_id",
-                        "return_branch_id": "$return_branch_id",
-                    },
-                    "pipeline": [
-                        {
-                            "$match": {
-                                "$expr": {
-                                    "$or": [
-                                        {"$eq": ["$_id", "$$borrow_branch_id"]},
-                                        {"$eq": ["$_id", "$$return_branch_id"]},
-                                    ]
-                                }
-                            }
-                        }
-                    ],
-                    "as": "branch_details",
+    try:
+        page_size = get_page_size(page_size)
+        # take the page off the (..., transaction_date, _id) indexes first and only
+        # join the rows that are shown; the unwinds keep unmatched rows so the
+        # page_size + 1 lookahead stays exact
+        result = transactions_collection.aggregate(
+            [
+                {"$match": keyset_filter(filter, after, "transaction_date")},
+                {"$sort": dict(keyset_sort("transaction_date"))},
+                {"$limit": page_size + 1},
+                {
+                    "$lookup": {
+                        "from": members_collection.name,
+                        "localField": "member_id",
+                        "foreignField": "_id",
+                        "as": "member",
+                    }
+                },
+                {"$unwind": {"path": "$member", "preserveNullAndEmptyArrays": True}},
+                {
+                    "$lookup": {
+                        "from": items_collection.name,
+                        "localField": "item_id",
+                        "foreignField": "_id",
+                        "as": "library_item",
+                    }
+                },
+                {
+                    "$unwind": {
+                        "path": "$library_item",
+                        "preserveNullAndEmptyArrays": True,
+                    }
+                },
+                {"$project": TRANSACTION_LIST_PROJECTION},
+            ]
+        )
+        transactions, next_cursor = paginate(result, page_size, "transaction_date")
+        for transaction in transactions:
+            # same shape the branches $lookup produced, in _id order
+            branch_ids = sorted(
+                {
+                    transaction.get("borrow_branch_id"),
+                    transaction.get("return_branch_id"),
                 }
-            },
-            {"$unwind": "$copy"},
-            {"$sort": sort},
-        ]
-    )
-    return list(result)
+                - {None}
+            )
+            transaction["branch_details"] = [
+                {"_id": branch["_id"], "name": branch["name"]}
+                for branch in map(branch_cache.get, branch_ids)
+                if branch
+            ]
+        return {"status": "success", "data": transactions, "next_cursor": next_cursor}
+    except Exception as e:
+        print(e)
+        return {"status": "fail", "message": f"Error fetching transactions : {str(e)}"}
 
 
 # delete a copy
@@ -543,6 +687,13 @@ def delete_copy(id):
             {"_id": ObjectId(copy["item_id"])},
             {"$inc": {"total_copies": -1, "available_copies": -1}},
         )
+        apply_availability_changes(
+            [
+                availability_change(
+                    copy["item_id"], copy["original_branch_id"], total=-1, available=-1
+                )
+            ]
+        )
 
         return {"status": "success", "message": "Copy removed successfully"}
     except Exception as e:
@@ -0,0 +1,536 @@
+from datetime import datetime, timedelta
+from bson import ObjectId
+from flask import current_app
+from pymongo import UpdateOne
+
+from app.services.availability_services import (
+    apply_availability_changes,
+    availability_change,
+)
+from app.services.reservation_services import pop_and_notify
+from app.utils.collections import (
+    copies_collection,
+    items_collection,
+    transfer_manifests_collection,
+    transfer_routes_collection,
+    transfers_collection,
+)
+from app.utils.branch_cache import branch_cache
+from app.utils.database import db
+from app.utils.enums import ItemCopyStatus, TransferManifestStatus, TransferStatus
+
+# Transfer state machine, a copy returned at another branch goes
+#   pending (waiting at the return branch) -> in_transit -> completed (home again)
+# and its copy status follows along.
+TRANSFER_TRANSITIONS = {
+    TransferStatus.PENDING.value: {TransferStatus.IN_TRANSIT.value},
+    TransferStatus.IN_TRANSIT.value: {TransferStatus.COMPLETED.value},
+    TransferStatus.COMPLETED.value: set(),
+}
+
+COPY_STATUS_FOR_TRANSFER = {
+    TransferStatus.PENDING.value: ItemCopyStatus.AT_OTHER_BRANCH.value,
+    TransferStatus.IN_TRANSIT.value: ItemCopyStatus.IN_TRANSIT.value,
+    TransferStatus.COMPLETED.value: ItemCopyStatus.AVAILABLE.value,
+}
+
+
+def _transition_filter(to_status):
+    """Status condition that only matches transfers allowed to move to `to_status`."""
+    sources = [
+        status
+        for status, targets in TRANSFER_TRANSITIONS.items()
+        if to_status in targets
+    ]
+    return {"status": {"$in": sources}}
+
+
+# transfer_routes keeps one row per (from_branch, to_branch) with the number of
+# pending and in-transit transfers, so the transfer pages never count transfers
+
+
+def route_change(from_branch, to_branch, pending=0, in_transit=0):
+    """Upsert op adding to the backlog counters of a route."""
+    return UpdateOne(
+        {"from_branch": ObjectId(from_branch), "to_branch": ObjectId(to_branch)},
+        {
+            "$inc": {"pending": pending, "in_transit": in_transit},
+            "$set": {"updated_at": datetime.now()},
+        },
+        upsert=True,
+    )
+
+
+def apply_route_changes(changes, session=None):
+    if changes:
+        transfer_routes_collection.bulk_write(changes, ordered=False, session=session)
+
+
+def _count_routes(transfers):
+    routes = {}
+    for transfer in transfers:
+        key = (transfer["from_branch"], transfer["to_branch"])
+        routes[key] = routes.get(key, 0) + 1
+    return routes
+
+
+def rebuild_transfer_routes():
+    """Recount the route backlog from the transfers, for backfills and repairs."""
+    transfer_routes_collection.delete_many({})
+    transfers_collection.aggregate(
+        [
+            {
+                "$match": {
+                    "status": {
+                        "$in": [
+                            TransferStatus.PENDING.value,
+                            TransferStatus.IN_TRANSIT.value,
+                        ]
+                    }
+                }
+            },
+            {
+                "$group": {
+                    "_id": {"from_branch": "$from_branch", "to_branch": "$to_branch"},
+                    "pending": {
+                        "$sum": {
+                            "$cond": [
+                                {"$eq": ["$status", TransferStatus.PENDING.value]},
+                                1,
+                                0,
+                            ]
+                        }
+                    },
+                    "in_transit": {
+                        "$sum": {
+                            "$cond": [
+                                {"$eq": ["$status", TransferStatus.IN_TRANSIT.value]},
+                                1,
+                                0,
+                            ]
+                        }
+                    },
+                }
+            },
+            {
+                "$project": {
+                    "_id": 0,
+                    "from_branch": "$_id.from_branch",
+                    "to_branch": "$_id.to_branch",
+                    "pending": 1,
+                    "in_transit": 1,
+                    "updated_at": "$$NOW",
+                }
+            },
+            {
+                "$merge": {
+                    "into": transfer_routes_collection.name,
+                    "on": ["from_branch", "to_branch"],
+                    "whenMatched": "replace",
+                    "whenNotMatched": "insert",
+                }
+            },
+        ]
+    )
+    return transfer_routes_collection.count_documents({})
+
+
+def init_transfer_routes():
+    """Backfill the route backlog the first time the app starts on existing data."""
+    if transfer_routes_collection.find_one({}, {"_id": 1}):
+        return
+    if transfers_collection.find_one({}, {"_id": 1}):
+        rebuild_transfer_routes()
+
+
+def initiate_transfers(transfer_ids, from_branch=None, manifest=None):
+    """pending -> in_transit for a batch, the copies leave the return branch.
+
+    Runs in one transaction so a transfer never ends up in transit with its
+    copy still on the shelf. With `manifest` the manifest document is created
+    in the same transaction and the transfers are tagged with it. Returns the
+    number of transfers initiated.
+    """
+    status = TransferStatus.IN_TRANSIT.value
+    filter = {"_id": {"$in": [ObjectId(id) for id in transfer_ids]}}
+    if from_branch:
+        filter["from_branch"] = ObjectId(from_branch)
+
+    def write(session):
+        transfers = list(
+            transfers_collection.find(
+                {**filter, **_transition_filter(status)},
+                {"copy_id": 1, "from_branch": 1, "to_branch": 1},
+                session=session,
+            )
+        )
+        if not transfers:
+            return 0
+        update = {"status": status, "initiated_on": datetime.now()}
+        if manifest is not None:
+            manifest["transfer_count"] = len(transfers)
+            update["manifest_id"] = transfer_manifests_collection.insert_one(
+                manifest, session=session
+            ).inserted_id
+        transfers_collection.update_many(
+            {
+                "_id": {"$in": [transfer["_id"] for transfer in transfers]},
+                **_transition_filter(status),
+            },
+            {"$set": update},
+            session=session,
+        )
+        apply_route_changes(
+            [
+                route_change(from_branch, to_branch, pending=-count, in_transit=count)
+                for (from_branch, to_branch), count in _count_routes(transfers).items()
+            ],
+            session=session,
+        )
+        copies_collection.update_many(
+            {
+                "_id": {"$in": [transfer["copy_id"] for transfer in transfers]},
+                "status": COPY_STATUS_FOR_TRANSFER[TransferStatus.PENDING.value],
+            },
+            {"$set": {"status": COPY_STATUS_FOR_TRANSFER[status]}},
+            session=session,
+        )
+        return len(transfers)
+
+    with db.start_session() as session:
+        return session.with_transaction(write)
+
+
+def initiate_transfer(transfer_id, copy_id):
+    try:
+        # the copy id guards against a stale transfer link
+        transfer = transfers_collection.find_one(
+            {"_id": ObjectId(transfer_id), "copy_id": ObjectId(copy_id)}, {"_id": 1}
+        )
+        if not transfer or not initiate_transfers([transfer["_id"]]):
+            return {"status": "fail", "message": "No pending transfer found"}
+        return {"status": "success", "message": "Item transfer initiated successfully"}
+    except Exception as e:
+        print(e)
+        return {"status": "fail", "message": f"Error transfering item : {str(e)}"}
+
+
+# fields _complete_transfers needs from each transfer
+COMPLETION_PROJECTION = {
+    "copy_id": 1,
+    "item_id": 1,
+    "from_branch": 1,
+    "to_branch": 1,
+    "counted_on_arrival": 1,
+    "manifest_id": 1,
+}
+
+
+def _complete_transfers(transfers, completed_via, session):
+    status = TransferStatus.COMPLETED.value
+    completion_id = ObjectId()  # tells our completions apart from a concurrent run
+    transfers_collection.bulk_write(
+        [
+            UpdateOne(
+                {"_id": transfer["_id"], **_transition_filter(status)},
+                {
+                    "$set": {
+                        "status": status,
+                        "completed_on": datetime.now(),
+                        "completed_via": completed_via,
+                        "completion_id": completion_id,
+                    }
+                },
+            )
+            for transfer in transfers
+        ],
+        ordered=False,
+        session=session,
+    )
+    # only move the copies of the transfers this call completed
+    done = {
+        transfer["_id"]
+        for transfer in transfers_collection.find(
+            {
+                "_id": {"$in": [transfer["_id"] for transfer in transfers]},
+                "completion_id": completion_id,
+            },
+            {"_id": 1},
+            session=session,
+        )
+    }
+    transfers = [transfer for transfer in transfers if transfer["_id"] in done]
+    if not transfers:
+        return 0
+
+    apply_route_changes(
+        [
+            route_change(from_branch, to_branch, in_transit=-count)
+            for (from_branch, to_branch), count in _count_routes(transfers).items()
+        ],
+        session=session,
+    )
+    copies_collection.bulk_write(
+        [
+            UpdateOne(
+                {"_id": transfer["copy_id"], "status": ItemCopyStatus.IN_TRANSIT.value},
+                {
+                    "$set": {
+                        "status": COPY_STATUS_FOR_TRANSFER[status],
+                        "current_branch_id": transfer["to_branch"],
+                    }
+                },
+            )
+            for transfer in transfers
+        ],
+        ordered=False,
+        session=session,
+    )
+
+    # the copies count as available again, at home and on the item. Transfers
+    # created before counted_on_arrival existed already gave the item its copy
+    # back when it was returned, only their branch row is restored here
+    arrivals, per_item = {}, {}
+    for transfer in transfers:
+        key = (transfer["item_id"], transfer["to_branch"])
+        arrivals[key] = arrivals.get(key, 0) + 1
+        if transfer.get("counted_on_arrival"):
+            per_item[transfer["item_id"]] = per_item.get(transfer["item_id"], 0) + 1
+    apply_availability_changes(
+        [
+            availability_change(item_id, branch_id, available=count)
+            for (item_id, branch_id), count in arrivals.items()
+        ],
+        session=session,
+    )
+    if per_item:
+        items_collection.bulk_write(
+            [
+                UpdateOne({"_id": item_id}, {"$inc": {"available_copies": count}})
+                for item_id, count in per_item.items()
+            ],
+            ordered=False,
+            session=session,
+        )
+    pop_and_notify(arrivals, session=session)
+
+    # a manifest whose copies were scanned in one by one or auto-completed is
+    # received once none of its transfers is still in transit
+    manifest_ids = {
+        transfer["manifest_id"] for transfer in transfers if transfer.get("manifest_id")
+    }
+    if manifest_ids:
+        in_transit = transfers_collection.distinct(
+            "manifest_id",
+            {
+                "manifest_id": {"$in": list(manifest_ids)},
+                "status": TransferStatus.IN_TRANSIT.value,
+            },
+            session=session,
+        )
+        transfer_manifests_collection.update_many(
+            {
+                "_id": {"$in": list(manifest_ids - set(in_transit))},
+                "status": TransferManifestStatus.IN_TRANSIT.value,
+            },
+            {
+                "$set": {
+                    "status": TransferManifestStatus.RECEIVED.value,
+                    "received_on": datetime.now(),
+                }
+            },
+            session=session,
+        )
+    return len(transfers)
+
+
+def complete_transfers(transfers, completed_via):
+    """in_transit -> completed for a batch of transfers, in one transaction.
+
+    Copies go back on their home branch's shelf, the item and branch counters
+    are restored and waiting reservations are notified. Returns the number of
+    transfers completed, one someone else already completed is skipped.
+    """
+    if not transfers:
+        return 0
+    with db.start_session() as session:
+        return session.with_transaction(
+            lambda session: _complete_transfers(transfers, completed_via, session)
+        )
+
+
+def receive_transfer(rfid, branch_id):
+    """Destination branch scanned an arriving copy, complete its transfer now."""
+    try:
+        branch_id = ObjectId(branch_id)
+        copy = copies_collection.find_one({"rfid": rfid}, {"status": 1})
+        if not copy:
+            return {"status": "fail", "message": "Copy not found"}
+
+        transfer = transfers_collection.find_one(
+            {
+                "copy_id": copy["_id"],
+                "status": TransferStatus.IN_TRANSIT.value,
+            }
+        )
+        if not transfer:
+            return {"status": "fail", "message": "This copy is not in transit"}
+        if transfer["to_branch"] != branch_id:
+            return {
+                "status": "fail",
+                "message": "This copy is in transit to another branch",
+            }
+
+        if not complete_transfers([transfer], completed_via="scan"):
+            return {"status": "fail", "message": "Transfer already completed"}
+        return {"status": "success", "message": "Item received and available"}
+    except Exception as e:
+        print(e)
+        return {"status": "fail", "message": f"Error receiving item : {str(e)}"}
+
+
+def complete_overdue_transfers(batch_size=None):
+    """Scheduled fallback completing transfers nobody scanned in on arrival."""
+    batch_size = batch_size or current_app.config["TRANSFER_BATCH_SIZE"]
+    cutoff = datetime.now() - timedelta(
+        hours=current_app.config["TRANSFER_AUTO_COMPLETE_HOURS"]
+    )
+    completed = 0
+    while True:
+        transfers = list(
+            transfers_collection.find(
+                {
+                    "status": TransferStatus.IN_TRANSIT.value,
+                    "initiated_on": {"$lt": cutoff},
+                },
+                COMPLETION_PROJECTION,
+            ).limit(batch_size)
+        )
+        if not transfers:
+            break
+        completed += complete_transfers(transfers, completed_via="auto")
+        if len(transfers) < batch_size:
+            break
+    return {"completed": completed}
+
+
+def get_transfer_routes(branch_id):
+    """Backlog per route out of and into a branch, read from transfer_routes."""
+    branch_id = ObjectId(branch_id)
+    try:
+        outgoing = list(
+            transfer_routes_collection.find(
+                {"from_branch": branch_id, "pending": {"$gt": 0}}
+            ).sort("pending", -1)
+        )
+        incoming = list(
+            transfer_manifests_collection.find(
+                {
+                    "to_branch": branch_id,
+                    "status": TransferManifestStatus.IN_TRANSIT.value,
+                }
+            ).sort("shipped_on", 1)
+        )
+        for route in outgoing:
+            route["to_branch_name"] = branch_cache.name(route["to_branch"])
+        for manifest in incoming:
+            manifest["from_branch_name"] = branch_cache.name(manifest["from_branch"])
+        return {"status": "success", "outgoing": outgoing, "incoming": incoming}
+    except Exception as e:
+        print(e)
+        return {
+            "status": "fail",
+            "message": f"Error fetching transfer routes : {str(e)}",
+        }
+
+
+def ship_route(from_branch, to_branch, shipped_by=None):
+    """Put every pending transfer of a route (up to MANIFEST_MAX_SIZE) on one
+    manifest and send it in transit in a single bulk transition."""
+    try:
+        from_branch = ObjectId(from_branch)
+        to_branch = ObjectId(to_branch)
+        transfer_ids = [
+            transfer["_id"]
+            for transfer in transfers_collection.find(
+                {
+                    "from_branch": from_branch,
+                    "to_branch": to_branch,
+                    "status": TransferStatus.PENDING.value,
+                },
+                {"_id": 1},
+            ).limit(current_app.config["MANIFEST_MAX_SIZE"])
+        ]
+        if not transfer_ids:
+            return {"status": "fail", "message": "Nothing pending on this route"}
+
+        now = datetime.now()
+        manifest = {
+            "from_branch": from_branch,
+            "to_branch": to_branch,
+            "status": TransferManifestStatus.IN_TRANSIT.value,
+            "shipped_on": now,
+            "shipped_by": shipped_by,
+            "created_at": now,
+        }
+        shipped = initiate_transfers(transfer_ids, from_branch, manifest=manifest)
+        if not shipped:
+            return {"status": "fail", "message": "Nothing pending on this route"}
+        return {
+            "status": "success",
+            "message": f"Manifest shipped with {shipped} item(s)",
+        }
+    except Exception as e:
+        print(e)
+        return {"status": "fail", "message": f"Error shipping manifest : {str(e)}"}
+
+
+def receive_manifest(manifest_id, branch_id, received_by=None):
+    """Destination branch received a whole crate, complete all its transfers."""
+    try:
+        manifest = transfer_manifests_collection.find_one(
+            {
+                "_id": ObjectId(manifest_id),
+                "to_branch": ObjectId(branch_id),
+                "status": TransferManifestStatus.IN_TRANSIT.value,
+            }
+        )
+        if not manifest:
+            return {"status": "fail", "message": "Manifest not found"}
+
+        batch_size = current_app.config["TRANSFER_BATCH_SIZE"]
+        received = 0
+        while True:
+            transfers = list(
+                transfers_collection.find(
+                    {
+                        "manifest_id": manifest["_id"],
+                        "status": TransferStatus.IN_TRANSIT.value,
+                    },
+                    COMPLETION_PROJECTION,
+                ).limit(batch_size)
+            )
+            if not transfers:
+                break
+            received += complete_transfers(transfers, completed_via="manifest")
+            if len(transfers) < batch_size:
+                break
+
+        transfer_manifests_collection.update_one(
+            {"_id": manifest["_id"]},
+            {
+                "$set": {
+                    "status": TransferManifestStatus.RECEIVED.value,
+                    "received_on": datetime.now(),
+                    "received_by": received_by,
+                    "received_count": received,
+                }
+            },
+        )
+        return {
+            "status": "success",
+            "message": f"Manifest received, {received} item(s) available",
+        }
+    except Exception as e:
+        print(e)
+        return {"status": "fail", "message": f"Error receiving manifest : {str(e)}"}
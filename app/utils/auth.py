@@ -2,39 +2,115 @@ from bson import ObjectId
 from flask_login import UserMixin, current_user
 from app import login_manager
 
+from .branch_cache import branch_cache
+from .cache import TTLCache, VersionStamp
 from .database import db
 
+ROLES = ["admin", "staff", "member"]
+
+# per-process cache of loaded users, keyed by session identity ("role:id"),
+# entries are (stamp version, user) and are dropped once another process has
+# bumped the shared "users" stamp, so a disabled or demoted account is not
+# served from any worker for longer than USER_CACHE_CHECK seconds
+user_cache = TTLCache(maxsize=2048, ttl=60)
+users_stamp = VersionStamp("users", "USER_CACHE_CHECK")
+# a cached member keeps the unread count it was loaded with and re-reads just
+# the count once any process bumped the "notifications" stamp
+notifications_stamp = VersionStamp("notifications", "NOTIFICATION_BADGE_CHECK")
+
 
 class User(UserMixin):
+    # navbar badge, only members have notifications
+    unread_notifications = 0
+
     def __init__(self, user_id, fullname, role):
         self.id = user_id
         self.fullname = fullname
         self.role = role
 
+    def get_id(self):
+        # encode the role in the session so load_user only queries one collection
+        return f"{self.role}:{self.id}"
+
     def add_attribute(self, key, value):
         """Add a custom attribute to the User object dynamically."""
         setattr(self, key, value)
 
 
+def invalidate_user(user_id, role):
+    """Drop a cached user after its profile, status or branch changed."""
+    users_stamp.bump()
+    user_cache.invalidate(f"{role}:{user_id}")
+
+
+def invalidate_all_users():
+    users_stamp.bump()
+    user_cache.clear()
+
+
+def invalidate_unread_counts():
+    """Have every process re-read the cached members' unread counts."""
+    notifications_stamp.bump()
+
+
+def _refresh_unread_notifications(user):
+    version = notifications_stamp.current()
+    if user.unread_version == version:
+        return
+    member = db.get_collection("member").find_one(
+        {"_id": ObjectId(user.id)}, {"unread_notifications": 1}
+    )
+    user.unread_notifications = (member or {}).get("unread_notifications") or 0
+    user.unread_version = version
+
+
+def _load_user_from_collection(role, user_id):
+    # read before the member so a count changed meanwhile is picked up later
+    unread_version = notifications_stamp.current() if role == "member" else None
+    user_collection = db.get_collection(role)
+    user_data = user_collection.find_one({"_id": ObjectId(user_id)})
+    if not user_data:
+        return None
+
+    fullname = (
+        user_data["fullname"]
+        if role == "admin"
+        else f"{user_data['firstname']} {user_data['lastname']}"
+    )
+    user = User(str(user_data["_id"]), fullname, user_data["role"])
+    if role == "staff":
+        user.add_attribute("branch_id", user_data.get("branch_id", ""))
+        user.add_attribute("branch_name", branch_cache.name(user_data["branch_id"]))
+    elif role == "member":
+        user.add_attribute(
+            "unread_notifications", user_data.get("unread_notifications") or 0
+        )
+        user.add_attribute("unread_version", unread_version)
+    return user
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    # Load user based on the role-specific collection
-    for role in ["admin", "staff", "member"]:
-        user_collection = db.get_collection(role)
-        user_data = user_collection.find_one({"_id": ObjectId(user_id)})
-        if user_data:
-            fullname = (
-                user_data["fullname"]
-                if role == "admin"
-                else f"{user_data['firstname']} {user_data['lastname']}"
-            )
-            user = User(str(user_data["_id"]), fullname, user_data["role"])
-            if role == "staff":
-                branch_collection = db.get_collection("branches")
-                branch_data = branch_collection.find_one(
-                    {"_id": ObjectId(user_data["branch_id"])}
-                )
-                user.add_attribute("branch_id", user_data.get("branch_id", ""))
-                user.add_attribute("branch_name", branch_data["name"])
+    if ":" in user_id:
+        role, user_id = user_id.split(":", 1)
+        if role not in ROLES:
+            return None
+        roles = [role]
+    else:
+        # sessions created before the role was encoded in the identity
+        roles = ROLES
+
+    version = users_stamp.current()
+    for role in roles:
+        key = f"{role}:{user_id}"
+        cached = user_cache.get(key)
+        if cached and cached[0] == version:
+            user = cached[1]
+            if role == "member":
+                _refresh_unread_notifications(user)
+            return user
+        user = _load_user_from_collection(role, user_id)
+        if user:
+            user_cache.set(key, (version, user))
             return user
     return None
@@ -0,0 +1,72 @@
+import threading
+
+from bson import ObjectId
+
+from .cache import VersionStamp
+from .database import db
+
+
+class BranchCache:
+    """Per-process copy of the branches collection.
+
+    Branches are a handful of documents that change a few times a year, so
+    services resolve branch ids here instead of joining. Every branch write
+    bumps the "branches" version stamp; processes compare their copy's stamp
+    at most every BRANCH_CACHE_CHECK seconds and reload on a mismatch.
+    """
+
+    def __init__(self):
+        self.stamp = VersionStamp("branches", "BRANCH_CACHE_CHECK")
+        self._lock = threading.Lock()
+        self._branches = None
+        self._version = None
+
+    def all(self):
+        """Every branch (active or not) keyed by _id."""
+        # read the stamp before the documents, a write racing the reload
+        # leaves an older stamp behind and is picked up on the next check
+        version = self.stamp.current()
+        if self._branches is not None and version == self._version:
+            return self._branches
+
+        with self._lock:
+            if self._branches is None or version != self._version:
+                self._branches = {
+                    branch["_id"]: branch
+                    for branch in db.get_collection("branches").find({})
+                }
+                self._version = version
+            return self._branches
+
+    def get(self, branch_id):
+        if not branch_id:
+            return None
+        try:
+            return self.all().get(ObjectId(branch_id))
+        except Exception:
+            return None
+
+    def name(self, branch_id, default=""):
+        branch = self.get(branch_id)
+        return branch["name"] if branch else default
+
+    def active(self):
+        return [branch for branch in self.all().values() if branch.get("is_active")]
+
+    def attach(self, rows, field, as_field):
+        """Set row[as_field] to the branch of row[field], in place of a $lookup."""
+        for row in rows:
+            row[as_field] = self.get(row.get(field)) or {
+                "_id": row.get(field),
+                "name": "",
+            }
+        return rows
+
+    def invalidate(self):
+        """Call after any branch write, other processes reload on their next check."""
+        self.stamp.bump()
+        with self._lock:
+            self._branches = None
+
+
+branch_cache = BranchCache()
@@ -0,0 +1,22 @@
+from itertools import islice
+
+
+def bulk_write_in_batches(collection, operations, batch_size=1000, session=None):
+    """Run write operations as unordered bulk_write calls of `batch_size` ops.
+
+    `operations` can be any iterable (e.g. a generator over a cursor) so the
+    whole set never has to be held in memory. Returns matched/modified/
+    upserted counts and the number of batches sent.
+    """
+    report = {"matched": 0, "modified": 0, "upserted": 0, "batches": 0}
+    operations = iter(operations)
+    while True:
+        batch = list(islice(operations, batch_size))
+        if not batch:
+            break
+        result = collection.bulk_write(batch, ordered=False, session=session)
+        report["matched"] += result.matched_count
+        report["modified"] += result.modified_count
+        report["upserted"] += result.upserted_count
+        report["batches"] += 1
+    return report
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from pymongo import ReturnDocument
+
+from .database import db
+
+
+class TTLCache:
+    """Small per-process LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class VersionStamp:
+    """Version counter in `cache_versions` shared by every process.
+
+    Writers bump() it after changing the cached data, per-process caches keep
+    the version they loaded and compare it with current(), which reads the
+    stamp at most every `config[check_setting]` seconds.
+    """
+
+    def __init__(self, stamp_id, check_setting):
+        self.stamp_id = stamp_id
+        self.check_setting = check_setting
+        self._version = None
+        self._checked_at = 0.0
+
+    def _check_interval(self):
+        try:
+            return current_app.config[self.check_setting]
+        except RuntimeError:
+            # CLI scripts and benchmarks outside an app context always check
+            return 0
+
+    def current(self):
+        now = time.monotonic()
+        if self._version is None or now - self._checked_at >= self._check_interval():
+            stamp = db.get_collection("cache_versions").find_one({"_id": self.stamp_id})
+            self._version = stamp["version"] if stamp else 0
+            self._checked_at = now
+        return self._version
+
+    def bump(self):
+        """Move the stamp on and return the new version, which this process
+        sees straight away."""
+        stamp = db.get_collection("cache_versions").find_one_and_update(
+            {"_id": self.stamp_id},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._version = stamp["version"]
+        self._checked_at = time.monotonic()
+        return self._version
@@ -9,10 +9,17 @@ branches_collection = db.get_collection("branches")
 types_collection = db.get_collection("library_item_types")
 items_collection = db.get_collection("library_items")
 copies_collection = db.get_collection("copies")
+availability_collection = db.get_collection("item_branch_availability")
 
 borrowed_collection = db.get_collection("borrowed_items")
+fee_ledger_collection = db.get_collection("fee_ledger")
 reservations_collection = db.get_collection("reservations")
 
 transfers_collection = db.get_collection("transfers")
+transfer_manifests_collection = db.get_collection("transfer_manifests")
+transfer_routes_collection = db.get_collection("transfer_routes")
 transactions_collection = db.get_collection("transactions")
 notifications_collection = db.get_collection("notifications")
+notification_outbox_collection = db.get_collection("notification_outbox")
+
+jobs_collection = db.get_collection("job_runs")
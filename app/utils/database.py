@@ -1,6 +1,8 @@
 from flask_pymongo import PyMongo
 from flask import current_app
 
+from app.utils.profiler import profiler
+
 class Database:
     def __init__(self, app=None):
         self.mongo = None
@@ -9,7 +11,10 @@ class Database:
 
     def init_app(self, app):
         """Initialize the database connection with the Flask app."""
-        self.mongo = PyMongo(app).db
+        listeners = []
+        if app.config.get("DB_PROFILER_ENABLED"):
+            listeners.append(profiler)
+        self.mongo = PyMongo(app, event_listeners=listeners).db
 
     def get_collection(self, collection_name):
         """Retrieve a specific collection."""
@@ -17,5 +22,11 @@ class Database:
             raise Exception("Database connection is not initialized.")
         return self.mongo[collection_name]
 
+    def start_session(self):
+        """Start a client session, used for multi-document transactions."""
+        if self.mongo is None:
+            raise Exception("Database connection is not initialized.")
+        return self.mongo.client.start_session()
+
 # Initialize the Database instance
 db = Database()
@@ -30,7 +30,7 @@ class MemberStatus(Enum):
 
 class TransactionType(Enum):
     BORROW = "borrow"
-    RETURN = "return"
+    RETURN = "returned"  # the value return transactions have always been stored with
 
 
 class TransferStatus(Enum):
@@ -39,6 +39,30 @@ class TransferStatus(Enum):
     COMPLETED = "completed"
 
 
+class ReservationStatus(Enum):
+    ACTIVE = "active"  # waiting in the queue
+    NOTIFIED = "notified"  # a copy is held for the member until hold_expires
+    EXPIRED = "expired"  # hold ran out, the next member in line was notified
+
+
+class NotificationOutboxStatus(Enum):
+    PENDING = "pending"  # waiting for the delivery worker (or a retry)
+    PROCESSING = "processing"  # claimed by a worker run
+    DELIVERED = "delivered"  # every channel succeeded
+    FAILED = "failed"  # gave up after NOTIFICATION_MAX_ATTEMPTS
+
+
+class TransferManifestStatus(Enum):
+    IN_TRANSIT = "in_transit"
+    RECEIVED = "received"
+
+
 class BorrowedItemStatus(Enum):
     IN_HAND = "in_hand"
     RETURNED = "returned"
+
+
+class FeeLedgerEntryType(Enum):
+    ACCRUAL = "accrual"
+    PAYMENT = "payment"
+    WAIVER = "waiver"
@@ -0,0 +1,467 @@
+from bson import ObjectId
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, errors
+
+from app.utils.enums import (
+    FeeLedgerEntryType,
+    ItemCopyStatus,
+    NotificationOutboxStatus,
+    ReservationStatus,
+    TransferManifestStatus,
+    TransferStatus,
+)
+
+# Declarative index registry, one entry per collection in app/utils/collections.py
+INDEXES = {
+    "admin": [
+        IndexModel([("username", ASCENDING)], name="username", unique=True),
+    ],
+    "staff": [
+        IndexModel([("staff_id", ASCENDING)], name="staff_id", unique=True),
+        IndexModel([("is_active", ASCENDING), ("_id", DESCENDING)], name="active"),
+    ],
+    "member": [
+        IndexModel([("member_id", ASCENDING)], name="member_id", unique=True),
+        IndexModel(
+            [("status", ASCENDING), ("created_at", DESCENDING)], name="status_created"
+        ),
+    ],
+    "branches": [
+        IndexModel([("branch_id", ASCENDING), ("is_active", ASCENDING)], name="branch"),
+        IndexModel([("staff_id", ASCENDING)], name="staff"),
+        IndexModel([("is_active", ASCENDING), ("_id", DESCENDING)], name="active"),
+    ],
+    "library_item_types": [],
+    "library_items": [
+        IndexModel([("id", ASCENDING)], name="item_id"),
+        IndexModel(
+            [("item_type", ASCENDING), ("is_active", ASCENDING), ("_id", DESCENDING)],
+            name="type_active",
+        ),
+        IndexModel(
+            [
+                ("title", TEXT),
+                ("author", TEXT),
+                ("director", TEXT),
+                ("categories", TEXT),
+                ("id", TEXT),
+            ],
+            weights={"title": 10, "id": 10, "author": 5, "director": 5},
+            name="catalog_text",
+        ),
+        IndexModel([("categories", ASCENDING)], name="categories"),
+    ],
+    "copies": [
+        IndexModel([("rfid", ASCENDING)], name="rfid", unique=True),
+        IndexModel(
+            [
+                ("item_id", ASCENDING),
+                ("original_branch_id", ASCENDING),
+                ("status", ASCENDING),
+            ],
+            name="item_branch_status",
+        ),
+        IndexModel(
+            [
+                ("original_branch_id", ASCENDING),
+                ("status", ASCENDING),
+                ("item_id", ASCENDING),
+            ],
+            name="branch_status_item",
+        ),
+    ],
+    "item_branch_availability": [
+        IndexModel(
+            [("item_id", ASCENDING), ("branch_id", ASCENDING)],
+            name="item_branch",
+            unique=True,
+        ),
+        IndexModel(
+            [
+                ("branch_id", ASCENDING),
+                ("item_type", ASCENDING),
+                ("item_id", ASCENDING),
+            ],
+            name="branch_type",
+        ),
+    ],
+    "borrowed_items": [
+        IndexModel([("returned", ASCENDING), ("due_date", ASCENDING)], name="open_due"),
+        IndexModel(
+            [("returned", ASCENDING), ("delayed_days", ASCENDING)], name="open_delayed"
+        ),
+        IndexModel([("copy_id", ASCENDING), ("returned", ASCENDING)], name="copy"),
+        IndexModel(
+            [
+                ("member_id", ASCENDING),
+                ("returned", ASCENDING),
+                ("item_id", ASCENDING),
+            ],
+            name="member",
+        ),
+    ],
+    "fee_ledger": [
+        IndexModel(
+            [("member_id", ASCENDING), ("created_at", DESCENDING)], name="member"
+        ),
+        IndexModel(
+            [("borrowed_id", ASCENDING), ("entry_type", ASCENDING)], name="loan"
+        ),
+    ],
+    "reservations": [
+        # FIFO queue per (item, branch), the head is a single index seek
+        IndexModel(
+            [
+                ("item_id", ASCENDING),
+                ("branch_id", ASCENDING),
+                ("status", ASCENDING),
+                ("reserved_date", ASCENDING),
+                ("_id", ASCENDING),
+            ],
+            name="queue",
+        ),
+        IndexModel(
+            [("status", ASCENDING), ("hold_expires", ASCENDING)], name="hold_expiry"
+        ),
+        IndexModel(
+            [
+                ("member_id", ASCENDING),
+                ("item_id", ASCENDING),
+                ("branch_id", ASCENDING),
+            ],
+            name="member_item_branch",
+        ),
+        IndexModel([("branch_id", ASCENDING)], name="branch"),
+    ],
+    "transfers": [
+        IndexModel(
+            [("status", ASCENDING), ("from_branch", ASCENDING)], name="status_from"
+        ),
+        IndexModel(
+            [("status", ASCENDING), ("initiated_on", ASCENDING)],
+            name="status_initiated",
+        ),
+        IndexModel([("status", ASCENDING), ("to_branch", ASCENDING)], name="status_to"),
+        IndexModel([("copy_id", ASCENDING), ("status", ASCENDING)], name="copy"),
+        IndexModel(
+            [
+                ("from_branch", ASCENDING),
+                ("to_branch", ASCENDING),
+                ("status", ASCENDING),
+            ],
+            name="route_status",
+        ),
+        IndexModel(
+            [("manifest_id", ASCENDING), ("status", ASCENDING)], name="manifest"
+        ),
+    ],
+    "transfer_routes": [
+        IndexModel(
+            [("from_branch", ASCENDING), ("to_branch", ASCENDING)],
+            name="route",
+            unique=True,
+        ),
+    ],
+    "transfer_manifests": [
+        IndexModel(
+            [
+                ("to_branch", ASCENDING),
+                ("status", ASCENDING),
+                ("shipped_on", ASCENDING),
+            ],
+            name="to_status",
+        ),
+        IndexModel(
+            [("from_branch", ASCENDING), ("status", ASCENDING)], name="from_status"
+        ),
+    ],
+    "transactions": [
+        # ids from before the sequence allocator (TXN%Y%m%d%H%M%S) repeat within
+        # a second, so uniqueness is only enforced on the allocator's TXN\d{10}
+        # ids through the seq number they are built from
+        IndexModel(
+            [("seq", ASCENDING)],
+            name="seq",
+            unique=True,
+            partialFilterExpression={"seq": {"$exists": True}},
+        ),
+        # _id is the keyset tie-breaker, so it has to be in the index for the
+        # (transaction_date, _id) sort to come straight off it
+        IndexModel(
+            [("transaction_date", DESCENDING), ("_id", DESCENDING)], name="date_id"
+        ),
+        IndexModel(
+            [
+                ("borrow_branch_id", ASCENDING),
+                ("transaction_date", DESCENDING),
+                ("_id", DESCENDING),
+            ],
+            name="borrow_branch_date_id",
+        ),
+        IndexModel(
+            [
+                ("return_branch_id", ASCENDING),
+                ("transaction_date", DESCENDING),
+                ("_id", DESCENDING),
+            ],
+            name="return_branch_date_id",
+        ),
+        IndexModel(
+            [
+                ("member_id", ASCENDING),
+                ("transaction_date", DESCENDING),
+                ("_id", DESCENDING),
+            ],
+            name="member_date_id",
+        ),
+    ],
+    "notifications": [
+        IndexModel([("member_id", ASCENDING), ("date", DESCENDING)], name="member"),
+    ],
+    "notification_outbox": [
+        IndexModel([("status", ASCENDING), ("next_attempt", ASCENDING)], name="due"),
+        # delivered entries are only kept around for a week of troubleshooting
+        IndexModel(
+            [("delivered_at", ASCENDING)],
+            name="delivered_ttl",
+            expireAfterSeconds=7 * 24 * 3600,
+        ),
+    ],
+    "job_runs": [],
+}
+
+
+def _query_shapes():
+    """The find/$match shapes issued by the services, with sample values."""
+    oid = ObjectId()
+    now = datetime.now()
+    available = ItemCopyStatus.AVAILABLE.value
+    deleted = ItemCopyStatus.DELETED.value
+    return [
+        ("admin", {"username": "admin"}, None),
+        ("staff", {"staff_id": "1001", "is_active": True}, None),
+        ("staff", {"is_active": True}, [("_id", -1)]),
+        ("member", {"member_id": "MEM1001", "status": "approved"}, None),
+        ("member", {"status": "approved"}, [("created_at", -1)]),
+        ("branches", {"branch_id": "B1", "is_active": True}, None),
+        ("branches", {"staff_id": oid}, None),
+        ("branches", {"is_active": True}, [("_id", -1)]),
+        ("library_items", {"item_type": "book", "is_active": True}, [("_id", -1)]),
+        (
+            "item_branch_availability",
+            {"branch_id": oid, "item_type": "book", "total_copies": {"$gt": 0}},
+            None,
+        ),
+        ("library_items", {"$text": {"$search": "history"}, "is_active": True}, None),
+        ("library_items", {"item_type": "book"}, None),
+        ("library_items", {"id": "B001"}, None),
+        ("copies", {"rfid": "RFID"}, None),
+        ("copies", {"rfid": "RFID", "status": available}, None),
+        ("copies", {"rfid": {"$in": ["RFID1", "RFID2"]}}, None),
+        ("copies", {"item_id": oid, "status": {"$ne": deleted}}, None),
+        (
+            "copies",
+            {"item_id": oid, "original_branch_id": oid, "status": {"$ne": deleted}},
+            None,
+        ),
+        ("copies", {"item_id": oid, "original_branch_id": oid}, None),
+        (
+            "copies",
+            {"original_branch_id": oid, "status": available},
+            [("item_id", 1)],
+        ),
+        (
+            "copies",
+            {"original_branch_id": oid, "status": {"$nin": [available, deleted]}},
+            None,
+        ),
+        ("borrowed_items", {"returned": False}, None),
+        ("borrowed_items", {"returned": False, "member_id": oid}, None),
+        (
+            "borrowed_items",
+            {
+                "returned": False,
+                "$or": [{"due_date": {"$lt": now}}, {"delayed_days": {"$gt": 0}}],
+            },
+            None,
+        ),
+        ("borrowed_items", {"copy_id": oid, "returned": False}, None),
+        ("borrowed_items", {"member_id": oid, "item_id": oid, "returned": False}, None),
+        ("fee_ledger", {"member_id": oid}, [("created_at", -1)]),
+        (
+            "fee_ledger",
+            {"borrowed_id": oid, "entry_type": FeeLedgerEntryType.ACCRUAL.value},
+            None,
+        ),
+        (
+            "fee_ledger",
+            {"borrowed_id": oid, "entry_type": FeeLedgerEntryType.WAIVER.value},
+            None,
+        ),
+        ("fee_ledger", {"borrowed_id": {"$in": [oid]}}, None),
+        (
+            "borrowed_items",
+            {"member_id": oid, "returned": False},
+            [("due_date", 1)],
+        ),
+        (
+            "reservations",
+            {
+                "item_id": oid,
+                "branch_id": oid,
+                "status": ReservationStatus.ACTIVE.value,
+            },
+            [("reserved_date", 1), ("_id", 1)],
+        ),
+        (
+            "reservations",
+            {
+                "status": ReservationStatus.NOTIFIED.value,
+                "hold_expires": {"$lt": now},
+            },
+            None,
+        ),
+        ("reservations", {"member_id": oid, "item_id": oid, "branch_id": oid}, None),
+        ("reservations", {"item_id": oid, "member_id": oid}, None),
+        ("reservations", {"member_id": oid}, None),
+        (
+            "reservations",
+            {
+                "member_id": oid,
+                "copy_id": {"$in": [oid]},
+                "status": ReservationStatus.NOTIFIED.value,
+            },
+            None,
+        ),
+        ("reservations", {"branch_id": oid}, None),
+        (
+            "transfers",
+            {"status": TransferStatus.PENDING.value, "from_branch": oid},
+            None,
+        ),
+        (
+            "transfers",
+            {
+                "status": TransferStatus.IN_TRANSIT.value,
+                "initiated_on": {"$lt": now},
+            },
+            None,
+        ),
+        (
+            "transfers",
+            {"status": TransferStatus.IN_TRANSIT.value, "to_branch": oid},
+            None,
+        ),
+        (
+            "transfers",
+            {"copy_id": oid, "status": TransferStatus.IN_TRANSIT.value},
+            None,
+        ),
+        (
+            "transfers",
+            {
+                "from_branch": oid,
+                "to_branch": oid,
+                "status": TransferStatus.PENDING.value,
+            },
+            None,
+        ),
+        ("transfer_routes", {"from_branch": oid, "pending": {"$gt": 0}}, None),
+        (
+            "transfer_manifests",
+            {"to_branch": oid, "status": TransferManifestStatus.IN_TRANSIT.value},
+            [("shipped_on", 1)],
+        ),
+        ("transactions", {}, [("transaction_date", -1), ("_id", -1)]),
+        (
+            "transactions",
+            {"$or": [{"borrow_branch_id": oid}, {"return_branch_id": oid}]},
+            [("transaction_date", -1), ("_id", -1)],
+        ),
+        ("transactions", {"member_id": oid}, [("transaction_date", -1), ("_id", -1)]),
+        ("notifications", {"member_id": oid}, [("date", -1)]),
+        ("notifications", {"member_id": oid, "status": "unread"}, None),
+        (
+            "notification_outbox",
+            {
+                "status": {
+                    "$in": [
+                        NotificationOutboxStatus.PENDING.value,
+                        NotificationOutboxStatus.PROCESSING.value,
+                    ]
+                },
+                "next_attempt": {"$lte": now},
+            },
+            [("next_attempt", 1)],
+        ),
+    ]
+
+
+def ensure_indexes(db):
+    """Create every registered index, safe to run on every startup.
+
+    Each index is created on its own, one that can't be built (e.g. duplicate
+    legacy values for a unique index) is reported and the others still are.
+    Returns {collection: {"created": [names], "errors": {name: message}}}.
+    """
+    report = {}
+    for collection_name, indexes in INDEXES.items():
+        if not indexes:
+            continue
+        collection = db.get_collection(collection_name)
+        result = {"created": [], "errors": {}}
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                result["created"] += collection.create_indexes([index])
+            except errors.OperationFailure as e:
+                print(f"Index {collection_name}.{name} failed: {e}")
+                result["errors"][name] = str(e)
+        report[collection_name] = result
+    return report
+
+
+def missing_indexes(db):
+    """(collection, index name) of registered indexes the database doesn't have."""
+    missing = []
+    for collection_name, indexes in INDEXES.items():
+        if not indexes:
+            continue
+        existing = db.get_collection(collection_name).index_information()
+        missing += [
+            (collection_name, index.document["name"])
+            for index in indexes
+            if index.document["name"] not in existing
+        ]
+    return missing
+
+
+def _plan_stages(plan):
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+def check_indexes(db):
+    """Explain every service query shape and flag the ones that COLLSCAN."""
+    results = []
+    for collection_name, filter, sort in _query_shapes():
+        cursor = db.get_collection(collection_name).find(filter)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = _plan_stages(plan)
+        results.append(
+            {
+                "collection": collection_name,
+                "filter": filter,
+                "sort": sort,
+                "stages": stages,
+                "collscan": "COLLSCAN" in stages,
+            }
+        )
+    return results
@@ -23,6 +23,19 @@ def init_sequence_collection(db):
         sequence_collection.insert_one({"_id": "member_id", "sequence_value": 1000})
 
 
+def init_notification_sequence(db):
+    # continue after the ids issued by the old count based scheme
+    sequence_collection = db.get_collection("sequences")
+    if sequence_collection.count_documents({"_id": "notification_id"}) == 0:
+        notifications = db.get_collection("notifications").find(
+            {"notification_id": {"$regex": "^NTF[0-9]+$"}}, {"notification_id": 1}
+        )
+        last_id = max((int(n["notification_id"][3:]) for n in notifications), default=0)
+        sequence_collection.insert_one(
+            {"_id": "notification_id", "sequence_value": last_id}
+        )
+
+
 def init_staff_sequence_collection(db):
     staff_sequence_collection = db.get_collection("staff_sequences")
     if staff_sequence_collection.count_documents({"_id": "staff_id"}) == 0:
@@ -0,0 +1,151 @@
+import functools
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from app.utils.collections import (
+    borrowed_collection,
+    jobs_collection,
+    transfer_routes_collection,
+)
+
+# Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+# (see gunicorn.conf.py) and /metrics merges them, so any worker can answer.
+
+METRIC_BLUEPRINTS = {"admin", "staff", "member"}
+
+REQUEST_LATENCY = Histogram(
+    "lms_request_duration_seconds",
+    "Request latency per route.",
+    ["blueprint", "endpoint", "method", "status"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+CIRCULATION_OPERATIONS = Counter(
+    "lms_circulation_operations_total",
+    "Circulation service calls by outcome.",
+    ["operation", "outcome"],
+)
+
+
+def track_outcome(operation):
+    """Count a service call under its returned status ("success", "fail", ...)."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                CIRCULATION_OPERATIONS.labels(operation, "exception").inc()
+                raise
+            outcome = result.get("status") if isinstance(result, dict) else None
+            CIRCULATION_OPERATIONS.labels(operation, outcome or "unknown").inc()
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+class LibraryStateCollector:
+    """Gauges read from the database at scrape time.
+
+    They describe shared state, not this process, so they're computed once per
+    scrape from the maintained counters instead of being tracked per worker.
+    """
+
+    def collect(self):
+        yield GaugeMetricFamily(
+            "lms_open_loans",
+            "Borrowed copies not returned yet.",
+            value=borrowed_collection.count_documents({"returned": False}),
+        )
+
+        backlog = next(
+            transfer_routes_collection.aggregate(
+                [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "pending": {"$sum": "$pending"},
+                            "in_transit": {"$sum": "$in_transit"},
+                        }
+                    }
+                ]
+            ),
+            {"pending": 0, "in_transit": 0},
+        )
+        transfers = GaugeMetricFamily(
+            "lms_transfers", "Transfers not completed yet.", labels=["status"]
+        )
+        transfers.add_metric(["pending"], backlog["pending"])
+        transfers.add_metric(["in_transit"], backlog["in_transit"])
+        yield transfers
+
+        duration = GaugeMetricFamily(
+            "lms_job_last_duration_seconds",
+            "Run time of the last run of each background job.",
+            labels=["job"],
+        )
+        last_run = GaugeMetricFamily(
+            "lms_job_last_finished_timestamp_seconds",
+            "When each background job last finished.",
+            labels=["job"],
+        )
+        for job in jobs_collection.find(
+            {}, {"last_duration": 1, "finished_at": 1, "status": 1}
+        ):
+            if job.get("last_duration") is not None:
+                duration.add_metric([job["_id"]], job["last_duration"])
+            if job.get("finished_at"):
+                last_run.add_metric([job["_id"]], job["finished_at"].timestamp())
+        yield duration
+        yield last_run
+
+
+_state_registry = CollectorRegistry(auto_describe=False)
+_state_registry.register(LibraryStateCollector())
+
+
+def metrics_view():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    output = generate_latest(registry) + generate_latest(_state_registry)
+    return Response(output, mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app):
+    """Time the role blueprints' routes and serve everything on /metrics."""
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request_latency(response):
+        started = g.pop("request_started", None)
+        if started is not None and request.blueprint in METRIC_BLUEPRINTS:
+            REQUEST_LATENCY.labels(
+                request.blueprint,
+                request.endpoint,
+                request.method,
+                response.status_code,
+            ).observe(time.perf_counter() - started)
+        return response
+
+    app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -0,0 +1,111 @@
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from flask import current_app, request, url_for
+
+
+def get_page_size(page_size=None):
+    """Requested page size, defaulting to PAGE_SIZE and capped at MAX_PAGE_SIZE."""
+    if not page_size or page_size < 1:
+        return current_app.config["PAGE_SIZE"]
+    return min(page_size, current_app.config["MAX_PAGE_SIZE"])
+
+
+def encode_cursor(doc, sort_field="_id"):
+    values = {"id": str(doc["_id"])}
+    if sort_field != "_id":
+        value = doc[sort_field]
+        values["v"] = value.isoformat() if isinstance(value, datetime) else value
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, sort_field="_id"):
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    last_id = ObjectId(values["id"])
+    last_value = None
+    if sort_field != "_id":
+        last_value = values["v"]
+        try:
+            last_value = datetime.fromisoformat(last_value)
+        except (TypeError, ValueError):
+            pass
+    return last_value, last_id
+
+
+def keyset_filter(filter, after=None, sort_field="_id", direction=-1):
+    """Add the seek condition for the rows that come after the `after` cursor.
+
+    Rows are ordered by (sort_field, _id) so ties on sort_field stay stable.
+    """
+    if not after:
+        return filter
+
+    last_value, last_id = decode_cursor(after, sort_field)
+    op = "$lt" if direction == -1 else "$gt"
+    if sort_field == "_id":
+        seek = {"_id": {op: last_id}}
+    else:
+        seek = {
+            "$or": [
+                {sort_field: {op: last_value}},
+                {sort_field: last_value, "_id": {op: last_id}},
+            ]
+        }
+    return {"$and": [filter, seek]} if filter else seek
+
+
+def keyset_sort(sort_field="_id", direction=-1):
+    if sort_field == "_id":
+        return [("_id", direction)]
+    return [(sort_field, direction), ("_id", direction)]
+
+
+def paginate(rows, page_size, sort_field="_id"):
+    """Split page_size + 1 fetched rows into the page and the next cursor."""
+    rows = list(rows)
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1], sort_field)
+    return rows, next_cursor
+
+
+def find_page(
+    collection, filter, after=None, page_size=None, sort_field="_id", projection=None
+):
+    """Keyset paginated find, sorted newest first on (sort_field, _id)."""
+    page_size = get_page_size(page_size)
+    if projection is not None and sort_field not in projection:
+        # the cursor of the next page is built from the sort field
+        projection = {**projection, sort_field: 1}
+    cursor = (
+        collection.find(keyset_filter(filter, after, sort_field), projection)
+        .sort(keyset_sort(sort_field))
+        .limit(page_size + 1)
+    )
+    return paginate(cursor, page_size, sort_field)
+
+
+def page_args():
+    """Cursor and page size requested in the query string."""
+    return {
+        "after": request.args.get("after"),
+        "page_size": request.args.get("page_size", type=int),
+    }
+
+
+def url_with_args(**changes):
+    """URL of the current view with some query args replaced, None drops one."""
+    args = request.args.to_dict()
+    for key, value in changes.items():
+        args.pop(key, None)
+        if value is not None:
+            args[key] = value
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def page_url(cursor=None):
+    """URL of the current view at `cursor`, keeping the other query args."""
+    return url_with_args(after=cursor)
@@ -0,0 +1,177 @@
+import json
+import logging
+import threading
+import time
+
+from flask import current_app, render_template, request
+from pymongo import monitoring
+
+slow_query_log = logging.getLogger("lms.slow_queries")
+
+# handshakes, auth and session housekeeping aren't queries the app issued
+IGNORED_COMMANDS = {
+    "hello",
+    "ismaster",
+    "isMaster",
+    "ping",
+    "saslStart",
+    "saslContinue",
+    "endSessions",
+    "buildInfo",
+}
+
+# how many of the slowest commands a request keeps for the toolbar
+TOP_COMMANDS = 5
+
+
+def command_summary(command_name, command):
+    """Collection plus a short shape of the command, no values."""
+    collection = command.get(command_name)
+    if command_name == "getMore":
+        collection = command.get("collection")
+    if not isinstance(collection, str):
+        collection = None
+
+    if command_name == "aggregate":
+        stages = []
+        for stage in command.get("pipeline", []):
+            name = next(iter(stage), "")
+            if name == "$lookup":
+                name = f"$lookup({stage[name].get('from')})"
+            elif name in ("$merge", "$out"):
+                target = stage[name]
+                name = f"{name}({target.get('into') if isinstance(target, dict) else target})"
+            stages.append(name)
+        shape = " > ".join(stages)
+    elif command_name in ("find", "count", "distinct", "findAndModify"):
+        shape = ",".join(command.get("filter", command.get("query", {})))
+        if command.get("sort"):
+            shape += f" sort {','.join(command['sort'])}"
+    elif command_name in ("update", "delete", "insert"):
+        key = {"update": "updates", "delete": "deletes", "insert": "documents"}
+        shape = f"{len(command.get(key[command_name], []))} ops"
+    else:
+        shape = ""
+    return {"command": command_name, "collection": collection, "shape": shape}
+
+
+class RequestStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest = []
+
+    def record(self, summary, duration_ms):
+        self.count += 1
+        self.total_ms += duration_ms
+        self.slowest.append({**summary, "duration_ms": round(duration_ms, 2)})
+        self.slowest.sort(key=lambda entry: entry["duration_ms"], reverse=True)
+        del self.slowest[TOP_COMMANDS:]
+
+
+class QueryProfiler(monitoring.CommandListener):
+    """pymongo command listener feeding per-request stats and the slow log.
+
+    Commands are issued and completed on the calling thread, so in-flight
+    commands and the current request's stats both live in a thread local.
+    """
+
+    def __init__(self, slow_query_ms=100):
+        self.slow_query_ms = slow_query_ms
+        self._local = threading.local()
+
+    def _pending(self):
+        if not hasattr(self._local, "pending"):
+            self._local.pending = {}
+        return self._local.pending
+
+    # per-request stats
+
+    def begin(self):
+        self._local.stats = RequestStats()
+
+    def end(self):
+        stats = getattr(self._local, "stats", None)
+        self._local.stats = None
+        return stats
+
+    # CommandListener
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        self._pending()[(event.connection_id, event.request_id)] = command_summary(
+            event.command_name, event.command
+        )
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, failure=event.failure)
+
+    def _finish(self, event, failure=None):
+        summary = self._pending().pop((event.connection_id, event.request_id), None)
+        if summary is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        stats = getattr(self._local, "stats", None)
+        if stats is not None:
+            stats.record(summary, duration_ms)
+        if duration_ms >= self.slow_query_ms:
+            self._log_slow(summary, duration_ms, failure)
+
+    def _log_slow(self, summary, duration_ms, failure):
+        record = {
+            **summary,
+            "duration_ms": round(duration_ms, 2),
+            "ok": failure is None,
+            "ts": time.time(),
+        }
+        try:
+            record["path"] = request.path
+        except RuntimeError:
+            # scheduler jobs and CLI commands run outside a request
+            record["path"] = None
+        slow_query_log.warning(json.dumps(record, default=str))
+
+
+profiler = QueryProfiler()
+
+
+def init_profiler(app):
+    """Hook the profiler into the request cycle.
+
+    Adds `X-DB-Queries` and a `Server-Timing` entry to every response, and with
+    DB_TOOLBAR on, a panel listing the slowest commands at the bottom of HTML
+    pages.
+    """
+    profiler.slow_query_ms = app.config["SLOW_QUERY_MS"]
+    if app.config["SLOW_QUERY_LOG"]:
+        handler = logging.FileHandler(app.config["SLOW_QUERY_LOG"])
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        slow_query_log.addHandler(handler)
+
+    @app.before_request
+    def start_query_profile():
+        profiler.begin()
+
+    @app.after_request
+    def add_query_profile(response):
+        stats = profiler.end()
+        if stats is None:
+            return response
+        response.headers["X-DB-Queries"] = f"{stats.count}; {stats.total_ms:.1f}ms"
+        response.headers.add(
+            "Server-Timing", f'db;dur={stats.total_ms:.1f};desc="{stats.count} queries"'
+        )
+        if (
+            current_app.config["DB_TOOLBAR"]
+            and response.mimetype == "text/html"
+            and not response.direct_passthrough
+        ):
+            body = response.get_data(as_text=True)
+            if "</body>" in body:
+                panel = render_template("db_toolbar.html", stats=stats)
+                response.set_data(body.replace("</body>", f"{panel}</body>", 1))
+        return response
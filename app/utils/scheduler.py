@@ -0,0 +1,100 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument, errors
+
+from app.utils.collections import jobs_collection
+
+# registered periodic jobs, name -> {"func": callable, "interval": seconds}
+_jobs = {}
+_scheduler_thread = None
+
+
+def register_job(name, func, interval):
+    """Register a periodic background job, `interval` is in seconds."""
+    _jobs[name] = {"func": func, "interval": interval}
+
+
+def claim_job(name, interval):
+    """Move the job watermark forward if the job is due.
+
+    Only one worker (thread, gunicorn worker or separate process) wins the
+    claim for a given interval, the others get False.
+    """
+    now = datetime.now()
+    try:
+        job = jobs_collection.find_one_and_update(
+            {
+                "_id": name,
+                "$or": [
+                    {"last_run": {"$lte": now - timedelta(seconds=interval)}},
+                    {"last_run": None},
+                ],
+            },
+            {"$set": {"last_run": now, "status": "running"}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except errors.DuplicateKeyError:
+        # job document exists but the watermark is not due yet
+        return False
+    return job is not None
+
+
+def run_job(name, force=False):
+    """Run a registered job if it is due (or always with `force`)."""
+    job = _jobs[name]
+    if not force and not claim_job(name, job["interval"]):
+        return None
+
+    started = time.perf_counter()
+    status, result, error = "success", None, None
+    try:
+        result = job["func"]()
+    except Exception as e:
+        print(e)
+        status, error = "fail", str(e)
+
+    update = {
+        "status": status,
+        "finished_at": datetime.now(),
+        "last_duration": round(time.perf_counter() - started, 3),
+        "last_error": error,
+    }
+    if force:
+        update["last_run"] = datetime.now()
+    if isinstance(result, dict):
+        update["last_result"] = result
+    jobs_collection.update_one({"_id": name}, {"$set": update}, upsert=True)
+    return result
+
+
+def get_job_status(name):
+    return jobs_collection.find_one({"_id": name})
+
+
+def run_scheduler(app, stop_event=None):
+    """Blocking scheduler loop, used by the background thread and worker.py."""
+    tick = app.config["SCHEDULER_TICK"]
+    while not (stop_event and stop_event.is_set()):
+        with app.app_context():
+            for name in list(_jobs):
+                try:
+                    run_job(name)
+                except Exception as e:
+                    print(e)
+        time.sleep(tick)
+
+
+def start_scheduler(app):
+    """Start the in-process scheduler thread once per process."""
+    global _scheduler_thread
+    if _scheduler_thread and _scheduler_thread.is_alive():
+        return _scheduler_thread
+
+    _scheduler_thread = threading.Thread(
+        target=run_scheduler, args=(app,), name="lms-scheduler", daemon=True
+    )
+    _scheduler_thread.start()
+    return _scheduler_thread
@@ -0,0 +1,54 @@
+import os
+import threading
+
+from pymongo import ReturnDocument
+
+from .database import db
+
+
+class SequenceAllocator:
+    """Monotonic ids handed out from blocks leased from the `sequences` collection.
+
+    Each worker process leases `block_size` values with one atomic `$inc`
+    (the same approach as generate_member_id) and then serves ids from
+    memory, so most allocations never touch the database. Ids are unique
+    across processes, unused ids of a block are skipped when a process exits.
+    """
+
+    def __init__(self, name, block_size=100):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._pid = None
+
+    def _lease_block(self, size):
+        sequence_collection = db.get_collection("sequences")
+        sequence = sequence_collection.find_one_and_update(
+            {"_id": self.name},
+            {"$inc": {"sequence_value": size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if not sequence:
+            raise Exception(f"Failed to lease {self.name} block")
+
+        self._end = sequence["sequence_value"] + 1
+        self._next = self._end - size
+        self._pid = os.getpid()
+
+    def next(self):
+        with self._lock:
+            # a forked worker must not reuse the block leased by its parent
+            if self._pid != os.getpid() or self._next >= self._end:
+                self._lease_block(self.block_size)
+            value = self._next
+            self._next += 1
+            return value
+
+
+# display ids issued from the sequences collection
+transaction_ids = SequenceAllocator("transaction_id", block_size=500)
+notification_ids = SequenceAllocator("notification_id", block_size=200)
+reservation_ids = SequenceAllocator("reservation_id", block_size=100)
@@ -0,0 +1,13 @@
+import os
+
+# Benchmarks drive the services directly, no background jobs
+os.environ["SCHEDULER_ENABLED"] = "false"
+
+from app import create_app
+
+
+def bench_app():
+    """App bound to MONGO_URI, refuses to run without one set explicitly."""
+    if not os.getenv("MONGO_URI"):
+        raise SystemExit("Set MONGO_URI to a scratch database first.")
+    return create_app()
@@ -0,0 +1,354 @@
+"""Seed a complete synthetic library for the benchmark suite.
+
+Every collection the app reads is filled in proportion to `--scale` (roughly
+the total number of documents), from a fixed seed and with deterministic
+_ids, so two runs at the same scale produce the same database.
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+from itertools import islice
+
+from bson import ObjectId
+from werkzeug.security import generate_password_hash
+
+from benchmarks.app import bench_app
+from app.utils.enums import (
+    ItemCopyStatus,
+    LibraryItemAvailabilityType,
+    LibraryItemTypes,
+    MemberStatus,
+    ReservationStatus,
+    TransactionType,
+)
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# share of the documents per collection, the rest are transactions
+SHARES = {"members": 0.05, "items": 0.05, "loans": 0.15, "reservations": 0.02}
+COPIES_PER_ITEM = 3
+# every BORROWED_EVERY-th copy is out on an open loan
+BORROWED_EVERY = 10
+
+# password of every seeded member and staff account
+PASSWORD = "bench@123"
+
+# collections the generator owns, dropped before seeding
+SEEDED_COLLECTIONS = [
+    "branches",
+    "staff",
+    "member",
+    "library_items",
+    "copies",
+    "borrowed_items",
+    "reservations",
+    "transactions",
+    "item_branch_availability",
+    "transfers",
+    "transfer_manifests",
+    "transfer_routes",
+    "notifications",
+    "notification_outbox",
+    "fee_ledger",
+]
+
+WORDS = (
+    "river night garden silent empire winter shadow glass ocean stone city "
+    "light memory secret forest letter storm island machine journey dream "
+    "fire house moon paper road song star time war water world"
+).split()
+CATEGORIES = (
+    "Fiction Mystery History Science Biography Fantasy Romance Travel "
+    "Children Poetry Drama Technology Art Cooking Philosophy"
+).split()
+
+# kind prefixes for the deterministic ObjectIds
+KIND_BRANCH, KIND_STAFF, KIND_MEMBER, KIND_ITEM = 1, 2, 3, 4
+KIND_COPY, KIND_LOAN, KIND_RESERVATION, KIND_TRANSACTION = 5, 6, 7, 8
+
+
+def oid(kind, n):
+    return ObjectId(f"{kind:02x}{n:022x}")
+
+
+def sizes(scale):
+    total = SCALES.get(scale) or int(scale)
+    counts = {name: max(10, int(total * share)) for name, share in SHARES.items()}
+    counts["branches"] = min(50, max(5, total // 200_000))
+    counts["staff"] = counts["branches"] * 2
+    counts["copies"] = counts["items"] * COPIES_PER_ITEM
+    counts["transactions"] = max(10, total - sum(counts.values()))
+    return counts
+
+
+def copy_branch(n, branches):
+    return oid(KIND_BRANCH, n % branches)
+
+
+def is_borrowed(n):
+    return n % BORROWED_EVERY == 0
+
+
+def borrower(n, members):
+    return oid(KIND_MEMBER, (n // BORROWED_EVERY) % members)
+
+
+def _insert(collection, docs, batch_size=10000):
+    docs = iter(docs)
+    inserted = 0
+    while True:
+        batch = list(islice(docs, batch_size))
+        if not batch:
+            return inserted
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+
+
+def _title(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title()
+
+
+def branch_docs(counts):
+    for n in range(counts["branches"]):
+        yield {
+            "_id": oid(KIND_BRANCH, n),
+            "name": f"Branch {n}",
+            "location": f"District {n}",
+            "staff_id": oid(KIND_STAFF, n * 2),
+            "is_active": True,
+        }
+
+
+def staff_docs(counts, password):
+    for n in range(counts["staff"]):
+        yield {
+            "_id": oid(KIND_STAFF, n),
+            "staff_id": str(1001 + n),
+            "firstname": f"Staff{n}",
+            "lastname": "Bench",
+            "email": f"staff{n}@example.com",
+            "password": password,
+            "role": "staff",
+            "branch_id": oid(KIND_BRANCH, n // 2),
+            "is_active": True,
+        }
+
+
+def member_docs(counts, password, now):
+    for n in range(counts["members"]):
+        yield {
+            "_id": oid(KIND_MEMBER, n),
+            "member_id": f"MEM{1001 + n:04d}",
+            "firstname": f"First{n}",
+            "lastname": f"Last{n}",
+            "email": f"member{n}@example.com",
+            "contact_no": f"555{n:07d}",
+            "address": f"{n} Bench Street",
+            "password": password,
+            "due_amount": 0,
+            "created_at": now - timedelta(days=n % 1000),
+            "status": MemberStatus.APPROVED.value,
+            "role": "member",
+        }
+
+
+def item_docs(counts, rng, now):
+    item_types = list(LibraryItemTypes)
+    for n in range(counts["items"]):
+        item_type = item_types[n % len(item_types)]
+        copies = range(n * COPIES_PER_ITEM, (n + 1) * COPIES_PER_ITEM)
+        item = {
+            "_id": oid(KIND_ITEM, n),
+            "id": f"{item_type.value[:2].upper()}{n:07d}",
+            "item_type": item_type.value,
+            "title": _title(rng),
+            "description": " ".join(rng.choice(WORDS) for _ in range(60)),
+            "categories": rng.sample(CATEGORIES, rng.randint(1, 3)),
+            "image_filename": f"bench_{n}.jpg",
+            "total_copies": COPIES_PER_ITEM,
+            "available_copies": sum(not is_borrowed(c) for c in copies),
+            "created_at": now - timedelta(days=n % 2000),
+            "is_active": True,
+        }
+        if item_type == LibraryItemTypes.DVD:
+            item["director"] = f"Director {n % 5000}"
+            item["availability_type"] = LibraryItemAvailabilityType.PHYSICAL.value
+        else:
+            item["author"] = f"Author {n % 20000}"
+            item["isbn"] = f"978{n:010d}"
+            item["publisher"] = f"Publisher {n % 300}"
+            item["availability_type"] = (
+                LibraryItemAvailabilityType.DIGITAL.value
+                if item_type == LibraryItemTypes.EBOOK
+                else LibraryItemAvailabilityType.PHYSICAL.value
+            )
+        yield item
+
+
+def copy_docs(counts, now):
+    for n in range(counts["copies"]):
+        branch_id = copy_branch(n, counts["branches"])
+        borrowed = is_borrowed(n)
+        yield {
+            "_id": oid(KIND_COPY, n),
+            "item_id": oid(KIND_ITEM, n // COPIES_PER_ITEM),
+            "rfid": f"RFID{n:09d}",
+            "original_branch_id": branch_id,
+            "current_branch_id": branch_id,
+            "borrower_id": borrower(n, counts["members"]) if borrowed else None,
+            "status": (
+                ItemCopyStatus.BORROWED.value
+                if borrowed
+                else ItemCopyStatus.AVAILABLE.value
+            ),
+            "created_at": now,
+        }
+
+
+def _loan(n, copy_n, member_id, borrowed_on, counts, returned):
+    item_n = copy_n // COPIES_PER_ITEM
+    item_types = list(LibraryItemTypes)
+    return {
+        "_id": oid(KIND_LOAN, n),
+        "member_id": member_id,
+        "item_id": oid(KIND_ITEM, item_n),
+        "item_type": item_types[item_n % len(item_types)].value,
+        "copy_id": oid(KIND_COPY, copy_n),
+        "branch_id": copy_branch(copy_n, counts["branches"]),
+        "rfid": f"RFID{copy_n:09d}",
+        "borrowed_on": borrowed_on,
+        "due_date": borrowed_on + timedelta(days=21),
+        "delayed_days": 0,
+        "late_fee": 0,
+        "renewals_left": 2,
+        "returned": returned,
+        "return_date": borrowed_on + timedelta(days=14) if returned else None,
+    }
+
+
+def loan_docs(counts, rng, now):
+    # one open loan per borrowed copy, the rest is returned history
+    n = 0
+    for copy_n in range(0, counts["copies"], BORROWED_EVERY):
+        borrowed_on = now - timedelta(days=rng.randint(0, 30))
+        member_id = borrower(copy_n, counts["members"])
+        yield _loan(n, copy_n, member_id, borrowed_on, counts, returned=False)
+        n += 1
+    while n < counts["loans"]:
+        copy_n = rng.randrange(counts["copies"])
+        member_id = oid(KIND_MEMBER, rng.randrange(counts["members"]))
+        borrowed_on = now - timedelta(days=rng.randint(30, 3 * 365))
+        yield _loan(n, copy_n, member_id, borrowed_on, counts, returned=True)
+        n += 1
+
+
+def reservation_docs(counts, rng, now):
+    for n in range(counts["reservations"]):
+        copy_n = rng.randrange(0, counts["copies"], BORROWED_EVERY)
+        yield {
+            "_id": oid(KIND_RESERVATION, n),
+            "reservation_id": f"RSV{n + 1:04d}",
+            "member_id": oid(KIND_MEMBER, rng.randrange(counts["members"])),
+            "item_id": oid(KIND_ITEM, copy_n // COPIES_PER_ITEM),
+            "branch_id": copy_branch(copy_n, counts["branches"]),
+            "reserved_date": now - timedelta(minutes=counts["reservations"] - n),
+            "status": ReservationStatus.ACTIVE.value,
+        }
+
+
+def transaction_docs(counts, rng, now):
+    start = now - timedelta(days=3 * 365)
+    for n in range(counts["transactions"]):
+        copy_n = rng.randrange(counts["copies"])
+        doc = {
+            "_id": oid(KIND_TRANSACTION, n),
+            "transaction_id": f"TXN{n + 1:010d}",
+            "seq": n + 1,
+            "transaction_date": start
+            + timedelta(seconds=rng.randrange(3 * 365 * 86400)),
+            "status": "active",
+            "member_id": oid(KIND_MEMBER, rng.randrange(counts["members"])),
+            "item_id": oid(KIND_ITEM, copy_n // COPIES_PER_ITEM),
+            "copy_id": oid(KIND_COPY, copy_n),
+            "borrow_branch_id": copy_branch(copy_n, counts["branches"]),
+        }
+        if rng.random() < 0.5:
+            doc["transaction_type"] = TransactionType.RETURN.value
+            doc["return_branch_id"] = oid(
+                KIND_BRANCH, rng.randrange(counts["branches"])
+            )
+            doc["paid_amount"] = rng.choice([0, 0, 0, 0.5, 1.5, 3.0])
+        else:
+            doc["transaction_type"] = TransactionType.BORROW.value
+        yield doc
+
+
+def _set_sequences(db, counts):
+    # continue the app's id sequences after the seeded ids
+    sequences = db.get_collection("sequences")
+    for name, value in (
+        ("member_id", 1000 + counts["members"]),
+        ("transaction_id", counts["transactions"]),
+        ("reservation_id", counts["reservations"]),
+        ("notification_id", 0),
+    ):
+        sequences.replace_one({"_id": name}, {"sequence_value": value}, upsert=True)
+    db.get_collection("staff_sequences").replace_one(
+        {"_id": "staff_id"}, {"sequence_value": 1000 + counts["staff"]}, upsert=True
+    )
+
+
+def seed(db, scale="100k", seed=42):
+    """Drop and refill every library collection, returns the document counts."""
+    from app.services.availability_services import rebuild_item_branch_availability
+    from app.services.notification_services import rebuild_unread_counts
+    from app.services.transfer_services import rebuild_transfer_routes
+
+    counts = sizes(scale)
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    password = generate_password_hash(PASSWORD)
+
+    for name in SEEDED_COLLECTIONS:
+        db.get_collection(name).drop()
+
+    generators = {
+        "branches": branch_docs(counts),
+        "staff": staff_docs(counts, password),
+        "member": member_docs(counts, password, now),
+        "library_items": item_docs(counts, rng, now),
+        "copies": copy_docs(counts, now),
+        "borrowed_items": loan_docs(counts, rng, now),
+        "reservations": reservation_docs(counts, rng, now),
+        "transactions": transaction_docs(counts, rng, now),
+    }
+    for name, docs in generators.items():
+        inserted = _insert(db.get_collection(name), docs)
+        print(f"{name}: {inserted}")
+
+    _set_sequences(db, counts)
+    rebuild_item_branch_availability()
+    rebuild_transfer_routes()
+    rebuild_unread_counts()
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--scale",
+        default="100k",
+        help=f"one of {', '.join(SCALES)} or a document count",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    app = bench_app()
+    with app.app_context():
+        from app.utils.database import db
+        from app.utils.indexes import ensure_indexes
+
+        counts = seed(db, args.scale, args.seed)
+        ensure_indexes(db)
+        print(f"Seeded {sum(counts.values())} documents at scale {args.scale}.")
@@ -0,0 +1,118 @@
+"""Seed members, items, copies, branches and transactions for benchmarks."""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from benchmarks.app import bench_app
+from app.utils.enums import TransactionType
+
+
+def _seed_docs(collection, docs, batch_size=10000):
+    collection.drop()
+    for start in range(0, len(docs), batch_size):
+        collection.insert_many(docs[start : start + batch_size], ordered=False)
+
+
+def seed(db, transactions=1000000, members=20000, items=5000, branches=10):
+    rng = random.Random(42)
+    branch_docs = [
+        {
+            "_id": ObjectId(),
+            "branch_id": f"BR{i:03d}",
+            "name": f"Branch {i}",
+            "is_active": True,
+        }
+        for i in range(branches)
+    ]
+    member_docs = [
+        {
+            "_id": ObjectId(),
+            "member_id": f"MEM{i:06d}",
+            "firstname": f"First{i}",
+            "lastname": f"Last{i}",
+            "email": f"member{i}@example.com",
+            "status": "active",
+            "due_amount": 0,
+        }
+        for i in range(members)
+    ]
+    item_docs = [
+        {
+            "_id": ObjectId(),
+            "id": f"ITM{i:06d}",
+            "item_type": rng.choice(["book", "ebook", "dvd"]),
+            "title": f"Title {i}",
+            "description": "x" * 500,
+            "is_active": True,
+        }
+        for i in range(items)
+    ]
+    copy_docs = [
+        {
+            "_id": ObjectId(),
+            "item_id": item["_id"],
+            "rfid": f"RFID{i:07d}",
+            "branch_id": rng.choice(branch_docs)["_id"],
+            "status": "available",
+        }
+        for i, item in enumerate(item_docs * 2)
+    ]
+    for name, docs in (
+        ("branches", branch_docs),
+        ("member", member_docs),
+        ("library_items", item_docs),
+        ("copies", copy_docs),
+    ):
+        _seed_docs(db.get_collection(name), docs)
+
+    collection = db.get_collection("transactions")
+    collection.drop()
+    start = datetime.now() - timedelta(days=3 * 365)
+    batch = []
+    for n in range(transactions):
+        copy = rng.choice(copy_docs)
+        is_return = rng.random() < 0.5
+        branch_id = rng.choice(branch_docs)["_id"]
+        doc = {
+            "transaction_id": f"TXN{n:010d}",
+            "seq": n,
+            "transaction_date": start
+            + timedelta(seconds=rng.randrange(3 * 365 * 86400)),
+            "status": "active",
+            "member_id": rng.choice(member_docs)["_id"],
+            "item_id": copy["item_id"],
+            "copy_id": copy["_id"],
+            "borrow_branch_id": copy["branch_id"],
+        }
+        if is_return:
+            doc["transaction_type"] = TransactionType.RETURN.value
+            doc["return_branch_id"] = branch_id
+            doc["paid_amount"] = rng.choice([0, 0, 0, 0.5, 1.5, 3.0])
+        else:
+            doc["transaction_type"] = TransactionType.BORROW.value
+        batch.append(doc)
+        if len(batch) == 10000:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transactions", type=int, default=1000000)
+    parser.add_argument("--members", type=int, default=20000)
+    parser.add_argument("--items", type=int, default=5000)
+    args = parser.parse_args()
+
+    app = bench_app()
+    with app.app_context():
+        from app.utils.database import db
+        from app.utils.indexes import ensure_indexes
+
+        seed(db, args.transactions, args.members, args.items)
+        ensure_indexes(db)
+        print(f"Seeded {args.transactions} transactions.")
@@ -0,0 +1,39 @@
+import math
+import statistics
+import time
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def summarize(times):
+    times = sorted(times)
+    return {
+        "runs": len(times),
+        "mean_ms": round(statistics.fmean(times), 2),
+        "p50_ms": round(percentile(times, 0.50), 2),
+        "p95_ms": round(percentile(times, 0.95), 2),
+        "p99_ms": round(percentile(times, 0.99), 2),
+    }
+
+
+def timed(func, runs, warmup=0):
+    """Call `func` `runs` times and return its latency percentiles in ms.
+
+    Service functions answer {"status": "fail", ...} instead of raising, those
+    calls are counted under "failures" so a broken benchmark doesn't look fast.
+    """
+    for _ in range(warmup):
+        func()
+    times, failures = [], 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+        if isinstance(result, dict) and result.get("status") not in (None, "success"):
+            failures += 1
+    return {**summarize(times), "failures": failures}
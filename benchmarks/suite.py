@@ -0,0 +1,365 @@
+"""Time the service layer against a seeded database, p50/p95/p99 per operation.
+
+Run benchmarks.dataset first. Results go to stdout and, with --output, to a
+JSON file. --baseline compares against an earlier file and exits non-zero when
+an operation's p95 regressed by more than --max-regression.
+"""
+
+import argparse
+import json
+import random
+import subprocess
+from datetime import datetime
+
+from benchmarks.app import bench_app
+from benchmarks.stats import timed
+from app.utils.enums import ItemCopyStatus, LibraryItemTypes
+
+# name -> func(samples), registered in the order they run
+OPERATIONS = {}
+# name -> p95 the operation has to stay under, in ms
+TARGETS = {}
+
+
+def operation(name, target_ms=None):
+    def decorator(func):
+        OPERATIONS[name] = func
+        if target_ms:
+            TARGETS[name] = target_ms
+        return func
+
+    return decorator
+
+
+class Samples:
+    """Random documents to feed the services, drawn once per suite run."""
+
+    def __init__(self, size, seed):
+        from app.utils.collections import (
+            borrowed_collection,
+            branches_collection,
+            copies_collection,
+            items_collection,
+            members_collection,
+        )
+
+        def sample(collection, match, size=size):
+            return list(
+                collection.aggregate([{"$match": match}, {"$sample": {"size": size}}])
+            )
+
+        self.rng = random.Random(seed)
+        self.members = sample(members_collection, {"status": "approved"})
+        self.items = sample(items_collection, {"is_active": True})
+        self.branches = sample(branches_collection, {})
+        self.copies = sample(copies_collection, {})
+        self.open_loans = sample(borrowed_collection, {"returned": False})
+        # copies checked out and then returned by the circulation benchmarks
+        self.available = sample(
+            copies_collection, {"status": ItemCopyStatus.AVAILABLE.value}
+        )
+        self.checked_out = []
+
+    def pick(self, docs):
+        return self.rng.choice(docs)
+
+    def title_word(self):
+        return self.rng.choice(self.pick(self.items)["title"].split())
+
+
+# shared_services
+
+
+@operation("shared.get_all_transactions[admin]")
+def all_transactions(samples):
+    from app.services.shared_services import get_all_transactions
+
+    return get_all_transactions()
+
+
+@operation("shared.get_all_transactions[branch]")
+def branch_transactions(samples):
+    from app.services.shared_services import get_all_transactions
+
+    return get_all_transactions(branch_id=samples.pick(samples.branches)["_id"])
+
+
+@operation("shared.get_all_transactions[member]")
+def member_transactions(samples):
+    from app.services.shared_services import get_all_transactions
+
+    return get_all_transactions(member_id=samples.pick(samples.members)["_id"])
+
+
+@operation("shared.filter_copies_by_rfid")
+def copies_by_rfid(samples):
+    from app.services.shared_services import filter_copies_by_rfid
+
+    return filter_copies_by_rfid(samples.pick(samples.copies)["rfid"])
+
+
+@operation("shared.checkout")
+def checkout_copy(samples):
+    from app.services.shared_services import checkout
+
+    if not samples.available:
+        return {"status": "fail", "message": "No sampled copy left to check out"}
+    copy = samples.available.pop()
+    member = samples.pick(samples.members)
+    result = checkout(member["member_id"], [copy["rfid"]])
+    # only copies that were actually lent are returned later
+    if result["status"] == "success":
+        samples.checked_out.append(copy)
+    return result
+
+
+@operation("shared.return_borrowed_item")
+def return_copy(samples):
+    from app.services.shared_services import return_borrowed_item
+
+    # same-branch returns put the checked out copies back on the shelf
+    if not samples.checked_out:
+        return {"status": "fail", "message": "No checked out copy to return"}
+    copy = samples.checked_out.pop()
+    result = return_borrowed_item(copy["_id"], copy["original_branch_id"])
+    samples.available.insert(0, copy)
+    return result
+
+
+# member_services
+
+
+@operation("member.get_member_with_borrowed_items")
+def member_with_loans(samples):
+    from app.roles.member.member_services import get_member_with_borrowed_items
+
+    return get_member_with_borrowed_items(samples.pick(samples.members)["member_id"])
+
+
+@operation("member.member_get_borrowed_items")
+def member_loans(samples):
+    from app.roles.member.member_services import member_get_borrowed_items
+
+    return member_get_borrowed_items(samples.pick(samples.open_loans)["member_id"])
+
+
+@operation("member.get_reserved_items")
+def member_reservations(samples):
+    from app.roles.member.member_services import get_reserved_items
+
+    return get_reserved_items(member_id=samples.pick(samples.members)["_id"])
+
+
+@operation("member.get_notifications")
+def member_notifications(samples):
+    from app.roles.member.member_services import get_notifications
+
+    return get_notifications(samples.pick(samples.members)["_id"])
+
+
+@operation("member.renew_borrowed_item")
+def renew_loan(samples):
+    from app.roles.member.member_services import renew_borrowed_item
+
+    loan = samples.pick(samples.open_loans)
+    return renew_borrowed_item(loan["member_id"], loan["_id"])
+
+
+@operation("member.reserve_library_item")
+def reserve_item(samples):
+    from app.roles.member.member_services import reserve_library_item
+
+    loan = samples.pick(samples.open_loans)
+    member = samples.pick(samples.members)
+    return reserve_library_item(member["_id"], loan["item_id"], loan["branch_id"])
+
+
+# library_items_services
+
+
+@operation("library_items.get_all_library_items")
+def all_library_items(samples):
+    from app.services.library_items_services import get_all_library_items
+
+    return get_all_library_items(samples.pick(list(LibraryItemTypes)).value)
+
+
+@operation("library_items.get_library_items_by_type")
+def branch_library_items(samples):
+    from app.services.library_items_services import get_library_items_by_type
+
+    return get_library_items_by_type(
+        samples.pick(list(LibraryItemTypes)).value,
+        samples.pick(samples.branches)["_id"],
+    )
+
+
+@operation("library_items.library_item_get")
+def library_item(samples):
+    from app.services.library_items_services import library_item_get
+
+    return library_item_get(samples.pick(samples.items)["_id"])
+
+
+@operation("library_items.library_item_details_with_copies_count_branchwise")
+def library_item_details(samples):
+    from app.services.library_items_services import (
+        library_item_details_with_copies_count_branchwise,
+    )
+
+    return library_item_details_with_copies_count_branchwise(
+        samples.pick(samples.items)["_id"]
+    )
+
+
+# staff_services
+
+
+@operation("staff.transfer_items_list[outgoing]")
+def outgoing_transfers(samples):
+    from app.roles.staff.staff_services import transfer_items_list
+
+    return transfer_items_list(branch_id=samples.pick(samples.branches)["_id"])
+
+
+@operation("staff.transfer_items_list[incoming]")
+def incoming_transfers(samples):
+    from app.roles.staff.staff_services import transfer_items_list
+
+    return transfer_items_list(
+        branch_id=samples.pick(samples.branches)["_id"], incoming=True
+    )
+
+
+# search_services
+
+
+@operation("search.suggest_library_items", target_ms=20)
+def suggest_items(samples):
+    from app.services.search_services import suggest_library_items
+
+    # search-as-you-type, the first few letters of a title word
+    return suggest_library_items(samples.title_word()[: samples.rng.randint(2, 5)])
+
+
+@operation("search.search_library_items[text]")
+def search_items(samples):
+    from app.services.search_services import search_library_items
+
+    return search_library_items(query=samples.title_word())
+
+
+@operation("search.search_library_items[branch]")
+def search_branch_items(samples):
+    from app.services.search_services import search_library_items
+
+    return search_library_items(
+        query=samples.title_word(), branch_id=samples.pick(samples.branches)["_id"]
+    )
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(runs, warmup, seed, only=None):
+    from app.utils.database import db
+
+    samples = Samples(max(runs + warmup, 50), seed)
+    names = [name for name in OPERATIONS if not only or any(o in name for o in only)]
+    results = {}
+    for name in names:
+        results[name] = timed(lambda: OPERATIONS[name](samples), runs, warmup)
+        target = TARGETS.get(name)
+        if target:
+            results[name]["target_ms"] = target
+        print(
+            f"{name:<72} p50 {results[name]['p50_ms']:>8} "
+            f"p95 {results[name]['p95_ms']:>8} p99 {results[name]['p99_ms']:>8} ms"
+            + (
+                f"  {results[name]['failures']} failed"
+                if results[name]["failures"]
+                else ""
+            )
+            + (
+                f"  OVER {target} ms TARGET"
+                if target and results[name]["p95_ms"] > target
+                else ""
+            )
+        )
+
+    collections = {
+        name: db.get_collection(name).estimated_document_count()
+        for name in (
+            "member",
+            "library_items",
+            "copies",
+            "borrowed_items",
+            "transactions",
+        )
+    }
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "git": _git_revision(),
+            "runs": runs,
+            "warmup": warmup,
+            "seed": seed,
+            "collections": collections,
+        },
+        "operations": results,
+    }
+
+
+def compare(report, baseline, max_regression):
+    """Print p95 changes against a baseline report, return the regressed names."""
+    regressed = []
+    for name, result in report["operations"].items():
+        before = baseline["operations"].get(name)
+        if not before or not before["p95_ms"]:
+            continue
+        change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+        flag = ""
+        if change > max_regression:
+            regressed.append(name)
+            flag = "  REGRESSED"
+        print(
+            f"{name:<72} p95 {before['p95_ms']:>8} -> {result['p95_ms']:>8} ms "
+            f"({change:+.0%}){flag}"
+        )
+    return regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--only", nargs="*", help="run operations whose name contains any of these"
+    )
+    parser.add_argument("--output", help="write the report to this JSON file")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    app = bench_app()
+    with app.app_context():
+        report = run(args.runs, args.warmup, args.seed, args.only)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.max_regression):
+            raise SystemExit(1)
@@ -0,0 +1,116 @@
+"""Time the transactions list page before and after paging ahead of the joins."""
+
+import argparse
+
+from benchmarks.app import bench_app
+from benchmarks.stats import timed
+
+
+def legacy_pipeline(filter, page_size):
+    # get_all_transactions before the rewrite: join every matching row, then sort
+    return [
+        {"$match": filter},
+        {
+            "$lookup": {
+                "from": "member",
+                "localField": "member_id",
+                "foreignField": "_id",
+                "as": "member",
+            }
+        },
+        {"$unwind": "$member"},
+        {
+            "$lookup": {
+                "from": "library_items",
+                "localField": "item_id",
+                "foreignField": "_id",
+                "as": "library_item",
+            }
+        },
+        {"$unwind": "$library_item"},
+        {
+            "$lookup": {
+                "from": "copies",
+                "localField": "copy_id",
+                "foreignField": "_id",
+                "as": "copy",
+            }
+        },
+        {"$unwind": "$copy"},
+        {
+            "$lookup": {
+                "from": "branches",
+                "let": {
+                    "borrow_branch_id": "$borrow_branch_id",
+                    "return_branch_id": "$return_branch_id",
+                },
+                "pipeline": [
+                    {
+                        "$match": {
+                            "$expr": {
+                                "$or": [
+                                    {"$eq": ["$_id", "$$borrow_branch_id"]},
+                                    {"$eq": ["$_id", "$$return_branch_id"]},
+                                ]
+                            }
+                        }
+                    }
+                ],
+                "as": "branch_details",
+            }
+        },
+        {"$unwind": "$copy"},
+        {"$sort": {"transaction_date": -1}},
+        {"$limit": page_size},
+    ]
+
+
+def run(runs, page_size, legacy_runs):
+    from app.services.shared_services import get_all_transactions
+    from app.utils.collections import transactions_collection
+
+    sample = transactions_collection.find_one(
+        {"return_branch_id": {"$exists": True}}, {"member_id": 1, "return_branch_id": 1}
+    )
+    views = {
+        "admin": ({}, {}),
+        "branch": (
+            {
+                "$or": [
+                    {"borrow_branch_id": sample["return_branch_id"]},
+                    {"return_branch_id": sample["return_branch_id"]},
+                ]
+            },
+            {"branch_id": sample["return_branch_id"]},
+        ),
+        "member": (
+            {"member_id": sample["member_id"]},
+            {"member_id": sample["member_id"]},
+        ),
+    }
+
+    total = transactions_collection.estimated_document_count()
+    print(f"transactions: {total}, page size: {page_size}")
+    for view, (filter, kwargs) in views.items():
+        before = timed(
+            lambda: list(
+                transactions_collection.aggregate(
+                    legacy_pipeline(filter, page_size), allowDiskUse=True
+                )
+            ),
+            legacy_runs,
+        )
+        after = timed(lambda: get_all_transactions(page_size=page_size, **kwargs), runs)
+        print(f"{view:>7}  before {before}  after {after}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--legacy-runs", type=int, default=3)
+    parser.add_argument("--page-size", type=int, default=50)
+    args = parser.parse_args()
+
+    app = bench_app()
+    with app.app_context():
+        run(args.runs, args.page_size, args.legacy_runs)
@@ -8,3 +8,76 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY")
     MONGO_URI = os.getenv("MONGO_URI")
     UPLOAD_FOLDER = os.path.join("app", "static", "uploads")
+
+    ENSURE_INDEXES_ON_STARTUP = (
+        os.getenv("ENSURE_INDEXES_ON_STARTUP", "true").lower() == "true"
+    )
+
+    # List pages
+    PAGE_SIZE = int(os.getenv("PAGE_SIZE", 50))
+    MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 500))
+
+    # Catalog search
+    SEARCH_INDEX_REFRESH = int(os.getenv("SEARCH_INDEX_REFRESH", 300))  # seconds
+    # how often a worker checks whether another one changed the catalog
+    SEARCH_INDEX_CHECK = int(os.getenv("SEARCH_INDEX_CHECK", 5))  # seconds
+    SEARCH_FACET_LIMIT = int(os.getenv("SEARCH_FACET_LIMIT", 1000))
+
+    # Logged in users are cached per process, dropped when any process edits one
+    USER_CACHE_CHECK = int(os.getenv("USER_CACHE_CHECK", 1))  # seconds
+    # how often a worker checks whether the members' unread counts moved
+    NOTIFICATION_BADGE_CHECK = int(os.getenv("NOTIFICATION_BADGE_CHECK", 5))  # seconds
+
+    # Branches are cached per process, reloaded when another process changes them
+    BRANCH_CACHE_CHECK = int(os.getenv("BRANCH_CACHE_CHECK", 5))  # seconds
+
+    # Background jobs (fee engine etc.), disable when running worker.py separately
+    SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+    SCHEDULER_TICK = int(os.getenv("SCHEDULER_TICK", 30))  # seconds
+    FEE_ENGINE_INTERVAL = int(os.getenv("FEE_ENGINE_INTERVAL", 3600))  # seconds
+    FEE_ENGINE_MODE = os.getenv("FEE_ENGINE_MODE", "incremental")  # or "full"
+    FEE_BULK_BATCH_SIZE = int(os.getenv("FEE_BULK_BATCH_SIZE", 1000))
+    MAX_DUE_AMOUNT = float(
+        os.getenv("MAX_DUE_AMOUNT", 10)
+    )  # checkout blocked above this
+
+    # Copy counter reconciliation
+    RECONCILE_INTERVAL = int(os.getenv("RECONCILE_INTERVAL", 86400))  # seconds
+    RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", 1000))
+    RECONCILE_PAUSE = float(os.getenv("RECONCILE_PAUSE", 0.1))  # seconds per batch
+    RECONCILE_AUTO_FIX = os.getenv("RECONCILE_AUTO_FIX", "false").lower() == "true"
+    # drift is only fixed when it reads the same again after this long
+    RECONCILE_CONFIRM_DELAY = float(os.getenv("RECONCILE_CONFIRM_DELAY", 2))  # seconds
+
+    # Transfers, copies not scanned in on arrival are completed after this long
+    TRANSFER_COMPLETION_INTERVAL = int(os.getenv("TRANSFER_COMPLETION_INTERVAL", 900))
+    TRANSFER_AUTO_COMPLETE_HOURS = int(os.getenv("TRANSFER_AUTO_COMPLETE_HOURS", 24))
+    TRANSFER_BATCH_SIZE = int(os.getenv("TRANSFER_BATCH_SIZE", 500))
+    MANIFEST_MAX_SIZE = int(os.getenv("MANIFEST_MAX_SIZE", 2000))  # items per crate
+
+    # Reservations, a returned copy is held for the next member this many days
+    RESERVATION_HOLD_DAYS = int(os.getenv("RESERVATION_HOLD_DAYS", 3))
+    RESERVATION_EXPIRY_INTERVAL = int(os.getenv("RESERVATION_EXPIRY_INTERVAL", 3600))
+
+    # Notifications are queued in an outbox and delivered in batches by a job
+    NOTIFICATION_INTERVAL = int(os.getenv("NOTIFICATION_INTERVAL", 30))  # seconds
+    NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", 500))
+    NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", 5))
+    NOTIFICATION_RETRY_DELAY = int(os.getenv("NOTIFICATION_RETRY_DELAY", 60))  # seconds
+    NOTIFICATION_CHANNELS = os.getenv(
+        "NOTIFICATION_CHANNELS", "in_app"
+    )  # or "in_app,email"
+
+    # Outgoing mail, defaults to a local SMTP sink such as MailHog
+    MAIL_SERVER = os.getenv("MAIL_SERVER", "localhost")
+    MAIL_PORT = int(os.getenv("MAIL_PORT", 1025))
+    MAIL_SENDER = os.getenv("MAIL_SENDER", "library@localhost")
+
+    # Query profiling, per-request X-DB-Queries header and slow-query log
+    DB_PROFILER_ENABLED = os.getenv("DB_PROFILER_ENABLED", "true").lower() == "true"
+    DB_TOOLBAR = os.getenv("DB_TOOLBAR", "false").lower() == "true"  # dev only
+    SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+    SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG")  # file path, stderr when unset
+
+    # Prometheus /metrics, run under gunicorn.conf.py to aggregate across workers
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
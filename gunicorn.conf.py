@@ -0,0 +1,23 @@
+import os
+import shutil
+
+# gunicorn --config gunicorn.conf.py run:app
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", 4))
+
+# Workers share their Prometheus samples through this directory, it has to be
+# set before any worker imports prometheus_client and emptied on every start.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/lms-prometheus")
+
+
+def on_starting(server):
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,12 @@
+import os
+
+# This process drives the scheduler loop itself, don't start the background thread too
+os.environ["SCHEDULER_ENABLED"] = "false"
+
+from app import create_app
+from app.utils.scheduler import run_scheduler
+
+app = create_app()
+
+if __name__ == "__main__":
+    run_scheduler(app)